@@ -1,6 +1,7 @@
 """
 Main FastAPI application
 """
+import asyncio
 import os
 import django
 
@@ -17,11 +18,17 @@ from django.conf import settings as django_settings
 from django.contrib.staticfiles.handlers import StaticFilesHandler
 
 from config import settings
-from models import engine
+from models import SessionLocal, engine
+from services.answer_cache import answer_cache
+from services.archive_import import expire_stale_imports
+from services.extraction_pool import extraction_pool
+from services.generation_scheduler import generation_scheduler
+from services.ingestion_worker import IngestionWorkerPool
+from services.write_behind import WriteBehindError, write_behind
 from utils.logger import log
 
 # Import routers
-from routes import auth, documents, rag, obe, qp, users, advisor_mapping, course_materials
+from routes import auth, documents, rag, obe, qp, users, advisor_mapping, course_materials, ingestion
 
 
 def check_sqlalchemy_connection() -> None:
@@ -77,11 +84,38 @@ async def lifespan(app: FastAPI):
             log.info("psycopg2 not installed; skipped raw SQL connection check")
     except Exception as e:
         log.error("Error initializing database: {}", e)
+
+    # Archive imports interrupted by a restart would otherwise stay running forever
+    try:
+        with SessionLocal() as db:
+            expire_stale_imports(db)
+    except Exception as e:
+        log.error("Error expiring interrupted archive imports: {}", e)
+
+    write_behind.start()
+    # Drop cached answers for uploads re-indexed by any worker process
+    answer_cache_sync = asyncio.create_task(answer_cache.run_sync())
+
+    # Dedicated workers (python -m services.ingestion_worker) can take over
+    # by setting INGESTION_EMBEDDED_WORKERS=0
+    ingestion_pool = None
+    if settings.INGESTION_EMBEDDED_WORKERS > 0:
+        ingestion_pool = IngestionWorkerPool(concurrency=settings.INGESTION_EMBEDDED_WORKERS, name="api")
+        ingestion_pool.start()
+        log.info("Started {} embedded ingestion workers", ingestion_pool.concurrency)
     
     yield
     
     # Shutdown
     log.info("Shutting down Academic RAG Assistant API")
+    await asyncio.to_thread(generation_scheduler.shutdown)
+    # Flush buffered query/chat rows before the process exits
+    await write_behind.stop()
+    log.info("Write-behind queue flushed: {}", write_behind.stats())
+    answer_cache_sync.cancel()
+    if ingestion_pool is not None:
+        await asyncio.to_thread(ingestion_pool.stop)
+    extraction_pool.close()
 
 # Create FastAPI app
 app = FastAPI(
@@ -102,6 +136,25 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Archive imports carry many files in one upload and have their own limit
+ARCHIVE_IMPORT_PATH = "/api/course-materials/import"
+
+# Reject uploads that declare a body larger than the upload limit before
+# the multipart parser spools any of it; the route still enforces the limit
+# on the bytes actually received.
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    content_type = request.headers.get("content-type", "")
+    content_length = request.headers.get("content-length")
+    if content_type.startswith("multipart/form-data") and content_length and content_length.isdigit():
+        limit = settings.ARCHIVE_MAX_UPLOAD_SIZE if request.url.path == ARCHIVE_IMPORT_PATH else settings.MAX_UPLOAD_SIZE
+        if int(content_length) > limit + settings.UPLOAD_FORM_OVERHEAD:
+            return JSONResponse(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                content={"detail": f"File too large. Max size: {limit / 1024 / 1024}MB"}
+            )
+    return await call_next(request)
+
 # Request logging middleware
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
@@ -147,6 +200,19 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
         }
     )
 
+@app.exception_handler(WriteBehindError)
+async def write_behind_exception_handler(request: Request, exc: WriteBehindError):
+    """
+    Handle history rows that could not be saved before a read
+    """
+    log.error("Write-behind barrier failed on {}: {}", request.url.path, exc)
+    
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={"Retry-After": str(settings.LOAD_SHED_RETRY_AFTER_SECONDS)},
+        content={"detail": "Recent history could not be saved yet; please retry"}
+    )
+
 @app.exception_handler(Exception)
 async def general_exception_handler(request: Request, exc: Exception):
     """
@@ -234,6 +300,7 @@ app.include_router(qp.router)
 app.include_router(users.router)
 app.include_router(advisor_mapping.router)
 app.include_router(course_materials.router)
+app.include_router(ingestion.router)
 
 # Mount Django after FastAPI routes so /api endpoints keep priority, while Django handles /admin and /static.
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "django_portal.settings")
@@ -41,6 +41,7 @@ class Settings(BaseSettings):
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
     OPENAI_MODEL: str = os.getenv("OPENAI_MODEL", "gpt-4-turbo-preview")
     EMBEDDING_MODEL: str = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+    EMBEDDING_BATCH_SIZE: int = int(os.getenv("EMBEDDING_BATCH_SIZE", "128"))
     # Perplexity (used for generation)
     PERPLEXITY_API_KEY: str = os.getenv("PERPLEXITY_API_KEY", "")
     PERPLEXITY_MODEL: str = os.getenv("PERPLEXITY_MODEL", "sonar")
@@ -54,8 +55,39 @@ class Settings(BaseSettings):
     OPENROUTER_API_KEY: str = os.getenv("OPENROUTER_API_KEY", "")
     OPENROUTER_MODEL: str = os.getenv("OPENROUTER_MODEL", "nvidia/nemotron-3-super-120b-a12b:free")
 
+    # Client disconnect detection (seconds between checks while waiting on upstream work)
+    DISCONNECT_POLL_SECONDS: float = float(os.getenv("DISCONNECT_POLL_SECONDS", "0.5"))
+
+    # Adaptive load shedding (four ascending thresholds each: smaller top-k, no web fallback, capped tokens, 503)
+    LOAD_SHED_INFLIGHT_THRESHOLDS: str = os.getenv("LOAD_SHED_INFLIGHT_THRESHOLDS", "16,32,48,64")
+    LOAD_SHED_LATENCY_THRESHOLDS_MS: str = os.getenv("LOAD_SHED_LATENCY_THRESHOLDS_MS", "10000,20000,30000,45000")
+    LOAD_SHED_LATENCY_WINDOW: int = int(os.getenv("LOAD_SHED_LATENCY_WINDOW", "100"))
+    LOAD_SHED_LATENCY_HORIZON_SECONDS: int = int(os.getenv("LOAD_SHED_LATENCY_HORIZON_SECONDS", "120"))
+    LOAD_SHED_DEGRADED_MAX_TOKENS: int = int(os.getenv("LOAD_SHED_DEGRADED_MAX_TOKENS", "512"))
+    LOAD_SHED_RETRY_AFTER_SECONDS: int = int(os.getenv("LOAD_SHED_RETRY_AFTER_SECONDS", "15"))
+
+    # Generation scheduling (shared LLM concurrency, staff vs student weighted fair share)
+    GENERATION_MAX_CONCURRENCY: int = int(os.getenv("GENERATION_MAX_CONCURRENCY", "8"))
+    GENERATION_STAFF_WEIGHT: float = float(os.getenv("GENERATION_STAFF_WEIGHT", "4"))
+    GENERATION_STUDENT_WEIGHT: float = float(os.getenv("GENERATION_STUDENT_WEIGHT", "1"))
+    GENERATION_STARVATION_SECONDS: float = float(os.getenv("GENERATION_STARVATION_SECONDS", "20"))
+    GENERATION_QUEUE_TIMEOUT_SECONDS: float = float(os.getenv("GENERATION_QUEUE_TIMEOUT_SECONDS", "60"))
+    GENERATION_EXECUTOR_THREADS: int = int(os.getenv("GENERATION_EXECUTOR_THREADS", "32"))
+
+    # Web search fallback
+    WEB_SEARCH_DEADLINE_SECONDS: float = float(os.getenv("WEB_SEARCH_DEADLINE_SECONDS", "4"))
+    WEB_SEARCH_CACHE_TTL_SECONDS: int = int(os.getenv("WEB_SEARCH_CACHE_TTL_SECONDS", "900"))
+    WEB_SEARCH_CACHE_MAX_ENTRIES: int = int(os.getenv("WEB_SEARCH_CACHE_MAX_ENTRIES", "500"))
+
     # Token limits
     DEFAULT_DAILY_TOKEN_LIMIT: int = int(os.getenv("DEFAULT_DAILY_TOKEN_LIMIT", "20000"))
+    TOKEN_LEDGER_CACHE_TTL_SECONDS: int = int(os.getenv("TOKEN_LEDGER_CACHE_TTL_SECONDS", "30"))
+    TOKEN_LEDGER_CACHE_MAX_USERS: int = int(os.getenv("TOKEN_LEDGER_CACHE_MAX_USERS", "10000"))
+
+    # Chat history window
+    CHAT_PROMPT_TOKEN_BUDGET: int = int(os.getenv("CHAT_PROMPT_TOKEN_BUDGET", "6000"))
+    CHAT_HISTORY_KEEP_TURNS: int = int(os.getenv("CHAT_HISTORY_KEEP_TURNS", "6"))
+    CHAT_SUMMARY_MAX_TOKENS: int = int(os.getenv("CHAT_SUMMARY_MAX_TOKENS", "600"))
     
     # Vector Store
     FAISS_INDEX_PATH: str = os.getenv("FAISS_INDEX_PATH", "./vectorstore/faiss_index")
@@ -63,6 +95,16 @@ class Settings(BaseSettings):
     
     # File Upload
     MAX_UPLOAD_SIZE: int = int(os.getenv("MAX_UPLOAD_SIZE", "10485760"))  # 10MB
+    # Bytes read and written per step while streaming an upload to disk
+    UPLOAD_CHUNK_SIZE: int = int(os.getenv("UPLOAD_CHUNK_SIZE", "1048576"))
+    # Allowance for multipart framing and form fields on top of MAX_UPLOAD_SIZE
+    UPLOAD_FORM_OVERHEAD: int = int(os.getenv("UPLOAD_FORM_OVERHEAD", "65536"))
+    # Bulk archive imports of course materials (each member is also held to MAX_UPLOAD_SIZE)
+    ARCHIVE_MAX_UPLOAD_SIZE: int = int(os.getenv("ARCHIVE_MAX_UPLOAD_SIZE", "1073741824"))  # 1GB
+    ARCHIVE_MAX_EXTRACTED_SIZE: int = int(os.getenv("ARCHIVE_MAX_EXTRACTED_SIZE", "4294967296"))  # 4GB
+    ARCHIVE_MAX_MEMBERS: int = int(os.getenv("ARCHIVE_MAX_MEMBERS", "5000"))
+    # A running import whose unpacking process stops renewing this lease is failed
+    ARCHIVE_IMPORT_LEASE_SECONDS: int = int(os.getenv("ARCHIVE_IMPORT_LEASE_SECONDS", "120"))
     ALLOWED_EXTENSIONS_RAW: str = os.getenv(
         "ALLOWED_EXTENSIONS",
         "pdf,docx,doc,xlsx,xls,xl,csv,pptx,ppt,txt,png,jpg,jpeg,gif,webp,zip,rar,7z,mp4,mp3,wav",
@@ -74,7 +116,51 @@ class Settings(BaseSettings):
     CHUNK_OVERLAP: int = int(os.getenv("CHUNK_OVERLAP", "200"))
     TOP_K_RESULTS: int = int(os.getenv("TOP_K_RESULTS", "5"))
     TEMPERATURE: float = float(os.getenv("TEMPERATURE", "0.7"))
-    
+    RAG_CONTEXT_TOKEN_BUDGET: int = int(os.getenv("RAG_CONTEXT_TOKEN_BUDGET", "2500"))
+    TOKENIZER_ENCODING: str = os.getenv("TOKENIZER_ENCODING", "cl100k_base")
+    RAG_BATCH_CONCURRENCY: int = int(os.getenv("RAG_BATCH_CONCURRENCY", "4"))
+
+    # Answer cache
+    ANSWER_CACHE_ENABLED: bool = os.getenv("ANSWER_CACHE_ENABLED", "True").lower() == "true"
+    ANSWER_CACHE_TTL_SECONDS: int = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+    ANSWER_CACHE_SIMILARITY_THRESHOLD: float = float(os.getenv("ANSWER_CACHE_SIMILARITY_THRESHOLD", "0.95"))
+    ANSWER_CACHE_MAX_ENTRIES: int = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "2000"))
+    # Seconds between checks for uploads re-indexed by other processes (0 disables)
+    ANSWER_CACHE_SYNC_SECONDS: float = float(os.getenv("ANSWER_CACHE_SYNC_SECONDS", "5"))
+
+    # RAG conversation memory
+    RAG_MEMORY_MAX_SESSIONS: int = int(os.getenv("RAG_MEMORY_MAX_SESSIONS", "1000"))
+    RAG_MEMORY_IDLE_TTL_SECONDS: int = int(os.getenv("RAG_MEMORY_IDLE_TTL_SECONDS", "1800"))
+    RAG_MEMORY_MAX_MESSAGES: int = int(os.getenv("RAG_MEMORY_MAX_MESSAGES", "20"))
+
+    # Write-behind persistence
+    WRITE_BEHIND_FLUSH_MS: int = int(os.getenv("WRITE_BEHIND_FLUSH_MS", "250"))
+    WRITE_BEHIND_MAX_BATCH_ROWS: int = int(os.getenv("WRITE_BEHIND_MAX_BATCH_ROWS", "500"))
+
+    # Ingestion job queue
+    INGESTION_EMBEDDED_WORKERS: int = int(os.getenv("INGESTION_EMBEDDED_WORKERS", "1"))
+    INGESTION_WORKER_CONCURRENCY: int = int(os.getenv("INGESTION_WORKER_CONCURRENCY", "2"))
+    INGESTION_POLL_SECONDS: float = float(os.getenv("INGESTION_POLL_SECONDS", "2"))
+    INGESTION_LEASE_SECONDS: int = int(os.getenv("INGESTION_LEASE_SECONDS", "300"))
+    INGESTION_MAX_ATTEMPTS: int = int(os.getenv("INGESTION_MAX_ATTEMPTS", "3"))
+    INGESTION_RETRY_BACKOFF_SECONDS: int = int(os.getenv("INGESTION_RETRY_BACKOFF_SECONDS", "30"))
+    INGESTION_EMBED_CONCURRENCY: int = int(os.getenv("INGESTION_EMBED_CONCURRENCY", "4"))
+    INGESTION_PIPELINE_QUEUE_SIZE: int = int(os.getenv("INGESTION_PIPELINE_QUEUE_SIZE", "8"))
+
+    # Text extraction worker processes (0 extracts in-process)
+    EXTRACTION_PROCESSES: int = int(os.getenv("EXTRACTION_PROCESSES", str(min(4, os.cpu_count() or 1))))
+    EXTRACTION_PAGES_PER_SHARD: int = int(os.getenv("EXTRACTION_PAGES_PER_SHARD", "25"))
+    EXTRACTION_TIMEOUT_SECONDS: float = float(os.getenv("EXTRACTION_TIMEOUT_SECONDS", "300"))
+    EXTRACTION_MEMORY_LIMIT_MB: int = int(os.getenv("EXTRACTION_MEMORY_LIMIT_MB", "2048"))
+    EXTRACTION_MAX_TASKS_PER_CHILD: int = int(os.getenv("EXTRACTION_MAX_TASKS_PER_CHILD", "50"))
+    # Rows per extracted page for spreadsheets/CSV; characters per page for TXT
+    SPREADSHEET_ROWS_PER_PAGE: int = int(os.getenv("SPREADSHEET_ROWS_PER_PAGE", "500"))
+    TEXT_PAGE_CHARS: int = int(os.getenv("TEXT_PAGE_CHARS", "20000"))
+    # Extracted text cache, keyed by file content hash and loader version
+    EXTRACTION_CACHE_ENABLED: bool = os.getenv("EXTRACTION_CACHE_ENABLED", "True").lower() == "true"
+    EXTRACTION_CACHE_PATH: str = os.getenv("EXTRACTION_CACHE_PATH", "./extraction_cache")
+    EXTRACTION_CACHE_MAX_MB: int = int(os.getenv("EXTRACTION_CACHE_MAX_MB", "1024"))
+
     # OBE Configuration
     PASSING_THRESHOLD: int = int(os.getenv("PASSING_THRESHOLD", "40"))
     CO_ATTAINMENT_THRESHOLD: int = int(os.getenv("CO_ATTAINMENT_THRESHOLD", "50"))
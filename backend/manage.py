@@ -87,6 +87,118 @@ def adminportal() -> None:
     sys.exit(completed.returncode)
 
 
+def importmaterials() -> None:
+    """Import an archive of course materials and queue every file for indexing."""
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(
+        prog="python manage.py importmaterials",
+        description=(
+            "Import a zip/rar/7z archive laid out as "
+            "<COURSE CODE>[ - name]/[notes|pdf|question_papers/]...<file>."
+        ),
+    )
+    parser.add_argument("archive", help="Path to the archive")
+    parser.add_argument("--course", help="Import every file into this course code instead of mapping folders")
+    parser.add_argument("--create-courses", action="store_true", help="Create courses for unknown top-level folders")
+    parser.add_argument("--type", dest="material_type", default="notes", help="Material type for files outside a type folder")
+    parser.add_argument("--uploader", help="Email of the user recorded as uploader")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="Index in this process with N parallel ingestion workers and wait for them to finish",
+    )
+    args = parser.parse_args(sys.argv[2:])
+
+    from models import SessionLocal
+    from models.course_material import Course, MaterialType
+    from models.material_import import MaterialImport, MaterialImportStatus
+    from models.user import User
+    from services.archive_import import ArchiveImporter, run_import, with_indexing_status
+
+    if not os.path.isfile(args.archive):
+        print(f"Archive not found: {args.archive}")
+        sys.exit(1)
+    try:
+        material_type = MaterialType(args.material_type.lower())
+    except ValueError:
+        print(f"Unknown material type: {args.material_type}. Use one of: {', '.join(t.value for t in MaterialType)}")
+        sys.exit(1)
+
+    db = SessionLocal()
+    try:
+        course = None
+        if args.course:
+            course = db.query(Course).filter(Course.code == args.course.strip().upper()).first()
+            if course is None:
+                print(f"Course not found: {args.course}")
+                sys.exit(1)
+        uploader = None
+        if args.uploader:
+            uploader = db.query(User).filter(User.email == args.uploader).first()
+            if uploader is None:
+                print(f"User not found: {args.uploader}")
+                sys.exit(1)
+
+        material_import = MaterialImport(
+            archive_name=os.path.basename(args.archive),
+            course_id=course.id if course else None,
+            uploaded_by=uploader.id if uploader else None,
+        )
+        db.add(material_import)
+        db.commit()
+        db.refresh(material_import)
+
+        importer = ArchiveImporter(
+            db,
+            uploaded_by=material_import.uploaded_by,
+            course=course,
+            create_courses=args.create_courses,
+            default_material_type=material_type,
+        )
+        material_import = run_import(db, material_import, args.archive, importer)
+        if material_import.status == MaterialImportStatus.FAILED:
+            print(f"Import failed: {material_import.error}")
+            sys.exit(1)
+
+        report = with_indexing_status(db, material_import)
+        if args.workers > 0:
+            from services.extraction_pool import extraction_pool
+            from services.ingestion_worker import IngestionWorkerPool
+
+            pool = IngestionWorkerPool(concurrency=args.workers, name="import")
+            pool.start()
+            try:
+                while True:
+                    db.expire_all()
+                    report = with_indexing_status(db, material_import)
+                    print(f"Indexing: {report.get('indexing', {})}")
+                    if not any(
+                        entry.get("indexing_status") in ("queued", "running") for entry in report["files"]
+                    ):
+                        break
+                    time.sleep(2)
+            finally:
+                pool.stop()
+                extraction_pool.close()
+    finally:
+        db.close()
+
+    for entry in report["files"]:
+        indexing = entry.get("indexing_status", "")
+        detail = entry.get("reason") or entry.get("indexing_error") or entry.get("course_code", "")
+        print(f"{entry['status']:<10} {indexing:<10} {entry['path']}  {detail or ''}")
+    print(f"Import {report['id']}: {report['counts']}")
+    if args.workers <= 0:
+        print("Files are indexed by the running ingestion workers; track them with")
+        print(f"  GET /api/course-materials/imports/{report['id']}")
+
+    failed = report["counts"].get("failed", 0) + report.get("indexing", {}).get("failed", 0)
+    sys.exit(1 if failed else 0)
+
+
 def main() -> None:
     """Support Django-like backend commands."""
     if len(sys.argv) < 2:
@@ -95,6 +207,7 @@ def main() -> None:
         print("  python manage.py migrate")
         print("  python manage.py createsuperuser")
         print("  python manage.py adminportal [django-command]")
+        print("  python manage.py importmaterials <archive> [--course CODE] [--create-courses] [--workers N]")
         sys.exit(1)
 
     command = sys.argv[1].lower()
@@ -110,9 +223,12 @@ def main() -> None:
     if command == "adminportal":
         adminportal()
         return
+    if command == "importmaterials":
+        importmaterials()
+        return
 
     print(f"Unknown command: {command}")
-    print("Available commands: runserver, migrate, createsuperuser, adminportal")
+    print("Available commands: runserver, migrate, createsuperuser, adminportal, importmaterials")
     sys.exit(1)
 
 
@@ -0,0 +1,23 @@
+-- =====================================================
+-- Migration: 008_create_chat_session_summaries.sql
+-- Purpose: Store rolling summaries of chat turns folded
+--          out of the replayed conversation window.
+-- =====================================================
+
+CREATE EXTENSION IF NOT EXISTS "pgcrypto";
+
+CREATE TABLE IF NOT EXISTS public.chat_session_summaries (
+    id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+    user_id uuid NOT NULL REFERENCES public.users(id) ON DELETE CASCADE,
+    session_id varchar NOT NULL,
+    summary text NOT NULL DEFAULT '',
+    folded_messages integer NOT NULL DEFAULT 0,
+    updated_at timestamptz NOT NULL DEFAULT now(),
+    CONSTRAINT uq_chat_session_summaries_user_session UNIQUE (user_id, session_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_chat_session_summaries_user_id
+    ON public.chat_session_summaries(user_id);
+
+CREATE INDEX IF NOT EXISTS idx_chat_session_summaries_session_id
+    ON public.chat_session_summaries(session_id);
@@ -0,0 +1,13 @@
+-- =====================================================
+-- Migration: 009_create_context_chunks.sql
+-- Purpose: Store retrieved context chunks once, addressed
+--          by content hash; queries.context_chunks keeps
+--          only (hash, score, chunk_ids) references.
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS public.context_chunks (
+    content_hash varchar(64) PRIMARY KEY,
+    content text NOT NULL,
+    metadata jsonb,
+    created_at timestamptz NOT NULL DEFAULT now()
+);
@@ -0,0 +1,8 @@
+-- =====================================================
+-- Migration: 010_add_chat_history_status.sql
+-- Purpose: Mark chat turns aborted by a client disconnect
+--          so they are kept for audit but never replayed.
+-- =====================================================
+
+ALTER TABLE IF EXISTS public.chat_history
+    ADD COLUMN IF NOT EXISTS status varchar(9) NOT NULL DEFAULT 'completed';
@@ -0,0 +1,29 @@
+-- =====================================================
+-- Migration: 011_create_ingestion_jobs.sql
+-- Purpose: Durable queue for document / course-material
+--          indexing, claimed by ingestion workers under a
+--          lease with retries and stage-level progress.
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS public.ingestion_jobs (
+    id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+    source_type varchar(15) NOT NULL,
+    source_id varchar NOT NULL,
+    status varchar(9) NOT NULL DEFAULT 'queued',
+    stage varchar(7),
+    progress jsonb,
+    attempts integer NOT NULL DEFAULT 0,
+    max_attempts integer NOT NULL DEFAULT 3,
+    available_at timestamp NOT NULL DEFAULT now(),
+    lease_owner varchar,
+    lease_expires_at timestamp,
+    last_error text,
+    created_at timestamp NOT NULL DEFAULT now(),
+    started_at timestamp,
+    finished_at timestamp,
+    updated_at timestamp NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS ix_ingestion_jobs_id ON public.ingestion_jobs (id);
+CREATE INDEX IF NOT EXISTS ix_ingestion_jobs_claim ON public.ingestion_jobs (status, available_at);
+CREATE INDEX IF NOT EXISTS ix_ingestion_jobs_source ON public.ingestion_jobs (source_type, source_id);
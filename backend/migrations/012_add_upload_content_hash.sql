@@ -0,0 +1,25 @@
+-- =====================================================
+-- Migration: 012_add_upload_content_hash.sql
+-- Purpose: Deduplicate uploads by sha256. The first live
+--          upload of some content is canonical; later
+--          identical uploads point at it via duplicate_of_id
+--          and reuse its stored file and chunk set.
+-- =====================================================
+
+ALTER TABLE IF EXISTS public.documents
+    ADD COLUMN IF NOT EXISTS content_hash varchar(64),
+    ADD COLUMN IF NOT EXISTS duplicate_of_id uuid REFERENCES public.documents(id) ON DELETE SET NULL;
+
+CREATE INDEX IF NOT EXISTS ix_documents_content_hash ON public.documents (content_hash);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_documents_content_hash
+    ON public.documents (content_hash)
+    WHERE duplicate_of_id IS NULL AND is_deleted = false;
+
+ALTER TABLE IF EXISTS public.course_materials
+    ADD COLUMN IF NOT EXISTS content_hash varchar(64),
+    ADD COLUMN IF NOT EXISTS duplicate_of_id uuid REFERENCES public.course_materials(id) ON DELETE SET NULL;
+
+CREATE INDEX IF NOT EXISTS ix_course_materials_content_hash ON public.course_materials (content_hash);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_course_materials_content_hash
+    ON public.course_materials (content_hash)
+    WHERE duplicate_of_id IS NULL AND is_deleted = false;
@@ -0,0 +1,21 @@
+-- =====================================================
+-- Migration: 013_create_material_imports.sql
+-- Purpose: Record bulk archive imports of course
+--          materials with a per-file outcome (queued,
+--          duplicate, skipped, rejected, failed).
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS public.material_imports (
+    id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+    archive_name varchar NOT NULL,
+    status varchar(9) NOT NULL DEFAULT 'running',
+    course_id uuid REFERENCES public.courses(id) ON DELETE SET NULL,
+    uploaded_by uuid REFERENCES public.users(id) ON DELETE SET NULL,
+    member_count integer NOT NULL DEFAULT 0,
+    files jsonb,
+    error text,
+    created_at timestamp NOT NULL DEFAULT now(),
+    finished_at timestamp
+);
+
+CREATE INDEX IF NOT EXISTS ix_material_imports_id ON public.material_imports (id);
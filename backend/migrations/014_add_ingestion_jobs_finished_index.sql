@@ -0,0 +1,8 @@
+-- =====================================================
+-- Migration: 014_add_ingestion_jobs_finished_index.sql
+-- Purpose: Let API processes find recently finished
+--          ingestion jobs cheaply, to drop cached answers
+--          built on the re-indexed uploads.
+-- =====================================================
+
+CREATE INDEX IF NOT EXISTS ix_ingestion_jobs_finished ON public.ingestion_jobs (status, finished_at);
@@ -0,0 +1,23 @@
+-- =====================================================
+-- Migration: 015_add_chat_summary_fold_position.sql
+-- Purpose: Track the last message folded into a chat
+--          session summary (timestamp, id) instead of a
+--          message offset, which shifts when messages are
+--          deleted or inserted out of order.
+-- =====================================================
+
+ALTER TABLE IF EXISTS public.chat_session_summaries
+    ADD COLUMN IF NOT EXISTS folded_through_at timestamp,
+    ADD COLUMN IF NOT EXISTS folded_through_id uuid;
+
+-- Existing summaries: the message at the old offset is the last one folded.
+UPDATE public.chat_session_summaries AS s
+SET (folded_through_at, folded_through_id) = (
+    SELECT h.timestamp, h.id
+    FROM public.chat_history AS h
+    WHERE h.user_id = s.user_id AND h.session_id = s.session_id
+    ORDER BY h.timestamp, h.id
+    OFFSET s.folded_messages - 1
+    LIMIT 1
+)
+WHERE s.folded_messages > 0 AND s.folded_through_at IS NULL;
@@ -0,0 +1,11 @@
+-- =====================================================
+-- Migration: 016_add_material_import_lease.sql
+-- Purpose: Let a running archive import hold a lease
+--          that the unpacking process renews, so imports
+--          whose process died are failed (and their
+--          archive removed) instead of running forever.
+-- =====================================================
+
+ALTER TABLE IF EXISTS public.material_imports
+    ADD COLUMN IF NOT EXISTS archive_path varchar,
+    ADD COLUMN IF NOT EXISTS lease_expires_at timestamp;
@@ -41,10 +41,12 @@ from .question_analysis import QuestionAnalysis  # noqa: E402, F401
 from .user import Profile, User  # noqa: E402, F401
 from .role import Role, RolePermission, UserRole  # noqa: E402, F401
 from .document import Document  # noqa: E402, F401
-from .query import Query  # noqa: E402, F401
+from .query import ContextChunk, Query  # noqa: E402, F401
 from .mark import AssessmentType, Mark  # noqa: E402, F401
 from .note import Note  # noqa: E402, F401
-from .chat import ChatHistory, MessageRole  # noqa: E402, F401
+from .chat import ChatHistory, ChatSessionSummary, MessageRole, MessageStatus  # noqa: E402, F401
 from .token_limit import UserDailyTokenUsage, UserTokenLimit  # noqa: E402, F401
 from .advisor_mapping import AdvisorStudentMapping  # noqa: E402, F401
 from .course_material import Course, CourseMaterial, MaterialType  # noqa: E402, F401
+from .ingestion_job import IngestionJob, IngestionJobStatus, IngestionSource, IngestionStage  # noqa: E402, F401
+from .material_import import MaterialImport, MaterialImportStatus  # noqa: E402, F401
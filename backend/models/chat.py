@@ -2,7 +2,7 @@
 from datetime import datetime
 import enum
 
-from sqlalchemy import JSON, Column, DateTime, Enum as SQLEnum, ForeignKey, String, Text, text
+from sqlalchemy import JSON, Column, DateTime, Enum as SQLEnum, ForeignKey, Integer, String, Text, UniqueConstraint, text
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 
@@ -16,6 +16,13 @@ class MessageRole(str, enum.Enum):
     ASSISTANT = "assistant"
 
 
+class MessageStatus(str, enum.Enum):
+    """Whether a message belongs to a completed or an aborted turn."""
+
+    COMPLETED = "completed"
+    ABORTED = "aborted"
+
+
 class ChatHistory(Base):
     """Chat message persisted per user session."""
 
@@ -40,9 +47,47 @@ class ChatHistory(Base):
     )
     message_content = Column(Text, nullable=False)
     reasoning_details = Column(JSON, nullable=True)
+    status = Column(
+        SQLEnum(
+            MessageStatus,
+            values_callable=lambda enum_cls: [member.value for member in enum_cls],
+            native_enum=False,
+        ),
+        nullable=False,
+        default=MessageStatus.COMPLETED,
+        server_default=MessageStatus.COMPLETED.value,
+    )
     timestamp = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
 
     user = relationship("User", back_populates="chat_messages")
 
     def __repr__(self):
         return f"<ChatHistory(id={self.id}, user_id={self.user_id}, session_id={self.session_id})>"
+
+
+class ChatSessionSummary(Base):
+    """Rolling summary of chat turns folded out of a session's replay window."""
+
+    __tablename__ = "chat_session_summaries"
+    __table_args__ = (
+        UniqueConstraint("user_id", "session_id", name="uq_chat_session_summaries_user_session"),
+    )
+
+    id = Column(
+        UUID(as_uuid=True),
+        primary_key=True,
+        index=True,
+        server_default=text("gen_random_uuid()"),
+        nullable=False,
+    )
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    session_id = Column(String, nullable=False, index=True)
+    summary = Column(Text, nullable=False, default="")
+    folded_messages = Column(Integer, nullable=False, default=0)
+    # Last message folded into the summary; later messages are replayed
+    folded_through_at = Column(DateTime, nullable=True)
+    folded_through_id = Column(UUID(as_uuid=True), nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f"<ChatSessionSummary(user_id={self.user_id}, session_id={self.session_id}, folded={self.folded_messages})>"
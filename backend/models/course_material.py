@@ -2,7 +2,7 @@
 import enum
 from datetime import datetime
 
-from sqlalchemy import Boolean, Column, DateTime, Enum as SQLEnum, ForeignKey, Integer, String, text
+from sqlalchemy import Boolean, Column, DateTime, Enum as SQLEnum, ForeignKey, Index, Integer, String, text
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 
@@ -46,6 +46,14 @@ class CourseMaterial(Base):
     """Uploaded course material (pdf, notes, question paper)."""
 
     __tablename__ = "course_materials"
+    __table_args__ = (
+        Index(
+            "uq_course_materials_content_hash",
+            "content_hash",
+            unique=True,
+            postgresql_where=text("duplicate_of_id IS NULL AND is_deleted = false"),
+        ),
+    )
 
     id = Column(
         UUID(as_uuid=True),
@@ -59,6 +67,10 @@ class CourseMaterial(Base):
     material_type = Column(SQLEnum(MaterialType), nullable=False, index=True)
     file_path = Column(String, nullable=False)
     file_size = Column(Integer, nullable=True)
+    # sha256 of the file; unique among canonical (non-duplicate, live) rows
+    content_hash = Column(String(64), nullable=True, index=True)
+    # Earlier upload of identical content whose stored file and chunks this row reuses
+    duplicate_of_id = Column(UUID(as_uuid=True), ForeignKey("course_materials.id", ondelete="SET NULL"), nullable=True)
     uploaded_by = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
     uploaded_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     is_deleted = Column(Boolean, default=False, nullable=False)
@@ -2,7 +2,7 @@
 import enum
 from datetime import datetime
 
-from sqlalchemy import Boolean, Column, DateTime, Enum as SQLEnum, ForeignKey, Integer, String, Text, text
+from sqlalchemy import Boolean, Column, DateTime, Enum as SQLEnum, ForeignKey, Index, Integer, String, Text, text
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 
@@ -35,6 +35,14 @@ class Document(Base):
     """Document model."""
 
     __tablename__ = "documents"
+    __table_args__ = (
+        Index(
+            "uq_documents_content_hash",
+            "content_hash",
+            unique=True,
+            postgresql_where=text("duplicate_of_id IS NULL AND is_deleted = false"),
+        ),
+    )
 
     id = Column(
         UUID(as_uuid=True),
@@ -49,6 +57,10 @@ class Document(Base):
     file_path = Column(String, nullable=False)
     file_url = Column(String, nullable=True)
     file_size = Column(Integer, nullable=True)
+    # sha256 of the file; unique among canonical (non-duplicate, live) rows
+    content_hash = Column(String(64), nullable=True, index=True)
+    # Earlier upload of identical content whose stored file and chunks this row reuses
+    duplicate_of_id = Column(UUID(as_uuid=True), ForeignKey("documents.id", ondelete="SET NULL"), nullable=True)
     uploader_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
     uploaded_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     indexing_status = Column(SQLEnum(IndexingStatus), default=IndexingStatus.PENDING, nullable=False)
@@ -74,6 +86,8 @@ class Document(Base):
             "file_path": self.file_path,
             "file_url": self.file_url,
             "file_size": self.file_size,
+            "content_hash": self.content_hash,
+            "duplicate_of_id": str(self.duplicate_of_id) if self.duplicate_of_id else None,
             "uploader_id": str(self.uploader_id),
             "uploaded_at": self.uploaded_at.isoformat() if self.uploaded_at else None,
             "indexing_status": self.indexing_status.value if self.indexing_status else None,
@@ -0,0 +1,100 @@
+"""Ingestion job model for the durable document indexing queue."""
+import enum
+from datetime import datetime
+
+from sqlalchemy import JSON, Column, DateTime, Enum as SQLEnum, Index, Integer, String, Text, text
+from sqlalchemy.dialects.postgresql import UUID
+
+from models import Base
+
+
+class IngestionSource(str, enum.Enum):
+    """Kinds of uploads an ingestion job can index."""
+
+    DOCUMENT = "document"
+    COURSE_MATERIAL = "course_material"
+
+
+class IngestionJobStatus(str, enum.Enum):
+    """Lifecycle of an ingestion job."""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+class IngestionStage(str, enum.Enum):
+    """Pipeline stage an ingestion job last entered."""
+
+    EXTRACT = "extract"
+    CHUNK = "chunk"
+    EMBED = "embed"
+    PERSIST = "persist"
+    DONE = "done"
+
+
+def _string_enum(enum_cls):
+    return SQLEnum(
+        enum_cls,
+        values_callable=lambda members: [member.value for member in members],
+        native_enum=False,
+    )
+
+
+class IngestionJob(Base):
+    """Persistent unit of indexing work claimed by ingestion workers under a lease."""
+
+    __tablename__ = "ingestion_jobs"
+    __table_args__ = (
+        Index("ix_ingestion_jobs_claim", "status", "available_at"),
+        Index("ix_ingestion_jobs_source", "source_type", "source_id"),
+        Index("ix_ingestion_jobs_finished", "status", "finished_at"),
+    )
+
+    id = Column(
+        UUID(as_uuid=True),
+        primary_key=True,
+        index=True,
+        server_default=text("gen_random_uuid()"),
+        nullable=False,
+    )
+    source_type = Column(_string_enum(IngestionSource), nullable=False)
+    source_id = Column(String, nullable=False)
+    status = Column(_string_enum(IngestionJobStatus), nullable=False, default=IngestionJobStatus.QUEUED)
+    stage = Column(_string_enum(IngestionStage), nullable=True)
+    progress = Column(JSON, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    # Hidden from workers until this time (retry backoff)
+    available_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    lease_owner = Column(String, nullable=True)
+    # A running job whose lease lapsed is visible to other workers again
+    lease_expires_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f"<IngestionJob(id={self.id}, source={self.source_type}:{self.source_id}, status={self.status})>"
+
+    def to_dict(self):
+        """Convert job to dictionary."""
+        return {
+            "id": str(self.id),
+            "source_type": self.source_type.value if self.source_type else None,
+            "source_id": self.source_id,
+            "status": self.status.value if self.status else None,
+            "stage": self.stage.value if self.stage else None,
+            "progress": self.progress or {},
+            "attempts": self.attempts,
+            "max_attempts": self.max_attempts,
+            "available_at": self.available_at.isoformat() if self.available_at else None,
+            "lease_expires_at": self.lease_expires_at.isoformat() if self.lease_expires_at else None,
+            "last_error": self.last_error,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
@@ -0,0 +1,76 @@
+"""Archive import model recording bulk course-material uploads and their per-file outcome."""
+import enum
+from datetime import datetime
+
+from sqlalchemy import JSON, Column, DateTime, Enum as SQLEnum, ForeignKey, Integer, String, Text, text
+from sqlalchemy.dialects.postgresql import UUID
+
+from models import Base
+
+
+class MaterialImportStatus(str, enum.Enum):
+    """Lifecycle of an archive import (unpacking only; indexing is tracked per file)."""
+
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+class MaterialImport(Base):
+    """One archive of course materials unpacked into individual materials."""
+
+    __tablename__ = "material_imports"
+
+    id = Column(
+        UUID(as_uuid=True),
+        primary_key=True,
+        index=True,
+        server_default=text("gen_random_uuid()"),
+        nullable=False,
+    )
+    archive_name = Column(String, nullable=False)
+    status = Column(
+        SQLEnum(
+            MaterialImportStatus,
+            values_callable=lambda members: [member.value for member in members],
+            native_enum=False,
+        ),
+        nullable=False,
+        default=MaterialImportStatus.RUNNING,
+    )
+    # Course every member was imported into, when not mapped from folders
+    course_id = Column(UUID(as_uuid=True), ForeignKey("courses.id", ondelete="SET NULL"), nullable=True)
+    uploaded_by = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    member_count = Column(Integer, nullable=False, default=0)
+    # Per-file results: path, status, reason, course, material type, material and job ids
+    files = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    # Uploaded archive while it waits to be unpacked
+    archive_path = Column(String, nullable=True)
+    # Renewed by the process unpacking the archive; a running import past it was abandoned
+    lease_expires_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    finished_at = Column(DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<MaterialImport(id={self.id}, archive={self.archive_name}, status={self.status})>"
+
+    def to_dict(self):
+        """Convert import to dictionary."""
+        files = self.files or []
+        counts = {}
+        for entry in files:
+            counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+        return {
+            "id": str(self.id),
+            "archive_name": self.archive_name,
+            "status": self.status.value if self.status else None,
+            "course_id": str(self.course_id) if self.course_id else None,
+            "uploaded_by": str(self.uploaded_by) if self.uploaded_by else None,
+            "member_count": self.member_count,
+            "counts": counts,
+            "files": files,
+            "error": self.error,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
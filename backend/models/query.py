@@ -16,7 +16,7 @@ class Query(Base):
     subject = Column(String)
     document_type = Column(String)
     sources = Column(JSON)  # List of source documents
-    context_chunks = Column(JSON)  # Retrieved context chunks
+    context_chunks = Column(JSON)  # References (hash, score, chunk_ids) into context_chunks table
     tokens_used = Column(Integer)
     response_time = Column(Integer)  # in milliseconds
     timestamp = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
@@ -28,9 +28,9 @@ class Query(Base):
     def __repr__(self):
         return f"<Query(id={self.id}, user_id={self.user_id}, timestamp={self.timestamp})>"
     
-    def to_dict(self):
+    def to_dict(self, include_context: bool = True):
         """Convert query to dictionary"""
-        return {
+        data = {
             "id": self.id,
             "user_id": self.user_id,
             "query": self.query,
@@ -38,9 +38,24 @@ class Query(Base):
             "subject": self.subject,
             "document_type": self.document_type,
             "sources": self.sources,
-            "context_chunks": self.context_chunks,
             "tokens_used": self.tokens_used,
             "response_time": self.response_time,
             "timestamp": self.timestamp.isoformat() if self.timestamp else None,
             "session_id": self.session_id
         }
+        if include_context:
+            data["context_chunks"] = self.context_chunks
+        return data
+
+
+class ContextChunk(Base):
+    """Retrieved context chunk stored once and referenced by content hash"""
+    __tablename__ = "context_chunks"
+
+    content_hash = Column(String(64), primary_key=True)
+    content = Column(Text, nullable=False)
+    chunk_metadata = Column("metadata", JSON)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f"<ContextChunk(content_hash={self.content_hash})>"
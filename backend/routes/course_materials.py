@@ -1,22 +1,34 @@
 """Course and course-material routes for course-wise uploads."""
 import mimetypes
 import os
-import shutil
+import uuid
 from datetime import datetime
+from pathlib import Path
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, UploadFile, status
+from fastapi import APIRouter, BackgroundTasks, Depends, File, Form, HTTPException, Query, UploadFile, status
 from fastapi.responses import FileResponse
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
 from config import settings
-from models import get_db
+from models import SessionLocal, get_db
 from models.advisor_mapping import AdvisorStudentMapping
 from models.course_material import Course, CourseMaterial, MaterialType
+from models.ingestion_job import IngestionSource
+from models.material_import import MaterialImport, MaterialImportStatus
 from models.user import User
-from services.document_loader import DocumentLoader
-from services.embeddings import EmbeddingService
+from services.archive_import import (
+    ARCHIVE_EXTENSIONS,
+    ArchiveImporter,
+    ImportLease,
+    expire_stale_imports,
+    lease_deadline,
+    run_import,
+    with_indexing_status,
+)
+from services.ingestion_queue import ingestion_queue
+from services.upload_dedup import UploadTooLarge, commit_upload, store_upload, write_upload
 from utils.auth import (
     get_current_active_user,
     get_current_admin_user,
@@ -34,29 +46,6 @@ def _is_allowed_extension(filename: str) -> bool:
     return ext in settings.ALLOWED_EXTENSIONS
 
 
-def _index_course_material(material: CourseMaterial, course: Course):
-    """Index uploaded course material into vector store for chat RAG."""
-    loader = DocumentLoader()
-    pages = loader.load_document(material.file_path)
-
-    embedding_service = EmbeddingService()
-    embedding_service.index_document(
-        document_id=str(material.id),
-        pages=pages,
-        metadata={
-            "document_id": str(material.id),
-            "title": material.title,
-            "subject": course.code,
-            "document_type": material.material_type.value,
-            "uploader_id": str(material.uploaded_by) if material.uploaded_by else None,
-            "source_type": "course_material",
-            "course_id": str(course.id),
-            "course_code": course.code,
-            "course_name": course.name,
-        },
-    )
-
-
 def _get_student_advisor_ids(db: Session, student_id: UUID) -> list[UUID]:
     advisor_rows = (
         db.query(AdvisorStudentMapping.advisor_id)
@@ -174,13 +163,6 @@ async def upload_course_material(
         if course is None:
             raise HTTPException(status_code=404, detail="Course not found")
 
-        file.file.seek(0, 2)
-        file_size = file.file.tell()
-        file.file.seek(0)
-
-        if file_size > settings.MAX_UPLOAD_SIZE:
-            raise HTTPException(status_code=400, detail="File exceeds max upload size")
-
         material_dir = os.path.join(settings.UPLOAD_FOLDER, "course_materials", course.code)
         os.makedirs(material_dir, exist_ok=True)
 
@@ -189,27 +171,28 @@ async def upload_course_material(
         saved_name = f"{timestamp}_{safe_name}"
         file_path = os.path.join(material_dir, saved_name)
 
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        # Stream to disk with the size limit enforced as bytes arrive;
+        # identical content uploaded before (any course) reuses the stored file
+        try:
+            stored = await store_upload(db, CourseMaterial, file, file_path)
+        except UploadTooLarge:
+            raise HTTPException(status_code=400, detail="File exceeds max upload size")
 
         material = CourseMaterial(
             course_id=course.id,
             title=title.strip(),
             material_type=material_type_enum,
-            file_path=file_path,
-            file_size=file_size,
+            file_path=stored.file_path,
+            file_size=stored.file_size,
+            content_hash=stored.content_hash,
+            duplicate_of_id=stored.duplicate_of_id,
             uploaded_by=current_user.id,
         )
-        db.add(material)
-        db.commit()
-        db.refresh(material)
+        commit_upload(db, CourseMaterial, material)
 
-        indexing_warning = None
-        try:
-            _index_course_material(material, course)
-        except Exception as e:
-            # Keep upload successful for unsupported formats; chat retrieval may skip these.
-            indexing_warning = str(e)
+        # Indexing runs on the ingestion workers; unsupported formats fail
+        # there without affecting the upload.
+        job = ingestion_queue.enqueue(db, IngestionSource.COURSE_MATERIAL, material.id)
 
         return {
             "id": str(material.id),
@@ -220,7 +203,10 @@ async def upload_course_material(
             "file_name": os.path.basename(material.file_path) if material.file_path else None,
             "media_type": mimetypes.guess_type(material.file_path)[0] if material.file_path else None,
             "file_size": material.file_size,
-            "indexing_warning": indexing_warning,
+            "duplicate_of_id": str(material.duplicate_of_id) if material.duplicate_of_id else None,
+            "indexing_warning": None,
+            "ingestion_job_id": str(job.id),
+            "indexing_status": job.status.value,
         }
     except HTTPException:
         raise
@@ -231,6 +217,135 @@ async def upload_course_material(
         raise HTTPException(status_code=500, detail=f"Upload error: {str(e)}")
 
 
+def _import_archive(import_id: UUID, archive_path: str, course_id: UUID | None, create_courses: bool,
+                    default_material_type: MaterialType) -> None:
+    """Unpack an uploaded archive into its import record, then remove the archive."""
+    db = SessionLocal()
+    try:
+        material_import = db.query(MaterialImport).filter(MaterialImport.id == import_id).one()
+        try:
+            course = db.query(Course).filter(Course.id == course_id).first() if course_id else None
+            importer = ArchiveImporter(
+                db,
+                uploaded_by=material_import.uploaded_by,
+                course=course,
+                create_courses=create_courses,
+                default_material_type=default_material_type,
+            )
+            with ImportLease(import_id):
+                run_import(db, material_import, archive_path, importer)
+        except Exception as e:
+            # Nobody is waiting on the request; record the failure for pollers
+            print(f"Archive import {import_id} failed: {e}")
+            db.rollback()
+            material_import.status = MaterialImportStatus.FAILED
+            material_import.error = str(e) or e.__class__.__name__
+            material_import.finished_at = datetime.utcnow()
+            material_import.archive_path = None
+            material_import.lease_expires_at = None
+            db.commit()
+    finally:
+        db.close()
+        if os.path.exists(archive_path):
+            os.remove(archive_path)
+
+
+@router.post("/import", status_code=status.HTTP_202_ACCEPTED)
+async def import_course_materials(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    course_id: str | None = Form(None),
+    create_courses: bool = Form(False),
+    default_material_type: MaterialType = Form(MaterialType.notes),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_faculty_or_admin_user),
+):
+    """
+    Import a zip/rar/7z archive of course materials in one upload.
+
+    Folders map to courses and material types
+    (<COURSE CODE>[ - name]/[notes|pdf|question_papers/]...); pass course_id
+    to put every file in one course. The archive is unpacked in the
+    background: the response is the import record in the running state,
+    and GET /imports/{import_id} reports every file's outcome and indexing
+    status once it is done.
+    """
+    if not file.filename or Path(file.filename).suffix.lower() not in ARCHIVE_EXTENSIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid archive type. Allowed: {', '.join(sorted(ARCHIVE_EXTENSIONS))}",
+        )
+
+    target_course_id = None
+    if course_id:
+        try:
+            target_course_id = UUID(course_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid course id")
+        if db.query(Course).filter(Course.id == target_course_id).first() is None:
+            raise HTTPException(status_code=404, detail="Course not found")
+
+    import_dir = os.path.join(settings.UPLOAD_FOLDER, "imports")
+    os.makedirs(import_dir, exist_ok=True)
+    archive_path = os.path.join(import_dir, f"{uuid.uuid4().hex}{Path(file.filename).suffix.lower()}")
+    try:
+        await write_upload(file, archive_path, settings.ARCHIVE_MAX_UPLOAD_SIZE)
+    except UploadTooLarge:
+        raise HTTPException(status_code=400, detail="Archive exceeds max archive upload size")
+
+    try:
+        material_import = MaterialImport(
+            archive_name=file.filename,
+            course_id=target_course_id,
+            uploaded_by=current_user.id,
+            archive_path=archive_path,
+            lease_expires_at=lease_deadline(),
+        )
+        db.add(material_import)
+        db.commit()
+        db.refresh(material_import)
+    except Exception:
+        os.remove(archive_path)
+        raise
+
+    # Unpacking is blocking file and database work; it runs after the response
+    # on the threadpool under a lease and removes the archive when done. If
+    # this process dies first, expire_stale_imports() fails the import.
+    background_tasks.add_task(
+        _import_archive,
+        material_import.id,
+        archive_path,
+        target_course_id,
+        create_courses,
+        default_material_type,
+    )
+    return material_import.to_dict()
+
+
+@router.get("/imports/{import_id}")
+async def get_material_import(
+    import_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_faculty_or_admin_user),
+):
+    """Per-file outcome of an archive import, with each file's current indexing status."""
+    try:
+        target_id = UUID(import_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid import id")
+
+    # An import abandoned by a dead process reads as failed, not running forever
+    expire_stale_imports(db)
+    material_import = db.query(MaterialImport).filter(MaterialImport.id == target_id).first()
+    if material_import is None:
+        raise HTTPException(status_code=404, detail="Import not found")
+
+    current_roles, _ = get_user_roles_and_permissions(current_user)
+    if "admin" not in current_roles and material_import.uploaded_by != current_user.id:
+        raise HTTPException(status_code=403, detail="You can view only your own imports")
+    return with_indexing_status(db, material_import)
+
+
 @router.get("/")
 async def list_materials(
     course_id: str | None = None,
@@ -313,3 +428,21 @@ async def download_material(
         filename=download_name,
         headers={"Content-Disposition": f'{disposition}; filename="{download_name}"'},
     )
+
+
+@router.get("/{material_id}/ingestion")
+async def get_material_ingestion(
+    material_id: str,
+    db: Session = Depends(get_db),
+    _: User = Depends(get_current_faculty_or_admin_user),
+):
+    """Latest ingestion job for a material, with stage-level progress."""
+    try:
+        target_id = UUID(material_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid material id")
+
+    job = ingestion_queue.latest_for_source(db, IngestionSource.COURSE_MATERIAL, target_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="No ingestion job for this material")
+    return job.to_dict()
@@ -2,12 +2,11 @@
 Document routes for upload, processing, and management
 """
 import os
-import shutil
 from datetime import datetime
 from typing import Optional, List
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, BackgroundTasks, Query
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Query
 from fastapi.responses import FileResponse
 from sqlalchemy.orm import Session
 
@@ -16,8 +15,17 @@ from models.user import User
 from models.document import Document, DocumentType, IndexingStatus
 from utils.schemas import DocumentResponse, DocumentList
 from utils.auth import get_current_active_user, get_current_faculty_or_admin_user, is_faculty_or_admin
-from services.document_loader import DocumentLoader
-from services.embeddings import EmbeddingService
+from models.ingestion_job import IngestionSource
+from services.answer_cache import answer_cache
+from services.ingestion_queue import ingestion_queue
+from services.upload_dedup import (
+    UploadTooLarge,
+    backfill_content_hash,
+    commit_upload,
+    delete_upload,
+    replace_upload,
+    store_upload,
+)
 from config import settings
 
 router = APIRouter(prefix="/documents", tags=["Documents"])
@@ -27,57 +35,8 @@ def allowed_file(filename: str) -> bool:
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in settings.ALLOWED_EXTENSIONS
 
-async def process_document_async(document_id, file_path: str, db: Session):
-    """
-    Background task to process and index document
-    """
-    try:
-        # Update status to in_progress
-        document = db.query(Document).filter(Document.id == document_id).first()
-        if not document:
-            return
-        
-        document.indexing_status = IndexingStatus.IN_PROGRESS
-        db.commit()
-        
-        # Extract text from document
-        loader = DocumentLoader()
-        pages = loader.load_document(file_path)
-        
-        # Initialize embedding service
-        embedding_service = EmbeddingService()
-        
-        # Process and index document
-        chunk_count = embedding_service.index_document(
-            document_id=document_id,
-            pages=pages,
-            metadata={
-                "document_id": document_id,
-                "title": document.title,
-                "subject": document.subject,
-                "document_type": document.document_type.value,
-                "uploader_id": str(document.uploader_id),
-                "source_type": "document",
-            }
-        )
-        
-        # Update document status
-        document.indexing_status = IndexingStatus.COMPLETED
-        document.indexed_at = datetime.utcnow()
-        document.chunk_count = chunk_count
-        db.commit()
-        
-    except Exception as e:
-        # Update document with error
-        document = db.query(Document).filter(Document.id == document_id).first()
-        if document:
-            document.indexing_status = IndexingStatus.FAILED
-            document.error_message = str(e)
-            db.commit()
-
 @router.post("/upload", response_model=DocumentResponse, status_code=status.HTTP_201_CREATED)
 async def upload_document(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     title: str = Form(...),
     subject: str = Form(...),
@@ -93,7 +52,8 @@ async def upload_document(
     - **subject**: Subject/course name
     - **document_type**: Type of document (syllabus, question_paper, etc.)
     
-    Document will be processed asynchronously and indexed for RAG.
+    Document is queued for indexing by the ingestion workers; poll
+    /documents/{id}/ingestion for progress.
 
     Access: faculty/admin only
     """
@@ -107,26 +67,20 @@ async def upload_document(
             detail=f"Invalid file type. Allowed: {', '.join(settings.ALLOWED_EXTENSIONS)}"
         )
     
-    # Check file size (basic check, more detailed in actual upload)
-    file.file.seek(0, 2)
-    file_size = file.file.tell()
-    file.file.seek(0)
-    
-    if file_size > settings.MAX_UPLOAD_SIZE:
-        raise HTTPException(
-            status_code=400,
-            detail=f"File too large. Max size: {settings.MAX_UPLOAD_SIZE / 1024 / 1024}MB"
-        )
-    
     # Generate unique filename
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     filename = f"{timestamp}_{file.filename}"
     file_path = os.path.join(settings.UPLOAD_FOLDER, filename)
     
-    # Save file
+    # Stream file to disk (size is enforced as it arrives), reusing the
+    # stored copy when identical content was uploaded before
     try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        stored = await store_upload(db, Document, file, file_path)
+    except UploadTooLarge:
+        raise HTTPException(
+            status_code=400,
+            detail=f"File too large. Max size: {settings.MAX_UPLOAD_SIZE / 1024 / 1024}MB"
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error saving file: {str(e)}")
     
@@ -135,20 +89,20 @@ async def upload_document(
         title=title,
         subject=subject,
         document_type=document_type,
-        file_path=file_path,
-        file_size=file_size,
+        file_path=stored.file_path,
+        file_size=stored.file_size,
+        content_hash=stored.content_hash,
+        duplicate_of_id=stored.duplicate_of_id,
         uploader_id=current_user.id,
         indexing_status=IndexingStatus.PENDING
     )
     
-    db.add(new_document)
-    db.commit()
-    db.refresh(new_document)
+    commit_upload(db, Document, new_document)
     
-    # Process document in background
-    background_tasks.add_task(process_document_async, new_document.id, file_path, db)
+    # Queue indexing for the ingestion workers
+    job = ingestion_queue.enqueue(db, IngestionSource.DOCUMENT, new_document.id)
     
-    return new_document.to_dict()
+    return {**new_document.to_dict(), "ingestion_job_id": str(job.id)}
 
 @router.get("/", response_model=DocumentList)
 async def get_documents(
@@ -213,6 +167,25 @@ async def get_document(
     return document.to_dict()
 
 
+@router.get("/{document_id}/ingestion")
+async def get_document_ingestion(
+    document_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Latest ingestion job for a document, with stage-level progress."""
+    try:
+        target_id = UUID(document_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid document id")
+
+    job = ingestion_queue.latest_for_source(db, IngestionSource.DOCUMENT, target_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="No ingestion job for this document")
+
+    return job.to_dict()
+
+
 @router.get("/{document_id}/download")
 async def download_document(
     document_id: str,
@@ -250,59 +223,95 @@ async def download_document(
 
 @router.delete("/{document_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_document(
-    document_id: int,
+    document_id: str,
     db: Session = Depends(get_db),
     current_user: User = Depends(is_faculty_or_admin)
 ):
     """
     Delete document (soft delete)
     
-    Requires faculty or admin role
+    Requires faculty or admin role. If other uploads duplicate this
+    document's content, the oldest of them becomes the canonical copy.
     """
-    document = db.query(Document).filter(Document.id == document_id).first()
+    try:
+        target_id = UUID(document_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid document id")
+    
+    document = db.query(Document).filter(Document.id == target_id).first()
     
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
     
     # Soft delete
-    document.is_deleted = True
-    db.commit()
+    delete_upload(db, Document, document)
     
     # TODO: Remove from vector store
+    answer_cache.invalidate_document(document.id)
     
     return None
 
 @router.post("/{document_id}/reindex", response_model=DocumentResponse)
 async def reindex_document(
-    document_id: int,
-    background_tasks: BackgroundTasks,
+    document_id: str,
+    file: Optional[UploadFile] = File(None),
     db: Session = Depends(get_db),
     current_user: User = Depends(is_faculty_or_admin)
 ):
     """
-    Re-index a document
+    Re-index a document, optionally replacing its file with a new version
+    
+    Re-indexing is incremental: only chunks whose text changed are
+    embedded, chunks that disappeared are removed, and the rest keep their
+    vectors. The existing chunks stay searchable until the job finishes.
+    
+    - **file**: Optional new version of the document
     
     Requires faculty or admin role
     """
+    try:
+        target_id = UUID(document_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid document id")
+
     document = db.query(Document).filter(
-        Document.id == document_id,
+        Document.id == target_id,
         Document.is_deleted == False
     ).first()
     
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
     
-    # Reset indexing status
+    backfill_content_hash(db, Document, document)
+    
+    if file is not None and file.filename:
+        if not allowed_file(file.filename):
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid file type. Allowed: {', '.join(settings.ALLOWED_EXTENSIONS)}"
+            )
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        file_path = os.path.join(settings.UPLOAD_FOLDER, f"{timestamp}_{file.filename}")
+        try:
+            stored = await store_upload(db, Document, file, file_path)
+        except UploadTooLarge:
+            raise HTTPException(
+                status_code=400,
+                detail=f"File too large. Max size: {settings.MAX_UPLOAD_SIZE / 1024 / 1024}MB"
+            )
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error saving file: {str(e)}")
+        replace_upload(db, Document, document, stored)
+    
+    # Reset indexing status; chunk_count is updated when the job finishes
     document.indexing_status = IndexingStatus.PENDING
-    document.indexed_at = None
-    document.chunk_count = 0
     document.error_message = None
     db.commit()
     
-    # Process document in background
-    background_tasks.add_task(process_document_async, document.id, document.file_path, db)
+    # Queue indexing for the ingestion workers
+    job = ingestion_queue.enqueue(db, IngestionSource.DOCUMENT, document.id)
     
-    return document.to_dict()
+    return {**document.to_dict(), "ingestion_job_id": str(job.id)}
 
 @router.get("/subjects/list", response_model=List[str])
 async def get_subjects(
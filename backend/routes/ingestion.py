@@ -0,0 +1,53 @@
+"""Ingestion job routes for monitoring the indexing queue."""
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+
+from models import get_db
+from models.ingestion_job import IngestionJob, IngestionJobStatus, IngestionSource
+from models.user import User
+from services.ingestion_queue import ingestion_queue
+from utils.auth import get_current_faculty_or_admin_user
+
+router = APIRouter(prefix="/api/ingestion", tags=["Ingestion"])
+
+
+@router.get("/jobs")
+async def list_jobs(
+    status: IngestionJobStatus | None = Query(None),
+    source_type: IngestionSource | None = Query(None),
+    source_id: str | None = Query(None),
+    limit: int = Query(50, ge=1, le=500),
+    db: Session = Depends(get_db),
+    _: User = Depends(get_current_faculty_or_admin_user),
+):
+    """List recent ingestion jobs, newest first."""
+    query = db.query(IngestionJob)
+    if status is not None:
+        query = query.filter(IngestionJob.status == status)
+    if source_type is not None:
+        query = query.filter(IngestionJob.source_type == source_type)
+    if source_id:
+        query = query.filter(IngestionJob.source_id == source_id)
+
+    jobs = query.order_by(IngestionJob.created_at.desc()).limit(limit).all()
+    return {"jobs": [job.to_dict() for job in jobs], "counts": ingestion_queue.stats()}
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(
+    job_id: str,
+    db: Session = Depends(get_db),
+    _: User = Depends(get_current_faculty_or_admin_user),
+):
+    """Get one ingestion job with its stage-level progress."""
+    try:
+        target_id = UUID(job_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid job id")
+
+    job = db.query(IngestionJob).filter(IngestionJob.id == target_id).first()
+    if job is None:
+        raise HTTPException(status_code=404, detail="Ingestion job not found")
+    return job.to_dict()
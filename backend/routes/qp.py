@@ -5,15 +5,32 @@ from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 
+from config import settings
 from models import get_db
 from models.user import User
 from models.document import Document
 from utils.schemas import QuestionAnalysisRequest, QuestionPaperAnalysis
 from utils.auth import get_current_active_user, is_faculty_or_admin
+from services.generation_scheduler import (
+    GenerationQueueTimeout,
+    current_priority,
+    generation_scheduler,
+    priority_for_user,
+)
 from services.qp_analyzer import QuestionPaperAnalyzer
 
 router = APIRouter(prefix="/qp", tags=["Question Paper Analysis"])
 
+
+def _generation_busy() -> HTTPException:
+    """503 for a request that timed out waiting for a generation slot"""
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="The analyzer is under heavy load. Please retry shortly.",
+        headers={"Retry-After": str(settings.LOAD_SHED_RETRY_AFTER_SECONDS)},
+    )
+
+
 @router.post("/analyze")
 async def analyze_question_paper(
     request: QuestionAnalysisRequest,
@@ -50,16 +67,21 @@ async def analyze_question_paper(
     
     # Initialize analyzer
     analyzer = QuestionPaperAnalyzer()
+    # LLM calls queue for generation slots by the caller's role
+    current_priority.set(priority_for_user(current_user))
     
     try:
-        # Analyze question paper
-        analysis = analyzer.analyze_question_paper(db, request.document_id)
+        # Analyze question paper off the event loop
+        analysis = await generation_scheduler.to_thread(analyzer.analyze_question_paper, db, request.document_id)
         
         return analysis
     
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     
+    except GenerationQueueTimeout:
+        raise _generation_busy()
+    
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -98,14 +120,15 @@ async def map_questions_to_cos(
     
     # Initialize analyzer
     analyzer = QuestionPaperAnalyzer()
+    current_priority.set(priority_for_user(current_user))
     
     try:
         # First analyze the question paper
-        analysis = analyzer.analyze_question_paper(db, document_id)
+        analysis = await generation_scheduler.to_thread(analyzer.analyze_question_paper, db, document_id)
         questions = analysis.get("questions", [])
         
         # Map questions to COs
-        mapped_questions = analyzer.map_questions_to_cos(questions, co_descriptions)
+        mapped_questions = await generation_scheduler.to_thread(analyzer.map_questions_to_cos, questions, co_descriptions)
         
         # Recalculate distributions
         updated_analysis = analyzer._calculate_distributions(mapped_questions)
@@ -114,6 +137,9 @@ async def map_questions_to_cos(
         
         return updated_analysis
     
+    except GenerationQueueTimeout:
+        raise _generation_busy()
+    
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -177,11 +203,12 @@ async def compare_question_papers(
         raise HTTPException(status_code=400, detail="Maximum 5 documents can be compared")
     
     analyzer = QuestionPaperAnalyzer()
+    current_priority.set(priority_for_user(current_user))
     comparisons = []
     
     for doc_id in doc_ids:
         try:
-            analysis = analyzer.analyze_question_paper(db, doc_id)
+            analysis = await generation_scheduler.to_thread(analyzer.analyze_question_paper, db, doc_id)
             
             # Extract key metrics
             comparisons.append({
@@ -195,6 +222,9 @@ async def compare_question_papers(
                 "difficulty_distribution": analysis.get("difficulty_distribution", {})
             })
         
+        except GenerationQueueTimeout:
+            raise _generation_busy()
+        
         except Exception as e:
             comparisons.append({
                 "document_id": doc_id,
@@ -1,33 +1,61 @@
 """RAG and AI chat routes for document Q&A and conversational assistant."""
-from datetime import date
+import asyncio
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
 import html
+import json
 import re
+import time
 import uuid
 from typing import Any, Optional
 from urllib.parse import parse_qs, unquote, urlparse
 
 import httpx
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from sqlalchemy import func
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, defer
 
 from config import settings
-from models import get_db
-from models.chat import ChatHistory, MessageRole
+from models import SessionLocal, get_db
+from models.chat import ChatHistory, ChatSessionSummary, MessageRole, MessageStatus
 from models.query import Query
 from models.token_limit import UserDailyTokenUsage, UserTokenLimit
 from models.user import User
-from services.embeddings import EmbeddingService
+from services.answer_cache import answer_cache, normalize_query
+from services.chat_window import fit_history_window, load_session_history
+from services.chunk_store import resolve_context_chunks, store_context_chunks
+from services.context_packer import pack_context
+from services.embeddings import EmbeddingService, subject_query_tokens
+from services.extraction_cache import extraction_cache
+from services.generation_scheduler import (
+    GenerationQueueTimeout,
+    current_priority,
+    generation_scheduler,
+    priority_for_user,
+)
+from services.load_shedder import DegradationPolicy, load_controller
 from services.rag_pipeline import RAGPipeline
-from utils.auth import get_current_active_user
-from utils.schemas import RAGQuery, RAGResponse, SourceInfo
+from services.single_flight import SingleFlight
+from services.token_ledger import token_ledger
+from services.write_behind import write_behind
+from utils.auth import get_current_active_user, get_current_faculty_or_admin_user
+from utils.disconnect import CLIENT_CLOSED_REQUEST, ClientDisconnected, cancel_on_disconnect
+from utils.tokens import count_tokens
+from utils.schemas import RAGBatchQuery, RAGQuery, RAGResponse, SourceInfo
 
 router = APIRouter(prefix="/rag", tags=["RAG Query"])
 
 # Initialize RAG pipeline (singleton)
 rag_pipeline = RAGPipeline()
 
+# Concurrent identical /rag/query requests share one retrieval + generation.
+rag_query_flight = SingleFlight()
+
+# Bump when the chat system prompts change so cached answers from old prompts are not reused.
+CHAT_PROMPT_VERSION = "chat-v1"
+
 
 class ChatCompletionRequest(BaseModel):
     """Chat completion request for OpenRouter-backed assistant."""
@@ -40,10 +68,7 @@ class ChatCompletionRequest(BaseModel):
 
 
 def _estimate_text_tokens(text: str) -> int:
-    if not text:
-        return 0
-    # Rough approximation without external tokenizer dependency.
-    return max(1, len(text) // 4)
+    return count_tokens(text)
 
 
 def _estimate_messages_tokens(messages: list[dict[str, Any]]) -> int:
@@ -53,24 +78,6 @@ def _estimate_messages_tokens(messages: list[dict[str, Any]]) -> int:
     return base
 
 
-def _get_or_create_daily_usage(db: Session, user_id, usage_date: date) -> UserDailyTokenUsage:
-    usage = (
-        db.query(UserDailyTokenUsage)
-        .filter(
-            UserDailyTokenUsage.user_id == user_id,
-            UserDailyTokenUsage.usage_date == usage_date,
-        )
-        .first()
-    )
-    if usage:
-        return usage
-
-    usage = UserDailyTokenUsage(user_id=user_id, usage_date=usage_date, tokens_used=0, request_count=0)
-    db.add(usage)
-    db.flush()
-    return usage
-
-
 def _resolve_daily_limit(db: Session, user_id) -> int:
     limit_row = db.query(UserTokenLimit).filter(UserTokenLimit.user_id == user_id).first()
     if limit_row:
@@ -89,60 +96,134 @@ def _normalize_duckduckgo_link(raw_url: str) -> str:
     return raw_url
 
 
-async def _search_web_fallback(query: str, max_results: int = 5) -> list[dict[str, Any]]:
-    """Search the public web when vector context is unavailable."""
-    if not query.strip():
-        return []
+_WEB_RESULT_PATTERN = re.compile(r'<a[^>]*class="result__a"[^>]*href="([^"]+)"[^>]*>(.*?)</a>', re.IGNORECASE)
+_TAG_PATTERN = re.compile(r"<[^>]+>")
+
+# normalized query -> (expires_at, results, exhausted); ordered least recently used first.
+# Only complete fetches are cached; exhausted marks that results hold every hit on the page.
+_web_search_cache: "OrderedDict[str, tuple[float, list[dict[str, Any]], bool]]" = OrderedDict()
+_web_search_flight = SingleFlight()
+
 
-    async with httpx.AsyncClient(timeout=20.0) as client:
-        response = await client.get(
+async def _fetch_web_results(query: str, max_results: int, results: list[dict[str, Any]]) -> bool:
+    """
+    Stream the DuckDuckGo HTML page, appending parsed results as they arrive.
+
+    Returns True when the whole page was read, False when it stopped at max_results.
+    """
+    seen_urls: set[str] = set()
+    buffer = ""
+    scan_from = 0
+
+    async with httpx.AsyncClient(timeout=settings.WEB_SEARCH_DEADLINE_SECONDS) as client:
+        async with client.stream(
+            "GET",
             "https://duckduckgo.com/html/",
             params={"q": query},
             headers={
                 "User-Agent": "Mozilla/5.0",
             },
+        ) as response:
+            response.raise_for_status()
+
+            async for text_chunk in response.aiter_text():
+                buffer += text_chunk
+                # Only scan past the last complete match; an anchor cut at the chunk edge is retried next time.
+                for match in _WEB_RESULT_PATTERN.finditer(buffer, scan_from):
+                    scan_from = match.end()
+                    href, raw_title = match.groups()
+                    title = html.unescape(_TAG_PATTERN.sub("", raw_title)).strip()
+                    if not title:
+                        continue
+
+                    resolved_url = _normalize_duckduckgo_link(html.unescape(href).strip())
+                    if not resolved_url or resolved_url in seen_urls:
+                        continue
+
+                    seen_urls.add(resolved_url)
+                    results.append({"title": title, "url": resolved_url})
+                    if len(results) >= max_results:
+                        return False
+    return True
+
+
+async def _search_web_uncached(query: str, max_results: int) -> tuple[list[dict[str, Any]], Optional[bool]]:
+    """
+    Fetch web results within the deadline, keeping whatever was parsed when it expires.
+
+    Returns the results and whether the page was exhausted, or None for the
+    latter when the deadline or an HTTP error cut the fetch short.
+    """
+    results: list[dict[str, Any]] = []
+    try:
+        exhausted = await asyncio.wait_for(
+            _fetch_web_results(query, max_results, results),
+            timeout=settings.WEB_SEARCH_DEADLINE_SECONDS,
         )
+    except (asyncio.TimeoutError, httpx.HTTPError):
+        exhausted = None
+    return results, exhausted
 
-    if response.status_code >= 400:
-        return []
 
-    pattern = re.compile(r'<a[^>]*class="result__a"[^>]*href="([^"]+)"[^>]*>(.*?)</a>', re.IGNORECASE)
-    matches = pattern.findall(response.text)
-
-    results: list[dict[str, Any]] = []
-    for href, raw_title in matches:
-        title = re.sub(r"<[^>]+>", "", raw_title)
-        title = html.unescape(title).strip()
-        if not title:
-            continue
+async def _search_web_fallback(query: str, max_results: int = 5) -> list[dict[str, Any]]:
+    """Search the public web when vector context is unavailable."""
+    cache_key = normalize_query(query)
+    if not cache_key:
+        return []
 
-        resolved_url = _normalize_duckduckgo_link(html.unescape(href).strip())
-        if not resolved_url:
-            continue
+    now = time.time()
+    cached = _web_search_cache.get(cache_key)
+    if cached is not None:
+        expires_at, cached_results, exhausted = cached
+        if expires_at > now and (exhausted or len(cached_results) >= max_results):
+            _web_search_cache.move_to_end(cache_key)
+            return cached_results[:max_results]
+        if expires_at <= now:
+            del _web_search_cache[cache_key]
+
+    # Concurrent identical lookups share one fetch.
+    (results, exhausted), _ = await _web_search_flight.do(
+        (cache_key, max_results),
+        lambda: _search_web_uncached(query, max_results),
+    )
 
-        results.append({"title": title, "url": resolved_url})
-        if len(results) >= max_results:
-            break
+    # Results cut short by the deadline are served but not cached.
+    if exhausted is not None:
+        _web_search_cache[cache_key] = (time.time() + settings.WEB_SEARCH_CACHE_TTL_SECONDS, results, exhausted)
+        _web_search_cache.move_to_end(cache_key)
+        while len(_web_search_cache) > settings.WEB_SEARCH_CACHE_MAX_ENTRIES:
+            _web_search_cache.popitem(last=False)
 
-    return results
+    return list(results)
 
 
-async def _build_chat_rag_context(
+def _retrieve_material_context(
     payload: ChatCompletionRequest,
-    current_user: User,
+    user_id: str,
     top_k: int = 6,
-) -> tuple[str, list[dict[str, Any]], str]:
-    """Retrieve relevant chunks from vector store and format context plus sources."""
+) -> tuple[str, list[dict[str, Any]], Optional[list[float]]]:
+    """Retrieve relevant chunks from vector store and format context, sources and the query embedding."""
     embedding_service = EmbeddingService()
+    # Embed once; every search stage below reuses the same vector.
+    query_embedding = embedding_service.embed_query(payload.message)
 
     def _norm(value: Any) -> str:
         return str(value or "").strip().lower()
 
+    selected_subject = _norm(payload.subject)
+    selected_tokens = subject_query_tokens(selected_subject)
+
     def _subject_match(metadata: dict[str, Any], selected_subject: str) -> bool:
         selected = _norm(selected_subject)
         if not selected:
             return True
 
+        # Chunks indexed with precomputed subject keys match by set containment.
+        subject_keys = metadata.get("subject_keys")
+        if subject_keys is not None:
+            return selected_tokens.issubset(subject_keys)
+
+        # Legacy chunks indexed before subject keys existed.
         haystack = " ".join(
             [
                 _norm(metadata.get("subject")),
@@ -158,32 +239,37 @@ async def _build_chat_rag_context(
         if selected in haystack or haystack in selected:
             return True
 
-        selected_tokens = [token for token in re.split(r"\W+", selected) if len(token) > 2]
-        return bool(selected_tokens) and all(token in haystack for token in selected_tokens)
+        legacy_tokens = [token for token in re.split(r"\W+", selected) if len(token) > 2]
+        return bool(legacy_tokens) and all(token in haystack for token in legacy_tokens)
 
     def _search(k: int, filter_dict: Optional[dict[str, Any]] = None) -> list[dict[str, Any]]:
         return embedding_service.similarity_search_with_score(
             query=payload.message,
             k=k,
             filter_dict=filter_dict,
+            embedding=query_embedding,
         )
 
     base_filter: dict[str, Any] = {}
     if payload.document_type:
         base_filter["document_type"] = payload.document_type
 
-    selected_subject = _norm(payload.subject)
     staged_results: list[dict[str, Any]] = []
 
     # Stage 1: user-scoped search first.
-    user_filter = {**base_filter, "uploader_id": str(current_user.id)}
+    user_filter = {**base_filter, "uploader_id": user_id}
     staged_results.extend(_search(max(top_k * 3, 8), filter_dict=user_filter))
 
     # Stage 2: broaden to shared corpus if subject filter yields poor personal matches.
     if selected_subject:
         scoped = [row for row in staged_results if _subject_match(row.get("metadata") or {}, selected_subject)]
         if len(scoped) < max(2, top_k // 2):
-            staged_results.extend(_search(max(top_k * 4, 10), filter_dict=base_filter or None))
+            # Pre-filter the shared corpus to documents whose subject keys match, when any are known.
+            subject_documents = embedding_service.documents_for_subject(selected_tokens)
+            shared_filter = dict(base_filter)
+            if subject_documents:
+                shared_filter["document_id"] = {"$in": sorted(subject_documents)}
+            staged_results.extend(_search(max(top_k * 4, 10), filter_dict=shared_filter or None))
     else:
         if not staged_results:
             staged_results.extend(_search(max(top_k * 2, 6), filter_dict=base_filter or None))
@@ -208,16 +294,15 @@ async def _build_chat_rag_context(
         if len(results) >= top_k:
             break
 
+    # Merge overlapping neighbours from the same page and fit the best blocks into the context budget.
+    blocks = pack_context([row for row in results if not (row.get("metadata") or {}).get("init")])
+
     context_parts: list[str] = []
     sources: list[dict[str, Any]] = []
 
-    for index, result in enumerate(results, start=1):
-        metadata = result.get("metadata") or {}
-        content = (result.get("content") or "").strip()
-        if not content:
-            continue
-        if metadata.get("init"):
-            continue
+    for index, block in enumerate(blocks, start=1):
+        metadata = block.get("metadata") or {}
+        content = block["content"]
 
         source_name = (
             metadata.get("title")
@@ -233,15 +318,34 @@ async def _build_chat_rag_context(
                 "type": str(source_type),
                 "name": str(source_name),
                 "page": metadata.get("page_no"),
+                "chunk_ids": block["chunk_ids"],
+                "chunk_hashes": block["chunk_hashes"],
+                "document_id": str(metadata["document_id"]) if metadata.get("document_id") is not None else None,
             }
         )
 
-    if context_parts:
-        return "\n\n".join(context_parts), sources, "materials"
+    return "\n\n".join(context_parts), sources, query_embedding
+
+
+async def _build_chat_rag_context(
+    payload: ChatCompletionRequest,
+    current_user: User,
+    top_k: int = 6,
+    use_web_fallback: bool = True,
+) -> tuple[str, list[dict[str, Any]], str, Optional[list[float]]]:
+    """Build chat context from uploaded materials, falling back to web search results."""
+    # Vector search is CPU/IO bound; keep it off the event loop.
+    context, sources, query_embedding = await asyncio.to_thread(
+        _retrieve_material_context, payload, str(current_user.id), top_k
+    )
+    if context:
+        return context, sources, "materials", query_embedding
+    if not use_web_fallback:
+        return "", [], "none", query_embedding
 
     web_results = await _search_web_fallback(payload.message)
     if not web_results:
-        return "", [], "none"
+        return "", [], "none", query_embedding
 
     web_context_parts = []
     web_sources: list[dict[str, Any]] = []
@@ -257,49 +361,209 @@ async def _build_chat_rag_context(
             }
         )
 
-    return "\n\n".join(web_context_parts), web_sources, "internet"
+    return "\n\n".join(web_context_parts), web_sources, "internet", query_embedding
+
+
+def _chat_write_key(user_id) -> tuple[str, str]:
+    """Write-behind barrier key for a user's chat history rows."""
+    return "chat", str(user_id)
+
+
+def _query_write_key(user_id) -> tuple[str, str]:
+    """Write-behind barrier key for a user's RAG query log rows."""
+    return "query", str(user_id)
+
+
+def _enqueue_chat_turn(
+    user_id,
+    session_id: str,
+    user_content: str,
+    assistant_content: str,
+    reasoning_details: Any,
+    message_status: MessageStatus = MessageStatus.COMPLETED,
+) -> None:
+    """Queue both messages of a chat turn for batched insertion."""
+    key = _chat_write_key(user_id)
+    # Explicit timestamps keep the user message ordered before the reply within a batch.
+    asked_at = datetime.utcnow()
+    write_behind.enqueue(
+        ChatHistory,
+        {
+            "user_id": user_id,
+            "session_id": session_id,
+            "message_role": MessageRole.USER,
+            "message_content": user_content,
+            "status": message_status,
+            "timestamp": asked_at,
+        },
+        key=key,
+    )
+    write_behind.enqueue(
+        ChatHistory,
+        {
+            "user_id": user_id,
+            "session_id": session_id,
+            "message_role": MessageRole.ASSISTANT,
+            "message_content": assistant_content,
+            "reasoning_details": reasoning_details,
+            "status": message_status,
+            "timestamp": max(datetime.utcnow(), asked_at + timedelta(microseconds=1)),
+        },
+        key=key,
+    )
+
+
+def _enqueue_query_log(
+    user_id,
+    question: str,
+    result: dict[str, Any],
+    subject: Optional[str],
+    document_type: Optional[str],
+    session_id: str,
+) -> None:
+    """Queue a RAG query log row and its context chunks for batched insertion."""
+    write_key = _query_write_key(user_id)
+    # Chunk bodies are stored once by content hash; the query row keeps references.
+    context_refs = store_context_chunks(result.get("context_chunks", []), key=write_key)
+    write_behind.enqueue(
+        Query,
+        {
+            "user_id": user_id,
+            "query": question,
+            "response": result["answer"],
+            "subject": subject,
+            "document_type": document_type,
+            "sources": result.get("sources", []),
+            "context_chunks": context_refs,
+            "response_time": result.get("response_time"),
+            "session_id": session_id,
+            "timestamp": datetime.utcnow(),
+        },
+        key=write_key,
+    )
+
+
+def _load_chat_history(user_id, session_id: str) -> tuple[str, list[dict[str, Any]], bool]:
+    """Load the session's replay history on a dedicated session (runs on a worker thread)."""
+    db = SessionLocal()
+    try:
+        history = load_session_history(db, user_id, session_id, count_tokens=_estimate_text_tokens)
+        # Persist any turns folded into the rolling summary.
+        db.commit()
+        return history
+    finally:
+        db.close()
+
+
+async def _load_chat_history_async(user_id, session_id: str) -> tuple[str, list[dict[str, Any]], bool]:
+    # Earlier turns of this session may still be buffered; make them visible first.
+    await write_behind.barrier(_chat_write_key(user_id))
+    return await asyncio.to_thread(_load_chat_history, user_id, session_id)
+
+
+async def _build_chat_rag_context_safe(
+    payload: ChatCompletionRequest,
+    current_user: User,
+    policy: DegradationPolicy,
+) -> tuple[str, list[dict[str, Any]], str, Optional[list[float]]]:
+    try:
+        return await _build_chat_rag_context(
+            payload,
+            current_user,
+            top_k=policy.top_k,
+            use_web_fallback=policy.use_web_fallback,
+        )
+    except Exception:
+        # RAG retrieval is best-effort; fall back to plain chat when retrieval fails.
+        return "", [], "none", None
+
+
+async def _timed(timings: dict[str, float], stage: str, awaitable):
+    """Await and record the stage's wall time in milliseconds."""
+    started = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        timings[stage] = (time.perf_counter() - started) * 1000
+
+
+def _server_timing_header(timings: dict[str, float]) -> str:
+    return ", ".join(f"{stage};dur={duration:.1f}" for stage, duration in timings.items())
+
+
+async def _post_openrouter(request_body: dict[str, Any], priority: str) -> httpx.Response:
+    # Queue for a generation slot so staff requests are not starved by student surges.
+    async with generation_scheduler.async_slot(priority):
+        async with httpx.AsyncClient(timeout=90.0) as client:
+            return await client.post(
+                "https://openrouter.ai/api/v1/chat/completions",
+                headers={
+                    "Authorization": f"Bearer {settings.OPENROUTER_API_KEY}",
+                    "Content-Type": "application/json",
+                },
+                json=request_body,
+            )
+
+
+def _overloaded(policy: DegradationPolicy) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="The assistant is under heavy load. Please retry shortly.",
+        headers={"Retry-After": str(policy.retry_after)},
+    )
 
 
 @router.post("/chat")
 async def chat_with_openrouter(
     payload: ChatCompletionRequest,
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_active_user),
 ):
     """Generate assistant response, persist chat history, and enforce daily token limits."""
     if not settings.OPENROUTER_API_KEY:
         raise HTTPException(status_code=500, detail="OPENROUTER_API_KEY is not configured on backend")
 
+    with load_controller.admit(top_k=6, max_completion_tokens=1500) as policy:
+        if policy.shed:
+            raise _overloaded(policy)
+        response.headers["X-Degradation-Level"] = str(policy.level)
+        return await _complete_chat(payload, request, response, current_user, policy)
+
+
+async def _complete_chat(
+    payload: ChatCompletionRequest,
+    request: Request,
+    response: Response,
+    current_user: User,
+    policy: DegradationPolicy,
+) -> dict[str, Any]:
+    """Run one chat turn under the degradation policy chosen at admission."""
     session_id = payload.session_id or str(uuid.uuid4())
     today = date.today()
+    timings: dict[str, float] = {}
 
-    daily_limit = _resolve_daily_limit(db, current_user.id)
-    daily_usage = _get_or_create_daily_usage(db, current_user.id, today)
-    remaining_before = daily_limit - int(daily_usage.tokens_used)
+    # Limits, history and retrieval are independent; run them concurrently.
+    try:
+        (daily_limit, tokens_used_today), (session_summary, session_messages, has_history), retrieval = await cancel_on_disconnect(
+            request,
+            asyncio.gather(
+                _timed(timings, "limits", asyncio.to_thread(token_ledger.snapshot, current_user.id, today)),
+                _timed(timings, "history", _load_chat_history_async(current_user.id, session_id)),
+                _timed(timings, "retrieval", _build_chat_rag_context_safe(payload, current_user, policy)),
+            ),
+        )
+    except ClientDisconnected:
+        raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="Client closed request")
+    rag_context, sources, source_mode, query_embedding = retrieval
+
+    remaining_before = daily_limit - tokens_used_today
     if remaining_before <= 0:
         raise HTTPException(
             status_code=429,
             detail="Daily token limit reached. Contact admin to increase your limit.",
         )
 
-    history_rows = (
-        db.query(ChatHistory)
-        .filter(ChatHistory.user_id == current_user.id, ChatHistory.session_id == session_id)
-        .order_by(ChatHistory.timestamp.asc())
-        .all()
-    )
-
-    rag_context = ""
-    sources: list[dict[str, Any]] = []
-    source_mode = "none"
-    try:
-        rag_context, sources, source_mode = await _build_chat_rag_context(payload, current_user)
-    except Exception:
-        # RAG retrieval is best-effort; fall back to plain chat when retrieval fails.
-        rag_context = ""
-        sources = []
-        source_mode = "none"
-
     conversation_messages: list[dict[str, Any]] = []
 
     if rag_context and source_mode == "materials":
@@ -326,27 +590,86 @@ async def chat_with_openrouter(
             }
         )
 
-    for row in history_rows:
-        message_payload: dict[str, Any] = {
-            "role": row.message_role.value if isinstance(row.message_role, MessageRole) else str(row.message_role),
-            "content": row.message_content,
-        }
-        if message_payload["role"] == "assistant" and row.reasoning_details is not None:
-            message_payload["reasoning_details"] = row.reasoning_details
-        conversation_messages.append(message_payload)
+    user_message = {"role": "user", "content": payload.message}
 
-    conversation_messages.append({"role": "user", "content": payload.message})
+    # Replay only a bounded window of recent turns; older ones are folded into a rolling summary.
+    history_summary, history_messages = fit_history_window(
+        session_summary,
+        session_messages,
+        reserved_tokens=_estimate_messages_tokens([*conversation_messages, user_message]),
+        count_tokens=_estimate_text_tokens,
+    )
 
-    estimated_prompt_tokens = _estimate_messages_tokens(conversation_messages)
-    if estimated_prompt_tokens >= remaining_before:
-        raise HTTPException(
-            status_code=429,
-            detail="Token budget too low for this message today. Try again tomorrow or ask admin to raise your limit.",
+    selected_model = payload.model.strip() if payload.model and payload.model.strip() else settings.OPENROUTER_MODEL
+
+    # Only stateless first turns are cacheable; later turns depend on the session history.
+    cache_key = None
+    if not has_history:
+        cache_key = answer_cache.build_context_key(
+            [chunk_hash for source in sources for chunk_hash in (source.get("chunk_hashes") or [source.get("url")])],
+            selected_model,
+            f"{CHAT_PROMPT_VERSION}:{source_mode}",
         )
+        cached = answer_cache.get(cache_key, payload.message, embedding=query_embedding)
+        if cached is not None:
+            _enqueue_chat_turn(
+                current_user.id,
+                session_id,
+                payload.message,
+                cached["content"],
+                cached["reasoning_details"],
+            )
+            # Cache hits are free: count the request but not any tokens.
+            reservation = await asyncio.to_thread(token_ledger.reserve, current_user.id, 0, today)
+            daily_used = reservation.tokens_used if reservation else tokens_used_today
+            response.headers["Server-Timing"] = _server_timing_header(timings)
 
-    max_completion_tokens = max(64, min(1500, remaining_before - estimated_prompt_tokens))
+            return {
+                "session_id": session_id,
+                "message": {
+                    "role": "assistant",
+                    "content": cached["content"],
+                    "reasoning_details": cached["reasoning_details"],
+                },
+                "sources": sources,
+                "cached": True,
+                "usage": {
+                    "tokens_used": 0,
+                    "daily_used": int(daily_used),
+                    "daily_limit": int(daily_limit),
+                    "remaining_tokens": int(max(0, daily_limit - daily_used)),
+                },
+            }
 
-    selected_model = payload.model.strip() if payload.model and payload.model.strip() else settings.OPENROUTER_MODEL
+    if history_summary:
+        conversation_messages.append(
+            {
+                "role": "system",
+                "content": f"Summary of earlier turns in this conversation:\n{history_summary}",
+            }
+        )
+    conversation_messages.extend(history_messages)
+    conversation_messages.append(user_message)
+
+    budget_too_low = HTTPException(
+        status_code=429,
+        detail="Token budget too low for this message today. Try again tomorrow or ask admin to raise your limit.",
+    )
+    estimated_prompt_tokens = _estimate_messages_tokens(conversation_messages)
+    max_completion_tokens = min(policy.max_completion_tokens, remaining_before - estimated_prompt_tokens)
+    if max_completion_tokens < 64:
+        raise budget_too_low
+
+    # Hold the worst case up front; the conditional UPSERT rejects it if
+    # concurrent requests have already spent the rest of today's budget.
+    reservation = await asyncio.to_thread(
+        token_ledger.reserve,
+        current_user.id,
+        estimated_prompt_tokens + max_completion_tokens,
+        today,
+    )
+    if reservation is None:
+        raise budget_too_low
 
     request_body = {
         "model": selected_model,
@@ -355,15 +678,25 @@ async def chat_with_openrouter(
         "max_tokens": max_completion_tokens,
     }
 
-    async with httpx.AsyncClient(timeout=90.0) as client:
-        upstream_response = await client.post(
-            "https://openrouter.ai/api/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {settings.OPENROUTER_API_KEY}",
-                "Content-Type": "application/json",
-            },
-            json=request_body,
+    upstream_started = time.perf_counter()
+    try:
+        upstream_response = await cancel_on_disconnect(
+            request,
+            _post_openrouter(request_body, priority_for_user(current_user)),
         )
+    except ClientDisconnected:
+        # The prompt was already sent upstream; charge it, but not the completion that was never delivered.
+        await asyncio.to_thread(token_ledger.reconcile, reservation, estimated_prompt_tokens)
+        _enqueue_chat_turn(current_user.id, session_id, payload.message, "", None, MessageStatus.ABORTED)
+        raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="Client closed request")
+    except GenerationQueueTimeout:
+        await asyncio.to_thread(token_ledger.release, reservation)
+        raise _overloaded(policy)
+    except BaseException:
+        await asyncio.to_thread(token_ledger.release, reservation)
+        raise
+    timings["upstream"] = (time.perf_counter() - upstream_started) * 1000
+    load_controller.record_latency(timings["upstream"])
 
     try:
         result = upstream_response.json()
@@ -371,6 +704,7 @@ async def chat_with_openrouter(
         result = {}
 
     if upstream_response.status_code >= 400:
+        await asyncio.to_thread(token_ledger.release, reservation)
         detail = result.get("error", {}).get("message") if isinstance(result.get("error"), dict) else None
         raise HTTPException(status_code=upstream_response.status_code, detail=detail or "OpenRouter request failed")
 
@@ -385,28 +719,24 @@ async def chat_with_openrouter(
     else:
         tokens_used = _estimate_text_tokens(payload.message) + _estimate_text_tokens(assistant_content)
 
-    user_row = ChatHistory(
-        user_id=current_user.id,
-        session_id=session_id,
-        message_role=MessageRole.USER,
-        message_content=payload.message,
-    )
-    assistant_row = ChatHistory(
-        user_id=current_user.id,
-        session_id=session_id,
-        message_role=MessageRole.ASSISTANT,
-        message_content=assistant_content,
-        reasoning_details=reasoning_details,
-    )
-    db.add(user_row)
-    db.add(assistant_row)
-
-    daily_usage.tokens_used = int(daily_usage.tokens_used) + int(tokens_used)
-    daily_usage.request_count = int(daily_usage.request_count) + 1
-
-    db.commit()
+    persist_started = time.perf_counter()
+    _enqueue_chat_turn(current_user.id, session_id, payload.message, assistant_content, reasoning_details)
+
+    # Token accounting is never deferred: swap the held estimate for the reported usage.
+    await asyncio.to_thread(token_ledger.reconcile, reservation, tokens_used)
+    timings["persist"] = (time.perf_counter() - persist_started) * 1000
+    response.headers["Server-Timing"] = _server_timing_header(timings)
+
+    if cache_key is not None and assistant_content:
+        answer_cache.set(
+            cache_key,
+            payload.message,
+            {"content": assistant_content, "reasoning_details": reasoning_details},
+            document_ids=[source.get("document_id") for source in sources],
+            embedding=query_embedding,
+        )
 
-    remaining_after = max(0, daily_limit - int(daily_usage.tokens_used))
+    remaining_after = reservation.remaining
 
     return {
         "session_id": session_id,
@@ -416,10 +746,11 @@ async def chat_with_openrouter(
             "reasoning_details": reasoning_details,
         },
         "sources": sources,
+        "cached": False,
         "usage": {
             "tokens_used": int(tokens_used),
-            "daily_used": int(daily_usage.tokens_used),
-            "daily_limit": int(daily_limit),
+            "daily_used": int(reservation.tokens_used),
+            "daily_limit": int(reservation.daily_limit),
             "remaining_tokens": int(remaining_after),
         },
     }
@@ -434,6 +765,7 @@ async def get_chat_history(
     current_user: User = Depends(get_current_active_user),
 ):
     """Get persisted chat message history for current user."""
+    await write_behind.barrier(_chat_write_key(current_user.id))
     query = db.query(ChatHistory).filter(ChatHistory.user_id == current_user.id)
     if session_id:
         query = query.filter(ChatHistory.session_id == session_id)
@@ -447,6 +779,7 @@ async def get_chat_history(
             "role": row.message_role.value if isinstance(row.message_role, MessageRole) else str(row.message_role),
             "content": row.message_content,
             "reasoning_details": row.reasoning_details,
+            "status": row.status.value if isinstance(row.status, MessageStatus) else str(row.status),
             "timestamp": row.timestamp.isoformat() if row.timestamp else None,
         }
         for row in rows
@@ -460,6 +793,7 @@ async def get_chat_sessions(
     current_user: User = Depends(get_current_active_user),
 ):
     """Get list of user's saved chat sessions with title and message counts."""
+    await write_behind.barrier(_chat_write_key(current_user.id))
     session_rows = (
         db.query(ChatHistory.session_id, func.max(ChatHistory.timestamp).label("last_message_time"))
         .filter(ChatHistory.user_id == current_user.id)
@@ -506,10 +840,15 @@ async def delete_chat_session(
     current_user: User = Depends(get_current_active_user),
 ):
     """Delete one saved chat session for current user."""
+    await write_behind.barrier(_chat_write_key(current_user.id))
     db.query(ChatHistory).filter(
         ChatHistory.user_id == current_user.id,
         ChatHistory.session_id == session_id,
     ).delete()
+    db.query(ChatSessionSummary).filter(
+        ChatSessionSummary.user_id == current_user.id,
+        ChatSessionSummary.session_id == session_id,
+    ).delete()
     db.commit()
     return None
 
@@ -543,44 +882,177 @@ async def get_my_token_usage(
 @router.post("/query", response_model=RAGResponse)
 async def query_documents(
     query_data: RAGQuery,
-    db: Session = Depends(get_db),
+    request: Request,
     current_user: User = Depends(get_current_active_user),
 ):
     """Query documents using the RAG pipeline and save response metadata."""
+    with load_controller.admit(top_k=settings.TOP_K_RESULTS) as policy:
+        if policy.shed:
+            raise _overloaded(policy)
+        return await _answer_query(query_data, request, current_user, policy)
+
+
+async def _answer_query(
+    query_data: RAGQuery,
+    request: Request,
+    current_user: User,
+    policy: DegradationPolicy,
+) -> RAGResponse:
+    """Answer one RAG query under the degradation policy chosen at admission."""
+    # The pipeline's LLM call queues for a generation slot by the caller's role.
+    current_priority.set(priority_for_user(current_user))
     session_id = query_data.session_id or str(uuid.uuid4())
+    college_id = getattr(current_user, "college_id", None)
+
+    # Session memory is not part of the prompt, so requests differing only by session share work.
+    flight_key = (
+        normalize_query(query_data.user_query),
+        query_data.subject,
+        query_data.document_type,
+        str(college_id) if college_id else None,
+        policy.top_k,
+    )
 
-    try:
-        result = rag_pipeline.query(
+    def _run_query() -> dict[str, Any]:
+        return rag_pipeline.query(
             user_query=query_data.user_query,
             subject=query_data.subject,
             document_type=query_data.document_type,
-            session_id=session_id,
-            current_college_id=getattr(current_user, "college_id", None),
+            session_id=None,
+            k=policy.top_k,
+            current_college_id=college_id,
         )
-    except Exception as exc:
-        raise HTTPException(status_code=500, detail=f"Error processing query: {exc}")
 
     try:
-        new_query = Query(
-            user_id=current_user.id,
-            query=query_data.user_query,
-            response=result["answer"],
-            subject=query_data.subject,
-            document_type=query_data.document_type,
-            sources=result.get("sources", []),
-            context_chunks=result.get("context_chunks", []),
-            response_time=result.get("response_time"),
-            session_id=session_id,
+        shared_result, shared = await cancel_on_disconnect(
+            request,
+            rag_query_flight.do(flight_key, lambda: generation_scheduler.to_thread(_run_query)),
         )
-        db.add(new_query)
-        db.commit()
-        db.refresh(new_query)
+    except ClientDisconnected:
+        # Nothing is persisted for an answer nobody will read.
+        raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="Client closed request")
+    except GenerationQueueTimeout:
+        raise _overloaded(policy)
     except Exception as exc:
-        print(f"Error saving query to database: {exc}")
+        raise HTTPException(status_code=500, detail=f"Error processing query: {exc}")
+
+    if not shared and not shared_result.get("cached") and shared_result.get("response_time") is not None:
+        load_controller.record_latency(shared_result["response_time"])
+
+    # The leader's result is shared between callers; never mutate it in place.
+    result = {**shared_result, "session_id": session_id}
+    if result.get("context_chunks") and not result.get("error"):
+        # A miss reads the session back from the queries table; keep it off the event loop.
+        await asyncio.to_thread(
+            rag_pipeline.remember_exchange,
+            current_user.id,
+            session_id,
+            query_data.user_query,
+            result["answer"],
+            new_session=query_data.session_id is None,
+        )
+
+    _enqueue_query_log(
+        current_user.id,
+        query_data.user_query,
+        result,
+        query_data.subject,
+        query_data.document_type,
+        session_id,
+    )
 
     sources = [SourceInfo(**source) for source in result.get("sources", [])]
 
-    return RAGResponse(answer=result["answer"], sources=sources, session_id=session_id)
+    return RAGResponse(
+        answer=result["answer"],
+        sources=sources,
+        session_id=session_id,
+        cached=result.get("cached", False),
+    )
+
+
+@router.post("/query/batch")
+async def query_documents_batch(
+    batch: RAGBatchQuery,
+    current_user: User = Depends(get_current_faculty_or_admin_user),
+):
+    """Answer a question bank in one request, streaming NDJSON results as they complete."""
+    session_id = batch.session_id or str(uuid.uuid4())
+    college_id = getattr(current_user, "college_id", None)
+    priority = priority_for_user(current_user)
+
+    with load_controller.admit(top_k=settings.TOP_K_RESULTS) as policy:
+        if policy.shed:
+            raise _overloaded(policy)
+        # One embeddings call and one FAISS search for the whole bank.
+        try:
+            retrieved = await asyncio.to_thread(
+                rag_pipeline.retrieve_batch,
+                batch.questions,
+                subject=batch.subject,
+                document_type=batch.document_type,
+                k=policy.top_k,
+                current_college_id=college_id,
+            )
+        except Exception as exc:
+            raise HTTPException(status_code=500, detail=f"Error retrieving context: {exc}")
+
+    semaphore = asyncio.Semaphore(settings.RAG_BATCH_CONCURRENCY)
+    max_tokens = policy.max_completion_tokens if policy.caps_completion else None
+
+    async def _answer(index: int, question: str, embedding: list[float], results: list[dict[str, Any]]):
+        # Each running generation weighs on the degradation level like a single query.
+        async with semaphore:
+            try:
+                with load_controller.occupy():
+                    result = await generation_scheduler.to_thread(
+                        rag_pipeline.answer_from_results,
+                        question,
+                        results,
+                        query_embedding=embedding,
+                        max_tokens=max_tokens,
+                    )
+            except GenerationQueueTimeout:
+                # The rest of the batch may still fit; report this one as retryable.
+                result = {
+                    "answer": "The assistant is under heavy load. Please retry this question shortly.",
+                    "sources": [],
+                    "error": True,
+                }
+        if not result.get("cached") and result.get("response_time") is not None:
+            load_controller.record_latency(result["response_time"])
+        return index, question, result
+
+    async def _stream():
+        current_priority.set(priority)
+        tasks = [
+            asyncio.ensure_future(_answer(index, question, embedding, results))
+            for index, (question, (embedding, results)) in enumerate(zip(batch.questions, retrieved))
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                index, question, result = await next_done
+                if not result.get("error"):
+                    # Rows are batched into multi-row inserts by the write-behind queue.
+                    _enqueue_query_log(current_user.id, question, result, batch.subject, batch.document_type, session_id)
+                yield json.dumps(
+                    {
+                        "index": index,
+                        "question": question,
+                        "answer": result["answer"],
+                        "sources": result.get("sources", []),
+                        "cached": result.get("cached", False),
+                        "error": bool(result.get("error")),
+                        "session_id": session_id,
+                    },
+                    default=str,
+                ) + "\n"
+        finally:
+            # Client went away or streaming failed; stop queued generations.
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(_stream(), media_type="application/x-ndjson")
 
 
 @router.get("/history")
@@ -593,6 +1065,7 @@ async def get_query_history(
     current_user: User = Depends(get_current_active_user),
 ):
     """Get user's RAG query history (legacy query log)."""
+    await write_behind.barrier(_query_write_key(current_user.id))
     query = db.query(Query).filter(Query.user_id == current_user.id)
 
     if session_id:
@@ -602,9 +1075,10 @@ async def get_query_history(
 
     query = query.order_by(Query.timestamp.desc())
     total = query.count()
-    queries = query.offset(skip).limit(limit).all()
+    # Context chunks are only resolved when a single query is expanded.
+    queries = query.options(defer(Query.context_chunks)).offset(skip).limit(limit).all()
 
-    return {"queries": [q.to_dict() for q in queries], "total": total}
+    return {"queries": [q.to_dict(include_context=False) for q in queries], "total": total}
 
 
 @router.get("/history/{query_id}")
@@ -614,12 +1088,15 @@ async def get_query_by_id(
     current_user: User = Depends(get_current_active_user),
 ):
     """Get specific RAG query by ID."""
+    await write_behind.barrier(_query_write_key(current_user.id))
     query = db.query(Query).filter(Query.id == query_id, Query.user_id == current_user.id).first()
 
     if not query:
         raise HTTPException(status_code=404, detail="Query not found")
 
-    return query.to_dict()
+    data = query.to_dict()
+    data["context_chunks"] = resolve_context_chunks(db, query.context_chunks)
+    return data
 
 
 @router.delete("/history/{query_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -629,6 +1106,7 @@ async def delete_query(
     current_user: User = Depends(get_current_active_user),
 ):
     """Delete a single RAG query from history."""
+    await write_behind.barrier(_query_write_key(current_user.id))
     query = db.query(Query).filter(Query.id == query_id, Query.user_id == current_user.id).first()
 
     if not query:
@@ -645,6 +1123,7 @@ async def get_user_sessions(
     current_user: User = Depends(get_current_active_user),
 ):
     """Get list of user's RAG sessions (legacy query log)."""
+    await write_behind.barrier(_query_write_key(current_user.id))
     sessions = (
         db.query(Query.session_id)
         .filter(Query.user_id == current_user.id, Query.session_id.isnot(None))
@@ -696,7 +1175,8 @@ async def clear_session(
     current_user: User = Depends(get_current_active_user),
 ):
     """Clear conversation memory for a legacy RAG session."""
-    rag_pipeline.clear_memory(session_id)
+    await write_behind.barrier(_query_write_key(current_user.id))
+    rag_pipeline.clear_memory(current_user.id, session_id)
 
     db.query(Query).filter(Query.user_id == current_user.id, Query.session_id == session_id).delete()
     db.commit()
@@ -712,6 +1192,13 @@ async def get_rag_stats(current_user: User = Depends(get_current_active_user)):
 
     return {
         "vector_store": stats,
+        "answer_cache": answer_cache.stats(),
+        "query_single_flight": rag_query_flight.stats(),
+        "conversation_memory": rag_pipeline.memory_stats(),
+        "load_shedding": load_controller.stats(),
+        "generation_scheduler": generation_scheduler.stats(),
+        "write_behind": write_behind.stats(),
+        "extraction_cache": extraction_cache.stats(),
         "model": settings.PERPLEXITY_MODEL,
         "embedding_model": settings.EMBEDDING_MODEL,
     }
@@ -12,6 +12,7 @@ from models import get_db
 from models.role import Role, UserRole
 from models.token_limit import UserDailyTokenUsage, UserTokenLimit
 from models.user import User
+from services.token_ledger import token_ledger
 from utils.auth import get_current_admin_user, get_user_roles_and_permissions, get_password_hash
 from config import settings
 
@@ -196,6 +197,7 @@ async def update_user_token_limit(
     limit_row.updated_by = admin_user.id
     db.commit()
     db.refresh(limit_row)
+    token_ledger.invalidate(target_user_id)
 
     return {
         "user_id": str(target_user_id),
@@ -236,6 +238,7 @@ async def bulk_update_user_token_limits(
         limit_row.updated_by = admin_user.id
 
     db.commit()
+    token_ledger.invalidate()
 
     return {
         "updated_users": len(users),
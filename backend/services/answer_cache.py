@@ -0,0 +1,278 @@
+"""
+Answer cache for RAG generations keyed on query and retrieved context
+"""
+import asyncio
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from config import settings
+from services.ingestion_queue import ingestion_queue
+
+# Finished jobs are looked up this far behind the last sync, to absorb clock
+# skew between processes and jobs that committed while a sync was running
+SYNC_LOOKBACK_SECONDS = 30
+
+
+def normalize_query(text: str) -> str:
+    """Lowercase, strip punctuation and collapse whitespace so trivial rewordings share a key."""
+    cleaned = re.sub(r"[^\w\s]", " ", (text or "").lower())
+    return " ".join(cleaned.split())
+
+
+@dataclass
+class CachedAnswer:
+    """A single cached generation and the context it was produced from."""
+
+    normalized_query: str
+    answer: Any
+    document_ids: frozenset
+    expires_at: float
+    embedding: Optional[np.ndarray] = None
+    created_at: float = field(default_factory=time.time)
+
+
+class AnswerCache:
+    """
+    In-process cache of generated answers.
+
+    Entries are bucketed by a context key built from the sorted content hashes
+    of the retrieved chunks, the model and the prompt version, so an edited
+    chunk never matches answers generated from its old text. Within a bucket an exact normalized
+    query match is tried first, then the closest query embedding above the
+    configured cosine similarity threshold.
+
+    Re-indexing an upload drops the answers that used it. The worker that
+    indexed it invalidates its own process directly; every other process
+    picks the change up from the ingestion_jobs table (see run_sync).
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: int = None,
+        similarity_threshold: float = None,
+        max_entries: int = None,
+        enabled: bool = None,
+    ):
+        """Initialize answer cache"""
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings.ANSWER_CACHE_TTL_SECONDS
+        self.similarity_threshold = (
+            similarity_threshold if similarity_threshold is not None else settings.ANSWER_CACHE_SIMILARITY_THRESHOLD
+        )
+        self.max_entries = max_entries if max_entries is not None else settings.ANSWER_CACHE_MAX_ENTRIES
+        self.enabled = enabled if enabled is not None else settings.ANSWER_CACHE_ENABLED
+
+        self._buckets: "OrderedDict[str, List[CachedAnswer]]" = OrderedDict()
+        self._document_index: Dict[str, set] = {}
+        self._size = 0
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+        # Ingestion jobs already applied, and how far the table has been read
+        self._synced_jobs: Dict[Any, datetime] = {}
+        self._synced_until = datetime.utcnow()
+
+    @staticmethod
+    def build_context_key(chunk_hashes: Iterable[Any], model: str, prompt_version: str) -> str:
+        """Build the bucket key for a retrieval result set (chunk content hashes), model and prompt version."""
+        hashes = sorted(str(chunk_hash) for chunk_hash in chunk_hashes if chunk_hash is not None)
+        raw = "|".join([model or "", prompt_version or "", ",".join(hashes)])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _to_vector(embedding: Optional[Sequence[float]]) -> Optional[np.ndarray]:
+        if embedding is None:
+            return None
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        if norm == 0.0:
+            return None
+        return vector / norm
+
+    def get(
+        self,
+        context_key: str,
+        query: str,
+        embedding: Optional[Sequence[float]] = None,
+    ) -> Optional[Any]:
+        """Return a cached answer for the query within the context bucket, or None."""
+        if not self.enabled:
+            return None
+
+        normalized = normalize_query(query)
+        vector = self._to_vector(embedding)
+        now = time.time()
+
+        with self._lock:
+            bucket = self._buckets.get(context_key)
+            if not bucket:
+                self._misses += 1
+                return None
+
+            live = [entry for entry in bucket if entry.expires_at > now]
+            if len(live) != len(bucket):
+                self._drop_entries(context_key, [entry for entry in bucket if entry.expires_at <= now])
+                bucket = live
+            if not bucket:
+                self._misses += 1
+                return None
+
+            match = next((entry for entry in bucket if entry.normalized_query == normalized), None)
+            if match is None and vector is not None and self.similarity_threshold < 1.0:
+                best_score = self.similarity_threshold
+                for entry in bucket:
+                    if entry.embedding is None:
+                        continue
+                    score = float(np.dot(entry.embedding, vector))
+                    if score >= best_score:
+                        best_score = score
+                        match = entry
+
+            if match is None:
+                self._misses += 1
+                return None
+
+            self._buckets.move_to_end(context_key)
+            self._hits += 1
+            return match.answer
+
+    def set(
+        self,
+        context_key: str,
+        query: str,
+        answer: Any,
+        document_ids: Iterable[Any],
+        embedding: Optional[Sequence[float]] = None,
+    ) -> None:
+        """Store an answer for the query within the context bucket."""
+        if not self.enabled:
+            return
+
+        normalized = normalize_query(query)
+        entry = CachedAnswer(
+            normalized_query=normalized,
+            answer=answer,
+            document_ids=frozenset(str(doc_id) for doc_id in document_ids if doc_id is not None),
+            expires_at=time.time() + self.ttl_seconds,
+            embedding=self._to_vector(embedding),
+        )
+
+        with self._lock:
+            bucket = self._buckets.setdefault(context_key, [])
+            stale = [existing for existing in bucket if existing.normalized_query == normalized]
+            if stale:
+                self._drop_entries(context_key, stale)
+                bucket = self._buckets.setdefault(context_key, [])
+
+            bucket.append(entry)
+            self._buckets.move_to_end(context_key)
+            self._size += 1
+            for doc_id in entry.document_ids:
+                self._document_index.setdefault(doc_id, set()).add(context_key)
+
+            while self._size > self.max_entries and self._buckets:
+                oldest_key = next(iter(self._buckets))
+                self._drop_entries(oldest_key, list(self._buckets[oldest_key]))
+
+    def invalidate_document(self, document_id: Any) -> int:
+        """Drop every cached answer that used a chunk of the given document."""
+        doc_key = str(document_id)
+        removed = 0
+        with self._lock:
+            for context_key in self._document_index.pop(doc_key, set()):
+                bucket = self._buckets.get(context_key)
+                if not bucket:
+                    continue
+                affected = [entry for entry in bucket if doc_key in entry.document_ids]
+                removed += len(affected)
+                self._drop_entries(context_key, affected)
+        return removed
+
+    def sync_invalidations(self) -> int:
+        """
+        Drop answers built on uploads whose ingestion jobs finished since the last sync
+
+        Returns:
+            Number of cached answers removed
+        """
+        now = datetime.utcnow()
+        since = self._synced_until - timedelta(seconds=SYNC_LOOKBACK_SECONDS)
+        removed = 0
+        for job_id, source_id, finished_at in ingestion_queue.succeeded_since(since):
+            if job_id in self._synced_jobs:
+                continue
+            self._synced_jobs[job_id] = finished_at
+            removed += self.invalidate_document(source_id)
+        self._synced_until = now
+        self._synced_jobs = {
+            job_id: finished_at for job_id, finished_at in self._synced_jobs.items() if finished_at >= since
+        }
+        return removed
+
+    async def run_sync(self, interval_seconds: float = None) -> None:
+        """Apply invalidations from other processes until cancelled"""
+        interval = settings.ANSWER_CACHE_SYNC_SECONDS if interval_seconds is None else interval_seconds
+        if not self.enabled or interval <= 0:
+            return
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.sync_invalidations)
+            except Exception as e:
+                print(f"Answer cache sync error: {e}")
+
+    def clear(self) -> None:
+        """Drop all cached answers."""
+        with self._lock:
+            self._buckets.clear()
+            self._document_index.clear()
+            self._size = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Return cache size and hit/miss counters."""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "entries": self._size,
+                "buckets": len(self._buckets),
+                "hits": self._hits,
+                "misses": self._misses,
+                "ttl_seconds": self.ttl_seconds,
+                "similarity_threshold": self.similarity_threshold,
+            }
+
+    def _drop_entries(self, context_key: str, entries: List[CachedAnswer]) -> None:
+        # Caller must hold the lock.
+        bucket = self._buckets.get(context_key)
+        if bucket is None or not entries:
+            return
+
+        drop_ids = {id(entry) for entry in entries}
+        remaining = [entry for entry in bucket if id(entry) not in drop_ids]
+        self._size -= len(bucket) - len(remaining)
+
+        if remaining:
+            self._buckets[context_key] = remaining
+        else:
+            del self._buckets[context_key]
+
+        still_referenced = {doc_id for entry in remaining for doc_id in entry.document_ids}
+        for entry in entries:
+            for doc_id in entry.document_ids - still_referenced:
+                keys = self._document_index.get(doc_id)
+                if keys is None:
+                    continue
+                keys.discard(context_key)
+                if not keys:
+                    del self._document_index[doc_id]
+
+
+# Shared cache instance used by the RAG routes and pipeline
+answer_cache = AnswerCache()
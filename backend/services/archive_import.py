@@ -0,0 +1,555 @@
+"""
+Bulk import of course materials from zip/rar/7z archives
+"""
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from functools import partial
+from pathlib import Path, PurePosixPath
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import or_, update
+from sqlalchemy.orm import Session
+
+from config import settings
+from models import SessionLocal
+from models.course_material import Course, CourseMaterial, MaterialType
+from models.ingestion_job import IngestionJob, IngestionSource
+from models.material_import import MaterialImport, MaterialImportStatus
+from services.ingestion_queue import ingestion_queue
+from services.upload_dedup import UploadTooLarge, commit_upload, store_stream
+
+try:
+    import py7zr
+    from py7zr.io import Py7zIO, WriterFactory
+except ImportError:  # .7z imports unavailable
+    py7zr = None
+    Py7zIO = WriterFactory = object
+
+try:
+    import rarfile
+except ImportError:  # .rar imports unavailable
+    rarfile = None
+
+ARCHIVE_EXTENSIONS = {".zip", ".rar", ".7z"}
+
+# Folder names (lowercased, spaces/hyphens as underscores) mapped to material types
+MATERIAL_TYPE_FOLDERS = {
+    "pdf": MaterialType.pdf,
+    "pdfs": MaterialType.pdf,
+    "notes": MaterialType.notes,
+    "lecture_notes": MaterialType.notes,
+    "lectures": MaterialType.notes,
+    "slides": MaterialType.notes,
+    "question_paper": MaterialType.question_paper,
+    "question_papers": MaterialType.question_paper,
+    "qp": MaterialType.question_paper,
+    "qps": MaterialType.question_paper,
+    "papers": MaterialType.question_paper,
+    "previous_papers": MaterialType.question_paper,
+}
+
+# Operating-system clutter that is dropped without being reported
+_IGNORED_PARTS = {"__MACOSX", "Thumbs.db", "desktop.ini"}
+
+
+class ArchiveImportError(Exception):
+    """Raised when an archive cannot be opened or read"""
+
+
+@dataclass
+class ArchiveMember:
+    """A regular file inside an archive, opened on demand"""
+
+    path: str
+    size: int
+    open: Callable[[], BinaryIO]
+    # Why the member could not be extracted (it is reported as rejected)
+    error: Optional[str] = None
+
+
+def iter_archive_members(archive_path: str) -> Iterator[ArchiveMember]:
+    """
+    Files in an archive, one at a time
+
+    Zip and rar members are decompressed straight from the archive as they
+    are read. 7z archives are usually solid (a member can only be reached by
+    decompressing everything before it), so they are decompressed once,
+    member by member, into temporary files; see _iter_7z_members.
+
+    Args:
+        archive_path: Path to a .zip, .rar or .7z file
+
+    Yields:
+        Regular file members (directories are skipped)
+    """
+    extension = Path(archive_path).suffix.lower()
+    try:
+        if extension == ".zip":
+            with zipfile.ZipFile(archive_path) as archive:
+                for info in archive.infolist():
+                    if not info.is_dir():
+                        yield ArchiveMember(info.filename, info.file_size, partial(archive.open, info))
+        elif extension == ".rar":
+            if rarfile is None:
+                raise ArchiveImportError("Importing .rar archives requires the rarfile package")
+            with rarfile.RarFile(archive_path) as archive:
+                for info in archive.infolist():
+                    if not info.isdir():
+                        yield ArchiveMember(info.filename, info.file_size, partial(archive.open, info))
+        elif extension == ".7z":
+            if py7zr is None:
+                raise ArchiveImportError("Importing .7z archives requires the py7zr package")
+            yield from _iter_7z_members(archive_path)
+        else:
+            raise ArchiveImportError(f"Unsupported archive format: {extension}")
+    except (zipfile.BadZipFile, OSError) as e:
+        raise ArchiveImportError(f"Could not read archive: {e}") from e
+
+
+class _SevenZipLimit(Exception):
+    """Raised inside py7zr to stop decompressing at the extracted size cap"""
+
+
+class _SevenZipMemberFile(Py7zIO):
+    """Temporary file one 7z member is decompressed into"""
+
+    def __init__(self, spool: "_SevenZipSpool", path: str):
+        self.spool = spool
+        self.path = path
+        self.written = 0
+        self._file = open(path, "wb")
+
+    def write(self, data) -> int:
+        self.spool.take(len(data))
+        # Keep just enough of an oversized member for the upload limit to reject it
+        keep = min(len(data), max(0, self.spool.member_limit - self.written))
+        if keep:
+            self._file.write(data[:keep])
+        self.written += len(data)
+        return len(data)
+
+    def read(self, size: int = None) -> bytes:
+        return b""
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        return self.written
+
+    def flush(self) -> None:
+        if not self._file.closed:
+            self._file.flush()
+
+    def size(self) -> int:
+        return self.written
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class _SevenZipSpool(WriterFactory):
+    """
+    Receive 7z members as py7zr decompresses them, with a running byte cap
+
+    The cap counts bytes actually produced, so an archive whose headers
+    understate its contents stops at the cap instead of filling the disk.
+    Members are written to numbered files, never to paths taken from the
+    archive; a member counts as complete once py7zr moves on to the next
+    one or finishes.
+    """
+
+    def __init__(self, directory: str, limit: int, member_limit: int):
+        self.directory = directory
+        self.limit = limit
+        self.member_limit = member_limit
+        self.extracted = 0
+        self.completed: Dict[str, _SevenZipMemberFile] = {}
+        self._current: Optional[Tuple[str, _SevenZipMemberFile]] = None
+
+    def take(self, size: int) -> None:
+        self.extracted += size
+        if self.extracted > self.limit:
+            raise _SevenZipLimit()
+
+    def create(self, filename: str) -> Py7zIO:
+        self.finish()
+        member = _SevenZipMemberFile(self, os.path.join(self.directory, str(len(self.completed))))
+        self._current = (filename, member)
+        return member
+
+    def finish(self) -> None:
+        """Mark the member being written as complete"""
+        if self._current is not None:
+            filename, member = self._current
+            member.close()
+            self.completed[filename] = member
+            self._current = None
+
+    def abandon(self) -> None:
+        """Drop the member being written when decompression stopped early"""
+        if self._current is not None:
+            self._current[1].close()
+            self._current = None
+
+
+def _iter_7z_members(archive_path: str) -> Iterator[ArchiveMember]:
+    limit = settings.ARCHIVE_MAX_EXTRACTED_SIZE
+    with tempfile.TemporaryDirectory(dir=settings.UPLOAD_FOLDER) as directory:
+        spool = _SevenZipSpool(directory, limit, settings.MAX_UPLOAD_SIZE + 1)
+        truncated = False
+        with py7zr.SevenZipFile(archive_path, mode="r") as archive:
+            entries = [entry for entry in archive.list() if not entry.is_directory]
+            try:
+                archive.extractall(factory=spool)
+                spool.finish()
+            except _SevenZipLimit:
+                truncated = True
+            finally:
+                spool.abandon()
+
+        for entry in entries:
+            member = spool.completed.get(entry.filename)
+            if member is not None:
+                yield ArchiveMember(entry.filename, member.written, partial(open, member.path, "rb"))
+            elif truncated:
+                yield ArchiveMember(entry.filename, entry.uncompressed or 0, partial(open, os.devnull, "rb"),
+                                    error=f"Archive expands past {limit} bytes")
+
+
+def material_type_for_folders(folders: List[str]) -> Optional[MaterialType]:
+    """Material type named by the innermost matching folder, if any"""
+    for folder in reversed(folders):
+        material_type = MATERIAL_TYPE_FOLDERS.get(re.sub(r"[\s\-]+", "_", folder.strip().lower()))
+        if material_type is not None:
+            return material_type
+    return None
+
+
+class ArchiveImporter:
+    """
+    Unpack an archive into course materials queued for indexing
+
+    Members are mapped to a course and material type from their folders:
+
+        <COURSE CODE>[ - Course name]/[<material type folder>/]...<file>
+
+    The course is the outermost folder whose code matches an existing
+    course (so a wrapper folder around the courses is fine); with
+    create_courses, an unknown top-level folder creates the course. When a
+    fixed course is given, every member goes to it and folders only choose
+    the material type. Material type folders are listed in
+    MATERIAL_TYPE_FOLDERS; members outside one get default_material_type.
+
+    Each member is streamed to the uploads folder through the same
+    hashing, size-limited, deduplicating path as a single upload and gets
+    its own ingestion job, so the ingestion workers index the whole archive
+    in parallel. Every member is reported with one of the statuses queued,
+    duplicate (identical content already stored; indexed by copying its
+    chunks), skipped (not importable), rejected (over a size or count
+    limit) or failed.
+    """
+
+    def __init__(
+        self,
+        db: Session,
+        uploaded_by=None,
+        course: Optional[Course] = None,
+        create_courses: bool = False,
+        default_material_type: MaterialType = MaterialType.notes
+    ):
+        self.db = db
+        self.uploaded_by = uploaded_by
+        self.course = course
+        self.create_courses = create_courses
+        self.default_material_type = default_material_type
+        self._courses: Dict[str, Optional[Course]] = {}
+
+    def _find_course(self, folder: str) -> Optional[Course]:
+        code = folder.partition(" - ")[0].strip().upper()
+        if code not in self._courses:
+            self._courses[code] = self.db.query(Course).filter(Course.code == code).first()
+        return self._courses[code]
+
+    def _create_course(self, folder: str) -> Course:
+        code, _, name = folder.partition(" - ")
+        course = Course(code=code.strip().upper(), name=name.strip() or code.strip(), created_by=self.uploaded_by)
+        self.db.add(course)
+        self.db.commit()
+        self.db.refresh(course)
+        self._courses[course.code] = course
+        return course
+
+    def _resolve(self, folders: List[str]) -> Dict[str, Any]:
+        """Course, material type and reason (if unresolvable) for a member's folders"""
+        if self.course is not None:
+            course, type_folders = self.course, folders
+        else:
+            index = next((i for i, folder in enumerate(folders) if self._find_course(folder)), None)
+            if index is not None:
+                course, type_folders = self._find_course(folders[index]), folders[index + 1:]
+            elif folders and self.create_courses and material_type_for_folders(folders[:1]) is None:
+                course, type_folders = self._create_course(folders[0]), folders[1:]
+            else:
+                return {"reason": f"No course for folder '{'/'.join(folders) or '(archive root)'}'"}
+        return {
+            "course": course,
+            "material_type": material_type_for_folders(type_folders) or self.default_material_type,
+        }
+
+    def _import_member(self, member: ArchiveMember, parts: List[str]) -> Dict[str, Any]:
+        filename = parts[-1]
+        entry: Dict[str, Any] = {"path": member.path, "size": member.size}
+
+        extension = Path(filename).suffix.lower()
+        if extension in ARCHIVE_EXTENSIONS:
+            return {**entry, "status": "skipped", "reason": "Nested archive"}
+        if extension.lstrip(".") not in settings.ALLOWED_EXTENSIONS:
+            return {**entry, "status": "skipped", "reason": f"File type {extension or '(none)'} not allowed"}
+
+        target = self._resolve(parts[:-1])
+        if "reason" in target:
+            return {**entry, "status": "skipped", "reason": target["reason"]}
+        course: Course = target["course"]
+        material_type: MaterialType = target["material_type"]
+        entry.update({"course_code": course.code, "material_type": material_type.value})
+
+        material_dir = os.path.join(settings.UPLOAD_FOLDER, "course_materials", course.code)
+        os.makedirs(material_dir, exist_ok=True)
+        timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+        # Members from different folders often share a name (unit1.pdf)
+        saved_name = f"{timestamp}_{uuid.uuid4().hex[:8]}_{filename.replace(' ', '_')}"
+
+        try:
+            with member.open() as source:
+                stored = store_stream(self.db, CourseMaterial, source, os.path.join(material_dir, saved_name))
+        except UploadTooLarge:
+            return {**entry, "status": "rejected", "reason": f"Larger than {settings.MAX_UPLOAD_SIZE} bytes"}
+
+        material = CourseMaterial(
+            course_id=course.id,
+            title=Path(filename).stem.replace("_", " ").strip() or filename,
+            material_type=material_type,
+            file_path=stored.file_path,
+            file_size=stored.file_size,
+            content_hash=stored.content_hash,
+            duplicate_of_id=stored.duplicate_of_id,
+            uploaded_by=self.uploaded_by,
+        )
+        commit_upload(self.db, CourseMaterial, material)
+        job = ingestion_queue.enqueue(self.db, IngestionSource.COURSE_MATERIAL, material.id)
+
+        return {
+            **entry,
+            "size": material.file_size,
+            "status": "duplicate" if material.duplicate_of_id else "queued",
+            "material_id": str(material.id),
+            "duplicate_of_id": str(material.duplicate_of_id) if material.duplicate_of_id else None,
+            "ingestion_job_id": str(job.id),
+        }
+
+    def run(self, archive_path: str) -> List[Dict[str, Any]]:
+        """
+        Import every member of an archive
+
+        Args:
+            archive_path: Archive to read
+
+        Returns:
+            Per-file results in archive order
+
+        Raises:
+            ArchiveImportError: The archive itself could not be read
+        """
+        results: List[Dict[str, Any]] = []
+        imported = 0
+        extracted = 0
+        for member in iter_archive_members(archive_path):
+            parts = [part for part in PurePosixPath(member.path.replace("\\", "/")).parts if part not in ("", "/")]
+            if not parts or any(part in _IGNORED_PARTS or part.startswith(".") for part in parts):
+                continue
+
+            if member.error:
+                results.append({"path": member.path, "size": member.size, "status": "rejected", "reason": member.error})
+                continue
+            if imported >= settings.ARCHIVE_MAX_MEMBERS:
+                results.append({"path": member.path, "size": member.size, "status": "rejected",
+                                "reason": f"Archive has more than {settings.ARCHIVE_MAX_MEMBERS} files"})
+                continue
+            if extracted + member.size > settings.ARCHIVE_MAX_EXTRACTED_SIZE:
+                results.append({"path": member.path, "size": member.size, "status": "rejected",
+                                "reason": f"Archive expands past {settings.ARCHIVE_MAX_EXTRACTED_SIZE} bytes"})
+                continue
+
+            try:
+                result = self._import_member(member, parts)
+            except Exception as e:
+                self.db.rollback()
+                result = {"path": member.path, "size": member.size, "status": "failed", "reason": str(e)}
+            if result["status"] in ("queued", "duplicate"):
+                imported += 1
+                extracted += result["size"]
+            results.append(result)
+        return results
+
+
+def run_import(db: Session, material_import: MaterialImport, archive_path: str, importer: ArchiveImporter) -> MaterialImport:
+    """
+    Run an importer for an import record and store its outcome on the record
+
+    Args:
+        db: Session the record belongs to (committed here)
+        material_import: Record created for this archive
+        archive_path: Archive to read
+        importer: Configured importer (sharing db)
+
+    Returns:
+        The finished record
+    """
+    try:
+        files = importer.run(archive_path)
+        material_import.status = MaterialImportStatus.COMPLETED
+    except ArchiveImportError as e:
+        db.rollback()
+        files = []
+        material_import.status = MaterialImportStatus.FAILED
+        material_import.error = str(e)
+    material_import.files = files
+    material_import.member_count = len(files)
+    material_import.finished_at = datetime.utcnow()
+    material_import.archive_path = None
+    material_import.lease_expires_at = None
+    db.commit()
+    db.refresh(material_import)
+    print(f"Imported {material_import.archive_name}: {material_import.to_dict()['counts']}")
+    return material_import
+
+
+def lease_deadline() -> datetime:
+    """Lease expiry for an import renewed now"""
+    return datetime.utcnow() + timedelta(seconds=settings.ARCHIVE_IMPORT_LEASE_SECONDS)
+
+
+class ImportLease(threading.Thread):
+    """
+    Renew a running import's lease in the background while it is unpacked
+
+    Use as a context manager around the unpack. The lease lets
+    expire_stale_imports() tell an import whose process died from one that
+    is still being unpacked by another API process.
+    """
+
+    def __init__(self, import_id):
+        super().__init__(daemon=True)
+        self.import_id = import_id
+        self.interval = max(1.0, settings.ARCHIVE_IMPORT_LEASE_SECONDS / 3)
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            db = SessionLocal()
+            try:
+                db.execute(
+                    update(MaterialImport)
+                    .where(MaterialImport.id == self.import_id, MaterialImport.status == MaterialImportStatus.RUNNING)
+                    .values(lease_expires_at=lease_deadline())
+                )
+                db.commit()
+            except Exception as e:
+                print(f"Archive import lease renewal failed for {self.import_id}: {e}")
+            finally:
+                db.close()
+
+    def __enter__(self) -> "ImportLease":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stopped.set()
+
+
+def expire_stale_imports(db: Session) -> int:
+    """
+    Fail running imports whose lease lapsed and remove leftover archives
+
+    Also removes archives in the imports folder that no running import
+    refers to and that have not been written to for a lease period (the
+    process died between storing the upload and recording the import).
+
+    Args:
+        db: Session to update the records in (committed here)
+
+    Returns:
+        Number of imports marked failed
+    """
+    now = datetime.utcnow()
+    stale = (
+        db.query(MaterialImport)
+        .filter(
+            MaterialImport.status == MaterialImportStatus.RUNNING,
+            # Imports recorded before leases existed have none and are long gone
+            or_(MaterialImport.lease_expires_at.is_(None), MaterialImport.lease_expires_at < now),
+        )
+        .all()
+    )
+    leftovers = []
+    for material_import in stale:
+        material_import.status = MaterialImportStatus.FAILED
+        material_import.error = "The import was interrupted before it finished; upload the archive again"
+        material_import.finished_at = now
+        material_import.lease_expires_at = None
+        if material_import.archive_path:
+            leftovers.append(material_import.archive_path)
+        material_import.archive_path = None
+    db.commit()
+    for path in leftovers:
+        if os.path.exists(path):
+            os.remove(path)
+
+    live = {
+        os.path.abspath(path)
+        for (path,) in db.query(MaterialImport.archive_path).filter(
+            MaterialImport.status == MaterialImportStatus.RUNNING,
+            MaterialImport.archive_path.isnot(None),
+        )
+    }
+    import_dir = os.path.join(settings.UPLOAD_FOLDER, "imports")
+    cutoff = time.time() - settings.ARCHIVE_IMPORT_LEASE_SECONDS
+    if os.path.isdir(import_dir):
+        for entry in os.scandir(import_dir):
+            if not entry.is_file() or os.path.abspath(entry.path) in live:
+                continue
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+    if stale:
+        print(f"Failed {len(stale)} interrupted archive imports")
+    return len(stale)
+
+
+def with_indexing_status(db: Session, material_import: MaterialImport) -> Dict[str, Any]:
+    """An import's dict with each imported file's current ingestion job status"""
+    data = material_import.to_dict()
+    job_ids = [entry["ingestion_job_id"] for entry in data["files"] if entry.get("ingestion_job_id")]
+    if not job_ids:
+        return data
+    jobs = {
+        str(job.id): job
+        for job in db.query(IngestionJob).filter(IngestionJob.id.in_([uuid.UUID(job_id) for job_id in job_ids])).all()
+    }
+    indexing: Dict[str, int] = {}
+    for entry in data["files"]:
+        job = jobs.get(entry.get("ingestion_job_id"))
+        if job is None:
+            continue
+        entry["indexing_status"] = job.status.value
+        entry["indexing_error"] = job.last_error
+        indexing[job.status.value] = indexing.get(job.status.value, 0) + 1
+    data["indexing"] = indexing
+    return data
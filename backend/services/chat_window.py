@@ -0,0 +1,197 @@
+"""
+Token-budgeted conversation window for chat sessions
+"""
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from config import settings
+from models.chat import ChatHistory, ChatSessionSummary, MessageRole, MessageStatus
+from utils.helpers import truncate_text
+
+# Per-message framing overhead, matching the chat route's prompt estimate
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def _role_of(row: ChatHistory) -> str:
+    return row.message_role.value if isinstance(row.message_role, MessageRole) else str(row.message_role)
+
+
+def _is_aborted(row: ChatHistory) -> bool:
+    return row.status == MessageStatus.ABORTED or row.status == MessageStatus.ABORTED.value
+
+
+def _summary_lines(rows: List[ChatHistory]) -> List[str]:
+    """Condense folded turns into one short line per message."""
+    lines = []
+    for row in rows:
+        if _is_aborted(row):
+            continue
+        content = " ".join(str(row.message_content or "").split())
+        if not content:
+            continue
+        if _role_of(row) == "user":
+            lines.append(f"- User asked: {truncate_text(content, 200)}")
+        else:
+            lines.append(f"  Assistant answered: {truncate_text(content, 300)}")
+    return lines
+
+
+def _cap_lines(lines: List[str], max_tokens: int, count_tokens: Callable[[str], int]) -> List[str]:
+    """Drop the oldest lines until the summary fits max_tokens."""
+    kept: List[str] = []
+    used = 0
+    for line in reversed(lines):
+        cost = count_tokens(line) + 1
+        if used + cost > max_tokens:
+            break
+        kept.append(line)
+        used += cost
+    kept.reverse()
+    return kept
+
+
+def fold_summary(
+    previous: str,
+    rows: List[ChatHistory],
+    count_tokens: Callable[[str], int],
+    max_tokens: int = None,
+) -> str:
+    """Fold newly evicted turns into an existing rolling summary."""
+    max_tokens = max_tokens or settings.CHAT_SUMMARY_MAX_TOKENS
+    lines = [line for line in (previous or "").split("\n") if line.strip()]
+    lines.extend(_summary_lines(rows))
+    return "\n".join(_cap_lines(lines, max_tokens, count_tokens))
+
+
+def _summary_row(db: Session, user_id, session_id: str, lock: bool = False) -> Optional[ChatSessionSummary]:
+    query = db.query(ChatSessionSummary).filter(
+        ChatSessionSummary.user_id == user_id,
+        ChatSessionSummary.session_id == session_id,
+    )
+    if lock:
+        query = query.with_for_update()
+    return query.first()
+
+
+def _lock_summary_row(db: Session, user_id, session_id: str) -> ChatSessionSummary:
+    """Lock the session's summary row, creating it if this is the first fold"""
+    summary_row = _summary_row(db, user_id, session_id, lock=True)
+    if summary_row is not None:
+        return summary_row
+    try:
+        with db.begin_nested():
+            db.add(ChatSessionSummary(user_id=user_id, session_id=session_id, summary="", folded_messages=0))
+    except IntegrityError:
+        # A concurrent request created it first; its row is locked below.
+        pass
+    return _summary_row(db, user_id, session_id, lock=True)
+
+
+def _unfolded_rows(db: Session, user_id, session_id: str, summary_row: Optional[ChatSessionSummary]) -> List[ChatHistory]:
+    """Messages after the last one folded into the summary, oldest first"""
+    query = db.query(ChatHistory).filter(ChatHistory.user_id == user_id, ChatHistory.session_id == session_id)
+    if summary_row is not None and summary_row.folded_through_at is not None:
+        folded_at, folded_id = summary_row.folded_through_at, summary_row.folded_through_id
+        query = query.filter(
+            or_(
+                ChatHistory.timestamp > folded_at,
+                and_(ChatHistory.timestamp == folded_at, ChatHistory.id > folded_id),
+            )
+        )
+    return query.order_by(ChatHistory.timestamp.asc(), ChatHistory.id.asc()).all()
+
+
+def load_session_history(
+    db: Session,
+    user_id,
+    session_id: str,
+    count_tokens: Callable[[str], int],
+    keep_turns: int = None,
+) -> Tuple[str, List[Dict[str, Any]], bool]:
+    """
+    Load the unfolded turns and rolling summary of a chat session
+
+    Only rows after the last message folded into the session summary are
+    read. Rows beyond the last keep_turns turns are folded into the rolling
+    summary under a row lock on it, so concurrent requests for the session
+    never fold the same turns twice; the caller commits the session to
+    persist the fold and release the lock. reasoning_details and turns
+    aborted by a client disconnect are never returned for replay.
+
+    Returns:
+        Tuple of (summary text, list of role/content message dicts,
+        whether the session has any earlier turns at all)
+    """
+    keep_messages = max(1, (keep_turns or settings.CHAT_HISTORY_KEEP_TURNS) * 2)
+
+    summary_row = _summary_row(db, user_id, session_id)
+    rows = _unfolded_rows(db, user_id, session_id, summary_row)
+
+    if len(rows) > keep_messages:
+        summary_row = _lock_summary_row(db, user_id, session_id)
+        # Another request may have folded while this one waited for the lock.
+        rows = _unfolded_rows(db, user_id, session_id, summary_row)
+        if len(rows) > keep_messages:
+            overflow = rows[: len(rows) - keep_messages]
+            rows = rows[len(rows) - keep_messages:]
+            summary_row.summary = fold_summary(summary_row.summary, overflow, count_tokens)
+            summary_row.folded_messages = int(summary_row.folded_messages or 0) + len(overflow)
+            summary_row.folded_through_at = overflow[-1].timestamp
+            summary_row.folded_through_id = overflow[-1].id
+
+    has_history = bool(rows) or (summary_row is not None and summary_row.folded_through_at is not None)
+
+    # Aborted turns are folded past like any other but are never replayed.
+    messages = [{"role": _role_of(row), "content": row.message_content} for row in rows if not _is_aborted(row)]
+    summary = summary_row.summary if summary_row is not None else ""
+    return summary or "", messages, has_history
+
+
+def fit_history_window(
+    summary: str,
+    messages: List[Dict[str, Any]],
+    reserved_tokens: int,
+    count_tokens: Callable[[str], int],
+    budget_tokens: int = None,
+) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+    """
+    Trim replayed turns and summary, oldest first, to fit the prompt budget
+
+    Messages are kept or dropped as whole turns (a user message with the
+    replies that follow it), so the window never opens with a reply whose
+    question was cut. A turn too large for the remaining budget is skipped
+    and older turns may still fill it.
+
+    Returns:
+        Tuple of (summary text or None, messages that fit)
+    """
+    budget_tokens = budget_tokens or settings.CHAT_PROMPT_TOKEN_BUDGET
+    available = max(0, budget_tokens - reserved_tokens)
+
+    turns: List[List[Dict[str, Any]]] = []
+    for message in messages:
+        if message.get("role") == MessageRole.USER.value:
+            turns.append([message])
+        elif turns:
+            turns[-1].append(message)
+        # Replies before the first user message lost their question to the fold.
+
+    # Most recent turns have priority over the summary.
+    kept: List[List[Dict[str, Any]]] = []
+    for turn in reversed(turns):
+        cost = sum(count_tokens(str(message.get("content") or "")) + MESSAGE_OVERHEAD_TOKENS for message in turn)
+        if cost > available:
+            continue
+        kept.append(turn)
+        available -= cost
+    window = [message for turn in reversed(kept) for message in turn]
+
+    summary_text = None
+    if summary and available > MESSAGE_OVERHEAD_TOKENS:
+        lines = _cap_lines(summary.split("\n"), available - MESSAGE_OVERHEAD_TOKENS, count_tokens)
+        summary_text = "\n".join(lines) or None
+
+    return summary_text, window
@@ -0,0 +1,108 @@
+"""
+Content-addressed storage for retrieved context chunks referenced by queries
+"""
+import hashlib
+import json
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional
+
+from sqlalchemy.orm import Session
+
+from models.query import ContextChunk
+from services.write_behind import write_behind
+
+# Hashes this process has seen committed; skips re-sending popular chunks
+KNOWN_HASHES_MAX = 20000
+_known_hashes: "OrderedDict[str, None]" = OrderedDict()
+
+
+def _mark_known(digest: str) -> None:
+    _known_hashes[digest] = None
+    _known_hashes.move_to_end(digest)
+    if len(_known_hashes) > KNOWN_HASHES_MAX:
+        _known_hashes.popitem(last=False)
+
+
+def chunk_hash(content: str, metadata: Optional[Dict[str, Any]]) -> str:
+    """SHA-256 of the chunk text and its canonical metadata"""
+    payload = json.dumps(
+        {"content": content or "", "metadata": metadata or {}},
+        sort_keys=True,
+        default=str,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def store_context_chunks(context_chunks: List[Dict[str, Any]], key: Optional[Hashable] = None) -> List[Dict[str, Any]]:
+    """
+    Queue chunk bodies for content-addressed storage and return references
+
+    Args:
+        context_chunks: Pipeline context chunks (content, metadata, score, chunk_ids)
+        key: Write-behind barrier key shared with the referencing query row
+
+    Returns:
+        List of {hash, score, chunk_ids} references to store on the query
+    """
+    references = []
+    for chunk in context_chunks or []:
+        content = chunk.get("content") or ""
+        metadata = chunk.get("metadata") or {}
+        digest = chunk_hash(content, metadata)
+
+        if digest in _known_hashes:
+            _known_hashes.move_to_end(digest)
+        else:
+            # Only a committed row is known; a failed or dropped batch is sent again next time.
+            write_behind.enqueue(
+                ContextChunk,
+                {"content_hash": digest, "content": content, "chunk_metadata": metadata},
+                key=key,
+                ignore_conflicts=True,
+                on_written=lambda digest=digest: _mark_known(digest),
+            )
+
+        references.append({
+            "hash": digest,
+            "score": chunk.get("score"),
+            "chunk_ids": chunk.get("chunk_ids") or [metadata.get("chunk_id")],
+        })
+    return references
+
+
+def resolve_context_chunks(db: Session, references: Optional[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """
+    Expand stored references back into full context chunks
+
+    Rows written before references were introduced already hold full
+    chunks and are returned unchanged.
+
+    Args:
+        db: Database session
+        references: Value of a query's context_chunks column
+
+    Returns:
+        Context chunks with content, metadata, score and chunk_ids
+    """
+    references = references or []
+    hashes = [ref["hash"] for ref in references if isinstance(ref, dict) and "hash" in ref]
+    if not hashes:
+        return references
+
+    rows = db.query(ContextChunk).filter(ContextChunk.content_hash.in_(set(hashes))).all()
+    by_hash = {row.content_hash: row for row in rows}
+
+    resolved = []
+    for ref in references:
+        if not isinstance(ref, dict) or "hash" not in ref:
+            resolved.append(ref)
+            continue
+        row = by_hash.get(ref["hash"])
+        resolved.append({
+            "content": row.content if row else None,
+            "metadata": row.chunk_metadata if row else None,
+            "score": ref.get("score"),
+            "chunk_ids": ref.get("chunk_ids"),
+        })
+    return resolved
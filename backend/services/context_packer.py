@@ -0,0 +1,160 @@
+"""
+Context packer that merges overlapping chunks and fits them into a token budget
+"""
+import hashlib
+import re
+from typing import Any, Dict, List, Optional
+
+from config import settings
+from utils.tokens import count_tokens
+
+CHUNK_ID_PATTERN = re.compile(r"^(?P<doc>.+)_p(?P<page>[^_]+)_c(?P<index>\d+)$")
+
+# Shorter suffix/prefix matches are more likely coincidence than splitter overlap
+MIN_OVERLAP_CHARS = 8
+
+
+def _chunk_position(metadata: Dict[str, Any]) -> Optional[tuple]:
+    """Return (document, page, chunk index) parsed from the chunk_id, if any."""
+    match = CHUNK_ID_PATTERN.match(str(metadata.get("chunk_id") or ""))
+    if not match:
+        return None
+    return match.group("doc"), match.group("page"), int(match.group("index"))
+
+
+def _chunk_hash(member: Dict[str, Any]) -> str:
+    """Content hash recorded on the chunk at index time, or computed for older chunks."""
+    recorded = (member.get("metadata") or {}).get("chunk_hash")
+    if recorded:
+        return recorded
+    return hashlib.sha256((member.get("content") or "").encode("utf-8")).hexdigest()
+
+
+def _overlap_length(previous: str, following: str, max_overlap: int) -> int:
+    """Length of the longest suffix of previous that is also a prefix of following."""
+    limit = min(len(previous), len(following), max_overlap)
+    for size in range(limit, MIN_OVERLAP_CHARS - 1, -1):
+        if previous.endswith(following[:size]):
+            return size
+    return 0
+
+
+def merge_adjacent_chunks(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Merge consecutive chunks of the same page into single blocks
+
+    Args:
+        results: Search results (content, metadata, score) in relevance order
+
+    Returns:
+        Blocks in relevance order of their best member, each with merged
+        content, the first member's metadata, score, rank, chunk_ids and
+        chunk_hashes
+    """
+    max_overlap = settings.CHUNK_OVERLAP * 2
+    blocks: List[Dict[str, Any]] = []
+    runs: Dict[tuple, List[Dict[str, Any]]] = {}
+
+    for rank, result in enumerate(results):
+        metadata = result.get("metadata") or {}
+        position = _chunk_position(metadata)
+        member = {**result, "rank": rank, "position": position}
+        if position is None:
+            blocks.append(member)
+        else:
+            runs.setdefault(position[:2], []).append(member)
+
+    for members in runs.values():
+        members.sort(key=lambda item: item["position"][2])
+        current = None
+        for member in members:
+            if current is not None and member["position"][2] == current["position"][2] + 1:
+                previous_text = current["content"]
+                following_text = member.get("content") or ""
+                trim = _overlap_length(previous_text, following_text, max_overlap)
+                current["content"] = previous_text + following_text[trim:]
+                current["chunk_ids"].append(member["metadata"].get("chunk_id"))
+                current["chunk_hashes"].append(_chunk_hash(member))
+                if member["rank"] < current["rank"]:
+                    current["rank"] = member["rank"]
+                    current["score"] = member.get("score")
+                current["position"] = member["position"]
+                continue
+            if current is not None:
+                blocks.append(current)
+            current = {
+                **member,
+                "content": member.get("content") or "",
+                "chunk_ids": [member["metadata"].get("chunk_id")],
+                "chunk_hashes": [_chunk_hash(member)],
+            }
+        if current is not None:
+            blocks.append(current)
+
+    for block in blocks:
+        block.pop("position", None)
+        block.setdefault("chunk_ids", [block.get("metadata", {}).get("chunk_id")])
+        block.setdefault("chunk_hashes", [_chunk_hash(block)])
+
+    blocks.sort(key=lambda block: block["rank"])
+    return blocks
+
+
+def _truncate_to_budget(content: str, budget_tokens: int) -> str:
+    """Longest whole-word prefix of content that fits in budget_tokens."""
+    ends = [match.end() for match in re.finditer(r"\S+", content)]
+    low, high = 0, len(ends)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(content[:ends[middle - 1]]) <= budget_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return content[:ends[low - 1]] if low else ""
+
+
+def pack_context(
+    results: List[Dict[str, Any]],
+    budget_tokens: int = None,
+    overhead_tokens: int = 8
+) -> List[Dict[str, Any]]:
+    """
+    Merge adjacent chunks then greedily pack blocks into a token budget
+
+    Blocks are taken in relevance order. The most relevant block is cut to
+    the budget when it is too long on its own; after that, a block that does
+    not fit is skipped so a smaller, less relevant one can still use the
+    remaining budget.
+
+    Args:
+        results: Search results (content, metadata, score) in relevance order
+        budget_tokens: Maximum tokens of packed content
+        overhead_tokens: Tokens reserved per block for the source header
+
+    Returns:
+        Packed blocks, each with a token_count and whether it was truncated
+    """
+    if budget_tokens is None:
+        budget_tokens = settings.RAG_CONTEXT_TOKEN_BUDGET
+
+    packed = []
+    remaining = budget_tokens
+    for block in merge_adjacent_chunks(results):
+        content = (block.get("content") or "").strip()
+        if not content:
+            continue
+        cost = count_tokens(content) + overhead_tokens
+        truncated = False
+        if cost > remaining:
+            if packed:
+                continue
+            # Never drop the best match outright; keep as much of it as fits
+            content = _truncate_to_budget(content, remaining - overhead_tokens)
+            if not content:
+                continue
+            cost = count_tokens(content) + overhead_tokens
+            truncated = True
+        packed.append({**block, "content": content, "token_count": cost, "truncated": truncated})
+        remaining -= cost
+
+    return packed
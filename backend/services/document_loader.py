@@ -2,47 +2,71 @@
 Document loader service for extracting text from various file formats
 """
 import os
-from typing import List, Dict, Any
+from itertools import chain, islice
+from typing import Iterable, Iterator, List, Dict, Any, Optional, Tuple
 from pathlib import Path
 import docx
+import numpy as np
 import pandas as pd
+from openpyxl import load_workbook
 from pypdf import PdfReader
 from pptx import Presentation
+from config import settings
+
+try:
+    from python_calamine import CalamineWorkbook
+except ImportError:  # Fall back to openpyxl's (much slower) read-only reader
+    CalamineWorkbook = None
+
+# Bump whenever extracted text or page metadata changes, so cached
+# extractions (services/extraction_cache.py) from older code are ignored
+LOADER_VERSION = 2
+
+# Column separator in rendered spreadsheet rows
+CELL_SEPARATOR = " | "
 
 class DocumentLoader:
     """Service for loading and extracting text from documents"""
     
     @staticmethod
-    def load_pdf(file_path: str) -> List[Dict[str, Any]]:
+    def iter_pdf(file_path: str, start: int = 0, end: int = None) -> Iterator[Dict[str, Any]]:
         """
         Extract text from PDF file
         
-        Returns list of dicts with page_no and text
-        """
-        pages = []
+        Args:
+            file_path: Path to the PDF
+            start: Index of the first page to extract
+            end: Index one past the last page to extract (default: last page)
         
+        Yields dicts with page_no and text, one page at a time
+        """
         try:
             reader = PdfReader(file_path)
+            total_pages = len(reader.pages)
+            end = total_pages if end is None else min(end, total_pages)
             
-            for page_num, page in enumerate(reader.pages, start=1):
-                text = page.extract_text()
+            for page_num in range(start + 1, end + 1):
+                text = reader.pages[page_num - 1].extract_text()
                 
                 if text.strip():
-                    pages.append({
+                    yield {
                         "page_no": page_num,
                         "text": text,
                         "metadata": {
                             "source": os.path.basename(file_path),
                             "page": page_num,
-                            "total_pages": len(reader.pages)
+                            "total_pages": total_pages
                         }
-                    })
+                    }
             
-            return pages
-        
         except Exception as e:
             raise Exception(f"Error loading PDF: {str(e)}")
     
+    @staticmethod
+    def load_pdf(file_path: str, start: int = 0, end: int = None) -> List[Dict[str, Any]]:
+        """Extract text from PDF file as a list of page dicts"""
+        return list(DocumentLoader.iter_pdf(file_path, start, end))
+    
     @staticmethod
     def load_docx(file_path: str) -> List[Dict[str, Any]]:
         """
@@ -83,59 +107,239 @@ class DocumentLoader:
             raise Exception(f"Error loading DOCX: {str(e)}")
     
     @staticmethod
-    def load_xlsx(file_path: str) -> List[Dict[str, Any]]:
+    def _is_blank(value: Any) -> bool:
+        return value is None or (isinstance(value, float) and np.isnan(value)) or not str(value).strip()
+    
+    @staticmethod
+    def _render_rows(frame: pd.DataFrame) -> List[str]:
+        """Join each row's cells with CELL_SEPARATOR, column by column, skipping empty rows"""
+        if frame.empty:
+            return []
+        columns = []
+        for column in frame.columns:
+            values = frame[column]
+            if pd.api.types.is_float_dtype(values):
+                # Workbook readers return every number as a float; show 17.0 as 17.
+                # Past 2**53 floats are not exact integers (and soon overflow
+                # int64), so those keep their float text, e.g. 1e+20.
+                text = values.astype(str)
+                integral = values.notna() & (values.abs() < 2 ** 53) & (values % 1 == 0)
+                text[integral] = values[integral].astype("int64").astype(str)
+                text[values.isna()] = ""
+                columns.append(text)
+            else:
+                columns.append(values.fillna("").astype(str))
+        frame = pd.concat(columns, axis=1)
+        rendered = columns[0].str.cat(columns[1:], sep=CELL_SEPARATOR) if len(columns) > 1 else columns[0]
+        return rendered[frame.ne("").any(axis=1)].tolist()
+    
+    @staticmethod
+    def _iter_table_pages(
+        file_path: str,
+        title: str,
+        header: List[str],
+        row_batches: Iterable[pd.DataFrame],
+        first_page_no: int,
+        metadata: Dict[str, Any]
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Render batches of table rows as pages of up to SPREADSHEET_ROWS_PER_PAGE rows
+        
+        Each page repeats the table title and header so its chunks keep
+        their column context.
+        """
+        header_line = CELL_SEPARATOR.join(header)
+        page_no = first_page_no
+        row_start = 1
+        for batch in row_batches:
+            rows = DocumentLoader._render_rows(batch)
+            if not rows:
+                continue
+            row_end = row_start + len(rows) - 1
+            yield {
+                "page_no": page_no,
+                "text": "\n".join([f"{title} (rows {row_start}-{row_end})\n", header_line, "-" * 50, *rows]),
+                "metadata": {
+                    "source": os.path.basename(file_path),
+                    **metadata,
+                    "rows": len(rows),
+                    "columns": len(header),
+                    "row_start": row_start,
+                    "row_end": row_end
+                }
+            }
+            page_no += 1
+            row_start = row_end + 1
+    
+    @staticmethod
+    def _worksheet_batches(rows: Iterator[tuple], width: int, rows_per_page: int) -> Iterator[pd.DataFrame]:
+        while True:
+            batch = list(islice(rows, rows_per_page))
+            if not batch:
+                return
+            frame = pd.DataFrame.from_records(batch)
+            yield frame.iloc[:, :width] if width else frame
+    
+    @staticmethod
+    def _iter_sheets(file_path: str) -> Iterator[Tuple[str, Iterator[Any]]]:
+        """(sheet name, row iterator) for each sheet, reading the workbook once"""
+        if CalamineWorkbook is not None:
+            workbook = CalamineWorkbook.from_path(file_path)
+            for sheet_name in workbook.sheet_names:
+                yield sheet_name, iter(workbook.get_sheet_by_name(sheet_name).iter_rows())
+            return
+        
+        if Path(file_path).suffix.lower() == ".xls":
+            for sheet_name, df in pd.read_excel(file_path, sheet_name=None, header=None).items():
+                yield sheet_name, df.itertuples(index=False, name=None)
+            return
+        
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            for sheet in workbook.worksheets:
+                yield sheet.title, sheet.iter_rows(values_only=True)
+        finally:
+            workbook.close()
+    
+    @staticmethod
+    def iter_xlsx(file_path: str) -> Iterator[Dict[str, Any]]:
         """
-        Extract text from XLSX file
+        Extract text from an XLSX/XLS workbook
+        
+        The workbook is parsed once, streaming rows (python-calamine when
+        installed, otherwise openpyxl's read-only mode). The first non-empty
+        row of a sheet is its header; the remaining rows are rendered
+        SPREADSHEET_ROWS_PER_PAGE at a time, so a large sheet becomes
+        several pages.
         
-        Returns list with text from each sheet
+        Yields one page per row range, numbered across the whole workbook
         """
         try:
-            excel_file = pd.ExcelFile(file_path)
-            sheets_data = []
-            
-            for sheet_name in excel_file.sheet_names:
-                df = pd.read_excel(file_path, sheet_name=sheet_name)
-                
-                # Convert DataFrame to text representation
-                text_lines = [f"Sheet: {sheet_name}\n"]
-                
-                # Add column headers
-                text_lines.append(" | ".join(str(col) for col in df.columns))
-                text_lines.append("-" * 50)
-                
-                # Add rows
-                for _, row in df.iterrows():
-                    row_text = " | ".join(str(val) for val in row.values)
-                    text_lines.append(row_text)
-                
-                sheets_data.append({
-                    "page_no": len(sheets_data) + 1,
-                    "text": "\n".join(text_lines),
-                    "metadata": {
-                        "source": os.path.basename(file_path),
-                        "sheet_name": sheet_name,
-                        "rows": len(df),
-                        "columns": len(df.columns)
-                    }
-                })
+            rows_per_page = max(1, settings.SPREADSHEET_ROWS_PER_PAGE)
+            page_no = 1
+            for sheet_name, rows in DocumentLoader._iter_sheets(file_path):
+                header_row: Optional[tuple] = next(
+                    (row for row in rows if any(not DocumentLoader._is_blank(value) for value in row)),
+                    None
+                )
+                if header_row is None:
+                    continue
+                header = ["" if DocumentLoader._is_blank(value) else str(value) for value in header_row]
+                for page in DocumentLoader._iter_table_pages(
+                    file_path,
+                    f"Sheet: {sheet_name}",
+                    header,
+                    DocumentLoader._worksheet_batches(rows, len(header), rows_per_page),
+                    page_no,
+                    {"sheet_name": sheet_name}
+                ):
+                    page_no = page["page_no"] + 1
+                    yield page
             
-            return sheets_data
-        
         except Exception as e:
             raise Exception(f"Error loading XLSX: {str(e)}")
     
     @staticmethod
-    def load_pptx(file_path: str) -> List[Dict[str, Any]]:
+    def load_xlsx(file_path: str) -> List[Dict[str, Any]]:
+        """Extract text from an XLSX workbook as a list of page dicts"""
+        return list(DocumentLoader.iter_xlsx(file_path))
+    
+    @staticmethod
+    def iter_csv(file_path: str) -> Iterator[Dict[str, Any]]:
+        """
+        Extract text from a CSV file
+        
+        Read with pandas' C parser SPREADSHEET_ROWS_PER_PAGE rows at a
+        time; the first row is the header.
+        
+        Yields one page per row range
+        """
+        try:
+            reader = pd.read_csv(
+                file_path,
+                dtype=str,
+                keep_default_na=False,
+                chunksize=max(1, settings.SPREADSHEET_ROWS_PER_PAGE),
+                encoding_errors="replace",
+                on_bad_lines="skip"
+            )
+            with reader:
+                first = next(reader, None)
+                if first is None:
+                    return
+                header = [str(column) for column in first.columns]
+                yield from DocumentLoader._iter_table_pages(
+                    file_path,
+                    f"Table: {os.path.basename(file_path)}",
+                    header,
+                    chain([first], reader),
+                    1,
+                    {}
+                )
+        except pd.errors.EmptyDataError:
+            return
+        except Exception as e:
+            raise Exception(f"Error loading CSV: {str(e)}")
+    
+    @staticmethod
+    def iter_txt(file_path: str) -> Iterator[Dict[str, Any]]:
+        """
+        Extract text from a plain text file
+        
+        Lines are streamed and grouped into pages of about TEXT_PAGE_CHARS
+        characters, so a large file is never held in memory at once.
+        """
+        try:
+            page_chars = max(1, settings.TEXT_PAGE_CHARS)
+            page_no = 1
+            lines: List[str] = []
+            size = 0
+            with open(file_path, "r", encoding="utf-8", errors="replace") as f:
+                for line in f:
+                    lines.append(line)
+                    size += len(line)
+                    if size >= page_chars:
+                        text = "".join(lines)
+                        if text.strip():
+                            yield DocumentLoader._text_page(file_path, page_no, text)
+                            page_no += 1
+                        lines, size = [], 0
+            text = "".join(lines)
+            if text.strip():
+                yield DocumentLoader._text_page(file_path, page_no, text)
+        except Exception as e:
+            raise Exception(f"Error loading TXT: {str(e)}")
+    
+    @staticmethod
+    def _text_page(file_path: str, page_no: int, text: str) -> Dict[str, Any]:
+        return {
+            "page_no": page_no,
+            "text": text,
+            "metadata": {
+                "source": os.path.basename(file_path),
+                "page": page_no
+            }
+        }
+    
+    @staticmethod
+    def iter_pptx(file_path: str, start: int = 0, end: int = None) -> Iterator[Dict[str, Any]]:
         """
         Extract text from PPTX file
         
-        Returns list with text from each slide
+        Args:
+            file_path: Path to the presentation
+            start: Index of the first slide to extract
+            end: Index one past the last slide to extract (default: last slide)
+        
+        Yields text from each slide, one slide at a time
         """
         try:
             prs = Presentation(file_path)
-            slides_data = []
+            slides = list(prs.slides)
+            end = len(slides) if end is None else min(end, len(slides))
             
-            for slide_num, slide in enumerate(prs.slides, start=1):
+            for slide_num in range(start + 1, end + 1):
+                slide = slides[slide_num - 1]
                 text_parts = []
                 
                 # Extract text from all shapes
@@ -144,37 +348,84 @@ class DocumentLoader:
                         text_parts.append(shape.text)
                 
                 if text_parts:
-                    slides_data.append({
+                    yield {
                         "page_no": slide_num,
                         "text": "\n".join(text_parts),
                         "metadata": {
                             "source": os.path.basename(file_path),
                             "slide_number": slide_num,
-                            "total_slides": len(prs.slides)
+                            "total_slides": len(slides)
                         }
-                    })
+                    }
             
-            return slides_data
-        
         except Exception as e:
             raise Exception(f"Error loading PPTX: {str(e)}")
     
+    @staticmethod
+    def load_pptx(file_path: str, start: int = 0, end: int = None) -> List[Dict[str, Any]]:
+        """Extract text from PPTX file as a list of slide dicts"""
+        return list(DocumentLoader.iter_pptx(file_path, start, end))
+    
+    @staticmethod
+    def count_units(file_path: str) -> int:
+        """
+        Number of independently extractable units in a file
+        
+        Pages for PDF, slides for PPTX; formats that cannot be split,
+        including workbooks (parsed once, in a single pass), count as a
+        single unit.
+        """
+        file_ext = Path(file_path).suffix.lower()
+        
+        if file_ext == ".pdf":
+            return len(PdfReader(file_path).pages)
+        elif file_ext == ".pptx":
+            return len(Presentation(file_path).slides)
+        return 1
+    
     @classmethod
-    def load_document(cls, file_path: str) -> List[Dict[str, Any]]:
+    def load_range(cls, file_path: str, start: int, end: int) -> List[Dict[str, Any]]:
+        """Extract units [start, end) of a splittable file (see count_units)"""
+        file_ext = Path(file_path).suffix.lower()
+        
+        if file_ext == ".pdf":
+            return cls.load_pdf(file_path, start, end)
+        elif file_ext == ".pptx":
+            return cls.load_pptx(file_path, start, end)
+        return cls.load_document(file_path)
+    
+    @classmethod
+    def iter_document(cls, file_path: str) -> Iterator[Dict[str, Any]]:
         """
-        Load document based on file extension
+        Lazily extract a document based on file extension
         
-        Returns list of dicts with extracted text and metadata
+        PDF pages, PPTX slides, spreadsheet row ranges and plain text
+        blocks are read one at a time so callers can process a large file
+        without holding all of its text; DOCX has no page structure and is
+        yielded as a single page.
         """
         file_ext = Path(file_path).suffix.lower()
         
         if file_ext == ".pdf":
-            return cls.load_pdf(file_path)
+            return cls.iter_pdf(file_path)
         elif file_ext == ".docx":
-            return cls.load_docx(file_path)
+            return iter(cls.load_docx(file_path))
         elif file_ext in [".xlsx", ".xls"]:
-            return cls.load_xlsx(file_path)
+            return cls.iter_xlsx(file_path)
+        elif file_ext == ".csv":
+            return cls.iter_csv(file_path)
+        elif file_ext == ".txt":
+            return cls.iter_txt(file_path)
         elif file_ext == ".pptx":
-            return cls.load_pptx(file_path)
+            return cls.iter_pptx(file_path)
         else:
             raise ValueError(f"Unsupported file format: {file_ext}")
+    
+    @classmethod
+    def load_document(cls, file_path: str) -> List[Dict[str, Any]]:
+        """
+        Load document based on file extension
+        
+        Returns list of dicts with extracted text and metadata
+        """
+        return list(cls.iter_document(file_path))
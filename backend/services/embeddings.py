@@ -2,15 +2,42 @@
 Embedding service for generating and managing vector embeddings
 """
 import os
+import re
+import json
 import pickle
 import hashlib
-from typing import List, Dict, Any
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 import numpy as np
 from langchain_openai import OpenAIEmbeddings
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import FAISS
 from langchain_core.documents import Document as LangchainDocument
 from config import settings
+from services.answer_cache import answer_cache
+
+# Metadata fields a chat subject filter is matched against
+SUBJECT_KEY_FIELDS = ("subject", "course_name", "course_code", "title", "source")
+
+
+def subject_key_tokens(metadata: Dict[str, Any]) -> List[str]:
+    """Normalized, tokenized subject keys for a chunk's metadata (stored at index time)"""
+    tokens = set()
+    for field in SUBJECT_KEY_FIELDS:
+        value = str(metadata.get(field) or "").strip().lower()
+        tokens.update(token for token in re.split(r"\W+", value) if token)
+    return sorted(tokens)
+
+
+def content_hash(text: str) -> str:
+    """SHA256 of chunk or page text, recorded on chunks to detect edits on reindex"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def subject_query_tokens(subject: Optional[str]) -> Set[str]:
+    """Tokens a selected subject must all match; short tokens are ignored when longer ones exist"""
+    tokens = [token for token in re.split(r"\W+", str(subject or "").strip().lower()) if token]
+    significant = {token for token in tokens if len(token) > 2}
+    return significant or set(tokens)
 
 
 class LocalDeterministicEmbeddings:
@@ -59,12 +86,30 @@ class EmbeddingService:
         )
         
         self.vector_store = self._load_or_create_vector_store()
+        
+        # Subject key token -> ids of documents whose chunks carry it
+        self.subject_index: Dict[str, Set[str]] = self._load_subject_index()
+    
+    def _subject_index_path(self) -> str:
+        return os.path.join(settings.FAISS_INDEX_PATH, "subject_index.json")
+    
+    def _load_subject_index(self) -> Dict[str, Set[str]]:
+        """Load the subject inverted index saved next to the vector store"""
+        try:
+            with open(self._subject_index_path(), "r", encoding="utf-8") as f:
+                return {token: set(doc_ids) for token, doc_ids in json.load(f).items()}
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            print(f"Error loading subject index: {e}. Starting empty.")
+            return {}
     
     def _load_or_create_vector_store(self) -> FAISS:
         """Load existing vector store or create new one"""
         index_path = settings.FAISS_INDEX_PATH
         
-        if os.path.exists(index_path) and os.path.exists(f"{index_path}.pkl"):
+        # save_local writes index.faiss and index.pkl inside the index folder
+        if os.path.exists(os.path.join(index_path, "index.faiss")) and os.path.exists(os.path.join(index_path, "index.pkl")):
             try:
                 # Load existing vector store
                 vector_store = FAISS.load_local(
@@ -87,18 +132,94 @@ class EmbeddingService:
         """Save vector store to disk"""
         try:
             self.vector_store.save_local(settings.FAISS_INDEX_PATH)
+            with open(self._subject_index_path(), "w", encoding="utf-8") as f:
+                json.dump({token: sorted(doc_ids) for token, doc_ids in self.subject_index.items()}, f)
         except Exception as e:
             print(f"Error saving vector store: {e}")
     
-    def index_document(
+    def reload(self):
+        """Re-read the vector store and subject index saved on disk"""
+        self.vector_store = self._load_or_create_vector_store()
+        self.subject_index = self._load_subject_index()
+    
+    def _chunk_page(
+        self,
+        document_id: int,
+        page: Dict[str, Any],
+        metadata: Dict[str, Any],
+        college_id: str = None
+    ) -> Tuple[List[LangchainDocument], List[str]]:
+        """Split one extracted page into chunks; returns (chunks, subject keys)"""
+        text = page.get("text", "")
+        page_metadata = page.get("metadata", {})
+        
+        if not text.strip():
+            return [], []
+        
+        # Split text into chunks
+        chunks = self.text_splitter.split_text(text)
+        
+        # Subject keys are computed once per page rather than per chunk at query time
+        subject_keys = subject_key_tokens({**metadata, **page_metadata})
+        page_hash = content_hash(text)
+        
+        # Create Langchain documents with metadata
+        documents = []
+        for i, chunk in enumerate(chunks):
+            chunk_metadata = {
+                **metadata,
+                **page_metadata,
+                "document_id": str(document_id),
+                "page_no": page.get("page_no", 1),
+                "chunk_id": f"{document_id}_p{page.get('page_no', 1)}_c{i}",
+                "college_id": college_id if college_id is not None else metadata.get("college_id"),
+                "subject_keys": subject_keys,
+                "page_hash": page_hash,
+                "chunk_hash": content_hash(chunk)
+            }
+            
+            documents.append(LangchainDocument(
+                page_content=chunk,
+                metadata=chunk_metadata
+            ))
+        
+        return documents, subject_keys
+    
+    def iter_chunks(
+        self,
+        document_id: int,
+        pages: Iterable[Dict[str, Any]],
+        metadata: Dict[str, Any],
+        college_id: str = None,
+        subject_keys: Set[str] = None
+    ) -> Iterator[LangchainDocument]:
+        """
+        Lazily chunk pages as they arrive
+        
+        Args:
+            document_id: Database document ID
+            pages: Iterable of page dicts (may be a generator)
+            metadata: Additional document metadata
+            subject_keys: Set collecting the subject key tokens seen so far
+        
+        Yields:
+            Chunks in page order
+        """
+        for page in pages:
+            chunks, page_subject_keys = self._chunk_page(document_id, page, metadata, college_id)
+            if subject_keys is not None:
+                subject_keys.update(page_subject_keys)
+            yield from chunks
+    
+    def chunk_pages(
         self,
         document_id: int,
         pages: List[Dict[str, Any]],
         metadata: Dict[str, Any],
         college_id: str = None
-    ) -> int:
+    ) -> Tuple[List[LangchainDocument], Set[str]]:
         """
-        Index a document by chunking text and generating embeddings
+        Split extracted pages into chunks carrying document metadata
         
         Args:
             document_id: Database document ID
@@ -106,48 +227,266 @@ class EmbeddingService:
             metadata: Additional document metadata
         
         Returns:
-            Number of chunks indexed
+            Tuple of (chunks, subject key tokens for the whole document)
         """
-        all_chunks = []
-        
-        # Process each page
-        for page in pages:
-            text = page.get("text", "")
-            page_metadata = page.get("metadata", {})
-            
-            if not text.strip():
-                continue
-            
-            # Split text into chunks
-            chunks = self.text_splitter.split_text(text)
-            
-            # Create Langchain documents with metadata
-            for i, chunk in enumerate(chunks):
-                chunk_metadata = {
-                    **metadata,
-                    **page_metadata,
-                    "document_id": document_id,
-                    "page_no": page.get("page_no", 1),
-                    "chunk_id": f"{document_id}_p{page.get('page_no', 1)}_c{i}",
-                    "college_id": college_id if college_id is not None else metadata.get("college_id")
-                }
-                
-                doc = LangchainDocument(
-                    page_content=chunk,
-                    metadata=chunk_metadata
-                )
-                all_chunks.append(doc)
+        document_subject_keys = set()
+        all_chunks = list(self.iter_chunks(document_id, pages, metadata, college_id, document_subject_keys))
         
         if not all_chunks:
             raise ValueError("No valid text chunks found in document")
         
-        # Add to vector store
-        self.vector_store.add_documents(all_chunks)
+        return all_chunks, document_subject_keys
+    
+    def embed_chunks(self, chunks: List[LangchainDocument]) -> List[List[float]]:
+        """Embed chunk texts in one batched embeddings call"""
+        return self.embeddings.embed_documents([chunk.page_content for chunk in chunks])
+    
+    def add_embedded_chunks(
+        self,
+        document_id: int,
+        chunks: List[LangchainDocument],
+        vectors: List[List[float]],
+        subject_keys: Set[str]
+    ) -> int:
+        """
+        Add pre-embedded chunks to the vector store and save it
+        
+        Returns:
+            Number of chunks added
+        """
+        # Answers generated from the previous version of this document are stale
+        answer_cache.invalidate_document(document_id)
+        
+        self.vector_store.add_embeddings(
+            text_embeddings=[(chunk.page_content, vector) for chunk, vector in zip(chunks, vectors)],
+            metadatas=[chunk.metadata for chunk in chunks]
+        )
+        document_key = str(document_id)
+        for token in subject_keys:
+            self.subject_index.setdefault(token, set()).add(document_key)
         
         # Save to disk
         self._save_vector_store()
         
-        return len(all_chunks)
+        return len(chunks)
+    
+    def _document_chunks(self, document_id) -> Dict[str, List[Tuple[int, str]]]:
+        """Indexed chunks of a document as chunk_hash -> [(index position, docstore id)]"""
+        document_key = str(document_id)
+        store = self.vector_store
+        chunks: Dict[str, List[Tuple[int, str]]] = {}
+        for position, docstore_id in store.index_to_docstore_id.items():
+            doc = store.docstore.search(docstore_id)
+            if not isinstance(doc, LangchainDocument) or str(doc.metadata.get("document_id")) != document_key:
+                continue
+            chunk_hash = doc.metadata.get("chunk_hash") or content_hash(doc.page_content)
+            chunks.setdefault(chunk_hash, []).append((position, docstore_id))
+        return chunks
+    
+    def document_chunk_ids(self, document_id) -> Dict[str, List[str]]:
+        """
+        Indexed chunks of a document, grouped by chunk text hash
+        
+        Chunks indexed before hashes were recorded are hashed from their text.
+        
+        Returns:
+            Mapping of chunk_hash to the docstore ids holding that text
+        """
+        return {
+            chunk_hash: [docstore_id for _, docstore_id in entries]
+            for chunk_hash, entries in self._document_chunks(document_id).items()
+        }
+    
+    def sync_document_chunks(
+        self,
+        document_id,
+        batches: Iterable[Tuple[List[LangchainDocument], Dict[str, np.ndarray]]],
+        subject_keys: Set[str]
+    ) -> Dict[str, int]:
+        """
+        Make a document's indexed chunks match a fresh chunking of it
+        
+        Batches are applied as they are read, so the caller never has to
+        hold the whole document. Chunks whose text is already indexed keep
+        their vector and only have their metadata (page number, chunk id)
+        refreshed; new text is added with the batch's vectors, and indexed
+        chunks whose text no longer appears are deleted once every batch is
+        in. Repeated text reuses the vector already in the index; text with
+        no vector anywhere (e.g. a chunk removed by a concurrent writer
+        since the caller checked) is embedded here.
+        
+        Args:
+            document_id: Database document ID
+            batches: (chunks, vectors for their new text keyed by chunk_hash)
+                pairs covering the document's current content in order
+            subject_keys: Subject key tokens of the whole document (read
+                after the last batch, so it may still be filling up)
+        
+        Returns:
+            Dict with total chunks, and how many were kept, added and removed
+        """
+        store = self.vector_store
+        existing = self._document_chunks(document_id)
+        # chunk_hash -> index position of a vector for that text
+        positions = {chunk_hash: entries[0][0] for chunk_hash, entries in existing.items()}
+        
+        total = kept = added = 0
+        for chunks, vectors in batches:
+            total += len(chunks)
+            new_chunks: List[LangchainDocument] = []
+            for chunk in chunks:
+                reusable = existing.get(chunk.metadata["chunk_hash"])
+                if reusable:
+                    _, docstore_id = reusable.pop()
+                    store.docstore.delete([docstore_id])
+                    store.docstore.add({docstore_id: chunk})
+                    kept += 1
+                else:
+                    new_chunks.append(chunk)
+            if not new_chunks:
+                continue
+            
+            new_vectors = []
+            missing = []
+            for chunk in new_chunks:
+                chunk_hash = chunk.metadata["chunk_hash"]
+                if chunk_hash in vectors:
+                    new_vectors.append(vectors[chunk_hash])
+                elif chunk_hash in positions:
+                    new_vectors.append(store.index.reconstruct(int(positions[chunk_hash])))
+                else:
+                    new_vectors.append(None)
+                    missing.append(len(new_vectors) - 1)
+            if missing:
+                for slot, vector in zip(missing, self.embed_chunks([new_chunks[slot] for slot in missing])):
+                    new_vectors[slot] = vector
+            
+            first_position = store.index.ntotal
+            store.add_embeddings(
+                text_embeddings=[(chunk.page_content, vector) for chunk, vector in zip(new_chunks, new_vectors)],
+                metadatas=[chunk.metadata for chunk in new_chunks]
+            )
+            for offset, chunk in enumerate(new_chunks):
+                positions.setdefault(chunk.metadata["chunk_hash"], first_position + offset)
+            added += len(new_chunks)
+        
+        stale = [docstore_id for entries in existing.values() for _, docstore_id in entries]
+        if added or stale:
+            # Answers generated from the previous version of this document are stale
+            answer_cache.invalidate_document(document_id)
+        if stale:
+            store.delete(stale)
+        document_key = str(document_id)
+        for token in subject_keys:
+            self.subject_index.setdefault(token, set()).add(document_key)
+        
+        self._save_vector_store()
+        
+        return {"chunks": total, "kept": kept, "added": added, "removed": len(stale)}
+    
+    def clone_document_chunks(
+        self,
+        source_document_id,
+        target_document_id,
+        metadata: Dict[str, Any],
+        college_id: str = None
+    ) -> int:
+        """
+        Index a duplicate upload by reusing another document's chunk vectors
+        
+        Retrieval filters on per-chunk metadata (uploader, subject, course),
+        so the duplicate gets its own chunk entries carrying its metadata,
+        but their vectors are copied out of the FAISS index instead of being
+        re-extracted and re-embedded.
+        
+        Args:
+            source_document_id: Already indexed document with identical content
+            target_document_id: Duplicate upload to index
+            metadata: The duplicate's document metadata
+        
+        Returns:
+            Number of chunks added (0 when the source has no chunks)
+        """
+        source_key = str(source_document_id)
+        target_key = str(target_document_id)
+        store = self.vector_store
+        
+        positions = []
+        chunks = []
+        subject_keys = set()
+        for position, docstore_id in store.index_to_docstore_id.items():
+            doc = store.docstore.search(docstore_id)
+            if not isinstance(doc, LangchainDocument) or str(doc.metadata.get("document_id")) != source_key:
+                continue
+            chunk_metadata = {
+                **doc.metadata,
+                **metadata,
+                "document_id": target_key,
+                "chunk_id": str(doc.metadata.get("chunk_id", "")).replace(f"{source_key}_", f"{target_key}_", 1),
+                "college_id": college_id if college_id is not None else metadata.get("college_id"),
+            }
+            chunk_metadata["subject_keys"] = subject_key_tokens(chunk_metadata)
+            subject_keys.update(chunk_metadata["subject_keys"])
+            positions.append(position)
+            chunks.append(LangchainDocument(page_content=doc.page_content, metadata=chunk_metadata))
+        
+        if not chunks:
+            return 0
+        
+        vectors = np.vstack([store.index.reconstruct(int(position)) for position in positions])
+        return self.add_embedded_chunks(target_document_id, chunks, vectors, subject_keys)
+    
+    def index_document(
+        self,
+        document_id: int,
+        pages: Iterable[Dict[str, Any]],
+        metadata: Dict[str, Any],
+        college_id: str = None,
+        batch_size: int = None
+    ) -> int:
+        """
+        Index a document by chunking text and generating embeddings
+        
+        Pages are consumed lazily and synced in fixed-size batches, so only
+        one batch of chunks and vectors is held at a time; text that is
+        already indexed for the document keeps its vector.
+        
+        Args:
+            document_id: Database document ID
+            pages: Page dicts with text and metadata (list or generator)
+            metadata: Additional document metadata
+            batch_size: Chunks per embeddings call
+        
+        Returns:
+            Number of chunks indexed
+        """
+        batch_size = batch_size or settings.EMBEDDING_BATCH_SIZE
+        subject_keys = set()
+        chunks = self.iter_chunks(document_id, pages, metadata, college_id, subject_keys)
+        
+        def batches() -> Iterator[Tuple[List[LangchainDocument], Dict[str, np.ndarray]]]:
+            batch = []
+            for chunk in chunks:
+                batch.append(chunk)
+                if len(batch) >= batch_size:
+                    yield batch, {}
+                    batch = []
+            if batch:
+                yield batch, {}
+        
+        result = self.sync_document_chunks(document_id, batches(), subject_keys)
+        if not result["chunks"]:
+            raise ValueError("No valid text chunks found in document")
+        return result["chunks"]
+    
+    def documents_for_subject(self, tokens: Set[str]) -> Set[str]:
+        """Ids of indexed documents whose subject keys contain every token"""
+        if not tokens:
+            return set()
+        
+        postings = [self.subject_index.get(token, set()) for token in tokens]
+        postings.sort(key=len)
+        return set.intersection(*postings) if postings[0] else set()
     
     def similarity_search(
         self,
@@ -189,15 +528,90 @@ class EmbeddingService:
         
         return results
     
+    def embed_query(self, query: str) -> List[float]:
+        """Embed a query once so it can be reused across several searches"""
+        return self.embeddings.embed_query(query)
+
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """Embed many queries in one batched embeddings call"""
+        if not queries:
+            return []
+        return self.embeddings.embed_documents(queries)
+
+    def similarity_search_batch(
+        self,
+        embeddings: List[List[float]],
+        k: int = None,
+        filter_dict: Dict[str, Any] = None,
+        fetch_k: int = 20
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Search many query embeddings with a single FAISS index call
+
+        Mirrors similarity_search_with_score_by_vector: when a filter is set,
+        fetch_k neighbours are fetched per query and filtered by metadata.
+
+        Args:
+            embeddings: Query embeddings
+            k: Number of results per query
+            filter_dict: Metadata filters (subject, document_type, etc.)
+            fetch_k: Neighbours fetched per query before filtering
+
+        Returns:
+            One result list (content, metadata, score) per embedding, in order
+        """
+        if not embeddings:
+            return []
+        if k is None:
+            k = settings.TOP_K_RESULTS
+
+        vectors = np.array(embeddings, dtype=np.float32)
+        if getattr(self.vector_store, "_normalize_L2", False):
+            import faiss
+            faiss.normalize_L2(vectors)
+
+        search_k = max(k, fetch_k) if filter_dict else k
+        scores, indices = self.vector_store.index.search(vectors, search_k)
+        filter_func = self.vector_store._create_filter_func(filter_dict) if filter_dict else None
+
+        batch_results = []
+        for row_scores, row_indices in zip(scores, indices):
+            results = []
+            for score, index in zip(row_scores, row_indices):
+                if index == -1:
+                    continue
+                doc = self.vector_store.docstore.search(self.vector_store.index_to_docstore_id[index])
+                if not isinstance(doc, LangchainDocument):
+                    continue
+                if filter_func is not None and not filter_func(doc.metadata):
+                    continue
+                results.append({
+                    "content": doc.page_content,
+                    "metadata": doc.metadata,
+                    "score": float(score)
+                })
+                if len(results) >= k:
+                    break
+            batch_results.append(results)
+
+        return batch_results
+
     def similarity_search_with_score(
         self,
         query: str,
         k: int = None,
-        filter_dict: Dict[str, Any] = None
+        filter_dict: Dict[str, Any] = None,
+        embedding: Optional[List[float]] = None
     ) -> List[tuple]:
         """
         Perform similarity search with relevance scores
         
+        Args:
+            query: Search query
+            k: Number of results to return
+            filter_dict: Metadata filters (subject, document_type, etc.)
+            embedding: Precomputed query embedding; skips re-embedding the query
+        
         Returns:
             List of tuples (document, score)
         """
@@ -205,11 +619,20 @@ class EmbeddingService:
             k = settings.TOP_K_RESULTS
         
         # Perform search with scores
-        docs_with_scores = self.vector_store.similarity_search_with_score(
-            query,
-            k=k,
-            filter=filter_dict
-        ) if filter_dict else self.vector_store.similarity_search_with_score(query, k=k)
+        if embedding is not None:
+            docs_with_scores = self.vector_store.similarity_search_with_score_by_vector(
+                embedding,
+                k=k,
+                filter=filter_dict or None
+            )
+        elif filter_dict:
+            docs_with_scores = self.vector_store.similarity_search_with_score(
+                query,
+                k=k,
+                filter=filter_dict
+            )
+        else:
+            docs_with_scores = self.vector_store.similarity_search_with_score(query, k=k)
         
         # Format results
         results = []
@@ -230,7 +653,7 @@ class EmbeddingService:
         """
         # This is a placeholder - FAISS doesn't support efficient deletion
         # In production, consider using a vector DB with deletion support
-        pass
+        answer_cache.invalidate_document(document_id)
     
     def get_stats(self) -> Dict[str, Any]:
         """Get vector store statistics"""
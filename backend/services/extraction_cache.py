@@ -0,0 +1,174 @@
+"""
+Persistent cache of extracted document text keyed by file content hash
+"""
+import gzip
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterator, List, Optional
+
+from config import settings
+from services.document_loader import LOADER_VERSION
+from services.extraction_pool import extraction_pool
+from utils.helpers import generate_file_hash
+
+# Other processes write to the same directory; recount it at least this often
+RESCAN_SECONDS = 300.0
+
+
+class ExtractionCache:
+    """
+    Store each file's extracted pages once and replay them for every consumer
+
+    Entries are gzip-compressed JSON lines, one page per line, named by the
+    file's SHA256 and LOADER_VERSION, so identical content uploaded under
+    different names shares an entry and a loader change invalidates them
+    all. A miss streams pages from the extraction pool to the caller while
+    writing them to a temporary file that is renamed into place only when
+    extraction finishes; a failed or abandoned extraction leaves no entry.
+    Hits are read lazily and never touch a parser. When the directory grows
+    past max_mb, the least recently used entries are removed. The size is
+    kept as a running total of the entries this process writes, so the
+    directory is only walked when that total passes max_mb or at least
+    RESCAN_SECONDS have passed since the last walk.
+    """
+
+    def __init__(self, directory: str = None, max_mb: int = None, enabled: bool = None):
+        self.directory = directory or settings.EXTRACTION_CACHE_PATH
+        self.max_bytes = (settings.EXTRACTION_CACHE_MAX_MB if max_mb is None else max_mb) * 1024 * 1024
+        self.enabled = settings.EXTRACTION_CACHE_ENABLED if enabled is None else enabled
+        self._lock = threading.Lock()
+        self._evict_lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        # Bytes in the directory as of the last walk plus entries written since
+        self._size: Optional[int] = None
+        self._scanned_at = 0.0
+
+    def _entry_path(self, content_hash: str) -> str:
+        return os.path.join(self.directory, content_hash[:2], f"{content_hash}.v{LOADER_VERSION}.jsonl.gz")
+
+    def _read(self, entry_path: str, file_path: str) -> Iterator[Dict[str, Any]]:
+        # Mark as recently used for eviction
+        os.utime(entry_path)
+        with gzip.open(entry_path, "rt", encoding="utf-8") as f:
+            for line in f:
+                page = json.loads(line)
+                if "source" in page.get("metadata", {}):
+                    # The same content may have been cached under another file name
+                    page["metadata"]["source"] = os.path.basename(file_path)
+                yield page
+
+    def _extract_and_store(self, entry_path: str, file_path: str) -> Iterator[Dict[str, Any]]:
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        temp_path = f"{entry_path}.{uuid.uuid4().hex}.part"
+        completed = False
+        try:
+            with gzip.open(temp_path, "wt", encoding="utf-8") as f:
+                for page in extraction_pool.iter_document(file_path):
+                    f.write(json.dumps(page, default=str) + "\n")
+                    yield page
+            os.replace(temp_path, entry_path)
+            completed = True
+        finally:
+            if not completed and os.path.exists(temp_path):
+                os.remove(temp_path)
+        self._record(entry_path)
+
+    def iter_document(self, file_path: str, content_hash: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """
+        A file's pages, from the cache when its content was extracted before
+
+        Args:
+            file_path: File to extract
+            content_hash: SHA256 of the file if already known (computed otherwise)
+
+        Yields:
+            Same page dicts as DocumentLoader.iter_document
+        """
+        if not self.enabled:
+            yield from extraction_pool.iter_document(file_path)
+            return
+
+        entry_path = self._entry_path(content_hash or generate_file_hash(file_path))
+        if os.path.exists(entry_path):
+            with self._lock:
+                self._hits += 1
+            yield from self._read(entry_path, file_path)
+            return
+
+        with self._lock:
+            self._misses += 1
+        yield from self._extract_and_store(entry_path, file_path)
+
+    def load_document(self, file_path: str, content_hash: Optional[str] = None) -> List[Dict[str, Any]]:
+        """All of a file's pages, in order (see iter_document)"""
+        return list(self.iter_document(file_path, content_hash))
+
+    def _record(self, entry_path: str) -> None:
+        """Add a new entry to the running size and evict when over budget"""
+        if self.max_bytes <= 0:
+            return
+        try:
+            size = os.path.getsize(entry_path)
+        except FileNotFoundError:
+            return
+        with self._lock:
+            if self._size is not None:
+                self._size += size
+            due = (
+                self._size is None
+                or self._size > self.max_bytes
+                or time.monotonic() - self._scanned_at >= RESCAN_SECONDS
+            )
+        if due:
+            self._evict()
+
+    def _evict(self) -> None:
+        """Remove least recently used entries until the cache fits in max_bytes"""
+        if self.max_bytes <= 0:
+            return
+        # One walk at a time; a concurrent caller's walk covers this entry too
+        if not self._evict_lock.acquire(blocking=False):
+            return
+        try:
+            entries = []
+            total = 0
+            for root, _, files in os.walk(self.directory):
+                for name in files:
+                    if not name.endswith(".jsonl.gz"):
+                        continue
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+                    total += stat.st_size
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+            with self._lock:
+                self._size = total
+                self._scanned_at = time.monotonic()
+        finally:
+            self._evict_lock.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "hits": self._hits,
+            "misses": self._misses,
+            "size_bytes": self._size,
+        }
+
+
+# Shared cache used by ingestion workers and question paper analysis
+extraction_cache = ExtractionCache()
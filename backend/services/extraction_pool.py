@@ -0,0 +1,169 @@
+"""
+Process-pool text extraction with per-file timeouts and memory limits
+"""
+import multiprocessing
+import threading
+import time
+from typing import Any, Dict, Iterator, List
+
+from config import settings
+from services.document_loader import DocumentLoader
+
+try:
+    import resource
+except ImportError:  # Windows: no per-process address-space limit
+    resource = None
+
+
+class ExtractionTimeout(Exception):
+    """Raised when a file takes longer than the extraction timeout"""
+
+
+class ExtractionPoolRestarted(Exception):
+    """Raised when the pool was torn down while a file was being extracted"""
+
+
+def _limit_worker_memory(limit_bytes: int) -> None:
+    if resource is not None and limit_bytes > 0:
+        resource.setrlimit(resource.RLIMIT_AS, (limit_bytes, limit_bytes))
+
+
+class ExtractionPool:
+    """
+    Extract document text on a pool of worker processes
+
+    PDFs and presentations are split into contiguous page/slide ranges,
+    each extracted by a separate task, and the results are concatenated in
+    page order. Other formats (including workbooks, which are parsed in a
+    single streaming pass) run as one task so they still get the isolation
+    below.
+
+    Every file has a wall-clock budget covering all of its shards, and
+    workers run under an address-space limit so a runaway parser fails
+    with MemoryError. A file that exceeds its budget (including one whose
+    worker died outright) gets the whole pool terminated and recreated,
+    since a stuck parser cannot be interrupted any other way; other files in flight on that
+    pool fail with ExtractionPoolRestarted and are retried by their caller.
+    With EXTRACTION_PROCESSES=0 extraction runs inline in the caller.
+    """
+
+    def __init__(
+        self,
+        processes: int = None,
+        pages_per_shard: int = None,
+        timeout_seconds: float = None,
+        memory_limit_mb: int = None
+    ):
+        self.processes = settings.EXTRACTION_PROCESSES if processes is None else processes
+        self.pages_per_shard = max(1, pages_per_shard or settings.EXTRACTION_PAGES_PER_SHARD)
+        self.timeout = timeout_seconds or settings.EXTRACTION_TIMEOUT_SECONDS
+        self.memory_limit_mb = settings.EXTRACTION_MEMORY_LIMIT_MB if memory_limit_mb is None else memory_limit_mb
+        self._lock = threading.Lock()
+        self._pool = None
+        self._restarts = 0
+        self._timeouts = 0
+        self._files = 0
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                context = multiprocessing.get_context("spawn")
+                self._pool = context.Pool(
+                    processes=self.processes,
+                    initializer=_limit_worker_memory,
+                    initargs=(self.memory_limit_mb * 1024 * 1024,),
+                    maxtasksperchild=settings.EXTRACTION_MAX_TASKS_PER_CHILD or None,
+                )
+            return self._pool
+
+    def _restart(self, pool) -> None:
+        with self._lock:
+            if self._pool is not pool:
+                return
+            self._pool = None
+            self._restarts += 1
+        pool.terminate()
+
+    def _wait(self, pool, result, deadline: float, file_path: str):
+        """Wait for one task, noticing both the deadline and a pool restart"""
+        while True:
+            if result.ready():
+                # Results that are already in are never timed out, even
+                # when a slow consumer pulled them after the deadline.
+                return result.get()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._timeouts += 1
+                self._restart(pool)
+                raise ExtractionTimeout(f"Extracting {file_path} exceeded {self.timeout}s")
+            try:
+                return result.get(min(1.0, remaining))
+            except multiprocessing.TimeoutError:
+                if self._pool is not pool:
+                    raise ExtractionPoolRestarted(f"Extraction pool restarted while extracting {file_path}")
+
+    def iter_document(self, file_path: str) -> Iterator[Dict[str, Any]]:
+        """
+        Extract a file's pages, in order, using the worker processes
+
+        All shards are submitted up front; pages are yielded shard by shard
+        as soon as the next shard in order is ready, so consumers can start
+        on the first pages while later shards are still being extracted.
+
+        Args:
+            file_path: File to extract
+
+        Yields:
+            Same page dicts as DocumentLoader.iter_document
+        """
+        if self.processes <= 0:
+            yield from DocumentLoader.iter_document(file_path)
+            return
+
+        self._files += 1
+        deadline = time.monotonic() + self.timeout
+        pool = self._get_pool()
+        try:
+            units = self._wait(pool, pool.apply_async(DocumentLoader.count_units, (file_path,)), deadline, file_path)
+            shard = self.pages_per_shard
+            if units <= shard:
+                tasks = [pool.apply_async(DocumentLoader.load_document, (file_path,))]
+            else:
+                tasks = [
+                    pool.apply_async(DocumentLoader.load_range, (file_path, start, min(start + shard, units)))
+                    for start in range(0, units, shard)
+                ]
+
+            for task in tasks:
+                yield from self._wait(pool, task, deadline, file_path)
+        except MemoryError as e:
+            raise MemoryError(f"Extracting {file_path} exceeded the {self.memory_limit_mb}MB worker memory limit") from e
+        except ValueError as e:
+            if "Pool not running" in str(e):
+                raise ExtractionPoolRestarted(f"Extraction pool restarted while extracting {file_path}") from e
+            raise
+
+    def load_document(self, file_path: str) -> List[Dict[str, Any]]:
+        """Extract all of a file's pages, in order (see iter_document)"""
+        return list(self.iter_document(file_path))
+
+    def close(self) -> None:
+        """Stop the worker processes"""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "processes": self.processes,
+            "running": self._pool is not None,
+            "files": self._files,
+            "timeouts": self._timeouts,
+            "restarts": self._restarts,
+        }
+
+
+# Shared extraction pool for ingestion workers and question paper analysis
+extraction_pool = ExtractionPool()
@@ -0,0 +1,241 @@
+"""
+Role-aware priority scheduling of LLM generation calls
+"""
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Deque, Dict, Optional
+
+from config import settings
+from models.user import User
+from utils.auth import get_user_roles_and_permissions
+
+PRIORITY_STAFF = "staff"
+PRIORITY_STUDENT = "student"
+
+STAFF_ROLES = ("admin", "faculty", "advisor")
+
+# Priority of the generation work started from the current request; copied
+# into worker threads by GenerationScheduler.to_thread.
+current_priority: ContextVar[str] = ContextVar("generation_priority", default=PRIORITY_STUDENT)
+
+
+def priority_for_user(user: User) -> str:
+    """Map a user's RBAC roles to a scheduling class"""
+    roles, _ = get_user_roles_and_permissions(user)
+    if any(role in STAFF_ROLES for role in roles):
+        return PRIORITY_STAFF
+    return PRIORITY_STUDENT
+
+
+class GenerationQueueTimeout(Exception):
+    """Raised when a generation request waited too long for a slot"""
+
+
+class _Waiter:
+    __slots__ = ("priority", "enqueued_at", "event", "loop", "future", "granted")
+
+    def __init__(self, priority: str, event=None, loop=None, future=None):
+        self.priority = priority
+        self.enqueued_at = time.monotonic()
+        self.event = event
+        self.loop = loop
+        self.future = future
+        self.granted = False
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class GenerationScheduler:
+    """
+    Limit concurrent LLM calls and hand out slots by weighted fair share
+
+    Waiters queue per scheduling class. Free slots go to the class with the
+    lowest stride pass (pass grows by 1/weight per grant), so with weights
+    4:1 staff get four slots for every student slot while both are busy,
+    and either class may use all slots when the other is idle. A queue
+    head that has waited longer than the starvation limit is served next
+    regardless of weight. Works for both worker threads (blocking
+    acquire) and coroutines (awaitable acquire) sharing one slot pool.
+
+    Blocking work that waits for a slot runs on the scheduler's own thread
+    pool (see to_thread), so queued generations never tie up the event
+    loop's default executor that database and ledger calls depend on.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = None,
+        weights: Dict[str, float] = None,
+        starvation_seconds: float = None,
+        queue_timeout_seconds: float = None,
+        executor_threads: int = None
+    ):
+        self.max_concurrency = max_concurrency or settings.GENERATION_MAX_CONCURRENCY
+        self.weights = weights or {
+            PRIORITY_STAFF: settings.GENERATION_STAFF_WEIGHT,
+            PRIORITY_STUDENT: settings.GENERATION_STUDENT_WEIGHT,
+        }
+        self.starvation_seconds = starvation_seconds or settings.GENERATION_STARVATION_SECONDS
+        self.queue_timeout = queue_timeout_seconds or settings.GENERATION_QUEUE_TIMEOUT_SECONDS
+        self.executor_threads = max(
+            executor_threads or settings.GENERATION_EXECUTOR_THREADS,
+            self.max_concurrency,
+        )
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._active = 0
+        self._queues: Dict[str, Deque[_Waiter]] = {priority: deque() for priority in self.weights}
+        self._passes: Dict[str, float] = {priority: 0.0 for priority in self.weights}
+        self._virtual_time = 0.0
+        self._granted: Dict[str, int] = {priority: 0 for priority in self.weights}
+        self._timeouts = 0
+        self._starvation_grants = 0
+
+    def _enqueue(self, priority: Optional[str], **signal) -> _Waiter:
+        priority = priority if priority in self._queues else current_priority.get()
+        if priority not in self._queues:
+            priority = PRIORITY_STUDENT
+        waiter = _Waiter(priority, **signal)
+        with self._lock:
+            queue = self._queues[priority]
+            if not queue:
+                # A class returning from idle must not cash in its idle time.
+                self._passes[priority] = max(self._passes[priority], self._virtual_time)
+            queue.append(waiter)
+            self._grant_locked()
+        return waiter
+
+    def _next_waiter_locked(self) -> Optional[_Waiter]:
+        heads = [(priority, queue[0]) for priority, queue in self._queues.items() if queue]
+        if not heads:
+            return None
+
+        oldest_priority, oldest = min(heads, key=lambda item: item[1].enqueued_at)
+        if time.monotonic() - oldest.enqueued_at >= self.starvation_seconds:
+            priority = oldest_priority
+            self._starvation_grants += 1
+        else:
+            priority = min(heads, key=lambda item: self._passes[item[0]])[0]
+
+        self._virtual_time = self._passes[priority]
+        self._passes[priority] += 1.0 / max(self.weights[priority], 0.001)
+        return self._queues[priority].popleft()
+
+    def _grant_locked(self) -> None:
+        while self._active < self.max_concurrency:
+            waiter = self._next_waiter_locked()
+            if waiter is None:
+                return
+            self._active += 1
+            self._granted[waiter.priority] += 1
+            waiter.granted = True
+            if waiter.event is not None:
+                waiter.event.set()
+            else:
+                waiter.loop.call_soon_threadsafe(_resolve, waiter.future)
+
+    def _withdraw(self, waiter: _Waiter) -> bool:
+        """Remove a waiter that gave up; False if it was granted meanwhile"""
+        with self._lock:
+            if waiter.granted:
+                return False
+            self._queues[waiter.priority].remove(waiter)
+            return True
+
+    def acquire(self, priority: str = None, timeout: float = None) -> None:
+        """Block the calling thread until a slot is free"""
+        waiter = self._enqueue(priority, event=threading.Event())
+        if not waiter.event.wait(timeout or self.queue_timeout) and self._withdraw(waiter):
+            with self._lock:
+                self._timeouts += 1
+            raise GenerationQueueTimeout("Timed out waiting for a generation slot")
+
+    async def acquire_async(self, priority: str = None, timeout: float = None) -> None:
+        """Wait on the event loop until a slot is free"""
+        loop = asyncio.get_running_loop()
+        waiter = self._enqueue(priority, loop=loop, future=loop.create_future())
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout or self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as exc:
+            if not self._withdraw(waiter):
+                # Granted while we were giving up; hand the slot back.
+                self.release()
+            if isinstance(exc, asyncio.TimeoutError):
+                with self._lock:
+                    self._timeouts += 1
+                raise GenerationQueueTimeout("Timed out waiting for a generation slot") from exc
+            raise
+
+    def release(self) -> None:
+        with self._lock:
+            self._active -= 1
+            self._grant_locked()
+
+    @contextmanager
+    def slot(self, priority: str = None):
+        """Hold a generation slot for a blocking call"""
+        self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def async_slot(self, priority: str = None):
+        """Hold a generation slot for an awaited call"""
+        await self.acquire_async(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def to_thread(self, func: Callable, *args, **kwargs) -> Any:
+        """
+        Run blocking work that takes generation slots on the generation pool
+
+        Like asyncio.to_thread (the caller's context, including
+        current_priority, is copied into the thread), but threads parked in
+        slot() wait here instead of in the loop's default executor.
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.executor_threads,
+                    thread_name_prefix="generation",
+                )
+            executor = self._executor
+        context = contextvars.copy_context()
+        call = functools.partial(context.run, func, *args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(executor, call)
+
+    def shutdown(self) -> None:
+        """Stop the generation pool after in-flight work finishes"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "active": self._active,
+                "max_concurrency": self.max_concurrency,
+                "queued": {priority: len(queue) for priority, queue in self._queues.items()},
+                "granted": dict(self._granted),
+                "starvation_grants": self._starvation_grants,
+                "timeouts": self._timeouts,
+            }
+
+
+# Shared slot pool for all LLM generation calls in this process
+generation_scheduler = GenerationScheduler()
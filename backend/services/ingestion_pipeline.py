@@ -0,0 +1,340 @@
+"""
+Pipelined extract -> chunk -> embed ingestion with bounded stage queues
+"""
+import pickle
+import queue
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+from config import settings
+from services.embeddings import EmbeddingService
+
+STAGES = ("extract", "chunk", "embed", "write")
+
+# Marks the end of a stage's output on its queue
+_DONE = object()
+
+
+class PipelineAborted(Exception):
+    """Raised inside a stage when another stage has failed"""
+
+
+class StageCounter:
+    """Throughput counters for one pipeline stage"""
+
+    def __init__(self):
+        self.items = 0
+        self.busy_seconds = 0.0
+        # Time spent blocked on a full downstream queue (backpressure)
+        self.blocked_seconds = 0.0
+        self.finished = False
+        # Embed counters are shared by several threads
+        self._lock = threading.Lock()
+
+    def record(self, items: int, busy_seconds: float) -> None:
+        with self._lock:
+            self.items += items
+            self.busy_seconds += busy_seconds
+
+    def record_blocked(self, seconds: float) -> None:
+        with self._lock:
+            self.blocked_seconds += seconds
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "items": self.items,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "blocked_seconds": round(self.blocked_seconds, 3),
+            "items_per_second": round(self.items / self.busy_seconds, 2) if self.busy_seconds else None,
+            "finished": self.finished,
+        }
+
+
+class ChunkSpool:
+    """
+    Pipeline output buffered in an anonymous temporary file
+
+    Lets the caller run the pipeline without holding the vector store lock
+    and then stream the batches into EmbeddingService.sync_document_chunks
+    under it, without keeping a whole document's chunks and vectors in
+    memory.
+    """
+
+    def __init__(self):
+        self._file = tempfile.TemporaryFile()
+        self._batches = 0
+        self.chunks = 0
+
+    def append(self, chunks: List, vectors: Dict[str, np.ndarray]) -> None:
+        pickle.dump((chunks, vectors), self._file, protocol=pickle.HIGHEST_PROTOCOL)
+        self._batches += 1
+        self.chunks += len(chunks)
+
+    def batches(self) -> Iterator[Tuple[List, Dict[str, np.ndarray]]]:
+        """Read the batches back in the order they were appended"""
+        self._file.flush()
+        self._file.seek(0)
+        for _ in range(self._batches):
+            yield pickle.load(self._file)
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self) -> "ChunkSpool":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class IngestionPipeline:
+    """
+    Overlap CPU-bound extraction with network-bound embedding
+
+    Stages run on their own threads and hand work downstream through
+    bounded queues, so a slow stage applies backpressure instead of letting
+    its input pile up in memory:
+
+        extract (pages)  ->  chunk (fixed-size chunk batches)
+                         ->  embed (embed_concurrency threads)
+                         ->  write (caller's thread, restores batch order
+                                    and hands each batch to a sink)
+
+    Chunks whose text is already indexed (known_hashes), or already sent
+    to the embedder earlier in the run, are passed through without being
+    embedded again, so re-indexing an edited document only pays for the
+    edit. Nothing is accumulated across batches: each one leaves through
+    the sink as soon as every batch before it has. The first failure in
+    any stage aborts every other stage and is re-raised from run().
+    """
+
+    def __init__(
+        self,
+        embedding_service: EmbeddingService,
+        embed_concurrency: int = None,
+        queue_size: int = None,
+        batch_size: int = None
+    ):
+        self.embedding_service = embedding_service
+        self.embed_concurrency = max(1, embed_concurrency or settings.INGESTION_EMBED_CONCURRENCY)
+        self.queue_size = max(1, queue_size or settings.INGESTION_PIPELINE_QUEUE_SIZE)
+        self.batch_size = batch_size or settings.EMBEDDING_BATCH_SIZE
+        self.counters = {stage: StageCounter() for stage in STAGES}
+        # Chunks not embedded because their text already has a vector
+        self.reused_chunks = 0
+        self._aborted = threading.Event()
+        self._error: Optional[BaseException] = None
+        self._error_lock = threading.Lock()
+
+    def _fail(self, error: BaseException) -> None:
+        with self._error_lock:
+            if self._error is None:
+                self._error = error
+        self._aborted.set()
+
+    def _put(self, target: queue.Queue, item, counter: StageCounter) -> None:
+        started = time.monotonic()
+        while True:
+            if self._aborted.is_set():
+                raise PipelineAborted()
+            try:
+                target.put(item, timeout=0.5)
+                break
+            except queue.Full:
+                continue
+        counter.record_blocked(time.monotonic() - started)
+
+    def _get(self, source: queue.Queue):
+        while True:
+            if self._aborted.is_set():
+                raise PipelineAborted()
+            try:
+                return source.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+    def _extract(self, pages: Iterable[Dict[str, Any]], out: queue.Queue) -> None:
+        counter = self.counters["extract"]
+        try:
+            iterator = iter(pages)
+            while True:
+                started = time.monotonic()
+                page = next(iterator, _DONE)
+                if page is _DONE:
+                    break
+                counter.record(1, time.monotonic() - started)
+                self._put(out, page, counter)
+            counter.finished = True
+            self._put(out, _DONE, counter)
+        except PipelineAborted:
+            pass
+        except BaseException as e:
+            self._fail(e)
+
+    def _chunk(
+        self,
+        document_id,
+        metadata,
+        subject_keys: Set[str],
+        embedded_hashes: Set[str],
+        source: queue.Queue,
+        out: queue.Queue
+    ) -> None:
+        counter = self.counters["chunk"]
+        try:
+            batch: List = []
+            sequence = 0
+            while True:
+                page = self._get(source)
+                if page is _DONE:
+                    break
+                started = time.monotonic()
+                chunks = list(self.embedding_service.iter_chunks(document_id, [page], metadata, subject_keys=subject_keys))
+                for chunk in chunks:
+                    chunk_hash = chunk.metadata["chunk_hash"]
+                    if chunk_hash in embedded_hashes:
+                        self.reused_chunks += 1
+                        batch.append((chunk, False))
+                    else:
+                        embedded_hashes.add(chunk_hash)
+                        batch.append((chunk, True))
+                counter.record(len(chunks), time.monotonic() - started)
+                while len(batch) >= self.batch_size:
+                    self._put(out, (sequence, batch[: self.batch_size]), counter)
+                    batch = batch[self.batch_size:]
+                    sequence += 1
+            if batch:
+                self._put(out, (sequence, batch), counter)
+            counter.finished = True
+            for _ in range(self.embed_concurrency):
+                self._put(out, _DONE, counter)
+        except PipelineAborted:
+            pass
+        except BaseException as e:
+            self._fail(e)
+
+    def _embed(self, source: queue.Queue, out: queue.Queue) -> None:
+        counter = self.counters["embed"]
+        try:
+            while True:
+                item = self._get(source)
+                if item is _DONE:
+                    break
+                sequence, batch = item
+                to_embed = [chunk for chunk, embed in batch if embed]
+                vectors: Dict[str, np.ndarray] = {}
+                if to_embed:
+                    started = time.monotonic()
+                    embedded = np.asarray(self.embedding_service.embed_chunks(to_embed), dtype=np.float32)
+                    counter.record(len(to_embed), time.monotonic() - started)
+                    vectors = {chunk.metadata["chunk_hash"]: vector for chunk, vector in zip(to_embed, embedded)}
+                self._put(out, (sequence, [chunk for chunk, _ in batch], vectors), counter)
+            self._put(out, _DONE, counter)
+        except PipelineAborted:
+            pass
+        except BaseException as e:
+            self._fail(e)
+
+    def run(
+        self,
+        document_id,
+        pages: Iterable[Dict[str, Any]],
+        metadata: Dict[str, Any],
+        sink: Callable[[List, Dict[str, np.ndarray]], None],
+        on_progress: Callable[[Dict[str, Any]], None] = None,
+        known_hashes: Iterable[str] = ()
+    ) -> Tuple[int, Set[str]]:
+        """
+        Stream pages through the pipeline
+
+        Args:
+            document_id: Id stored on every chunk
+            pages: Page iterable (typically a lazy extractor)
+            metadata: Document metadata copied onto chunks
+            sink: Called from the writer, in page order, with each batch of
+                chunks and the float32 vectors of the batch's newly embedded
+                text keyed by chunk_hash
+            on_progress: Called from the writer with stats() after each batch
+            known_hashes: Chunk hashes that already have a vector (not embedded)
+
+        Returns:
+            Tuple of (number of chunks written, subject key tokens)
+        """
+        pages_queue: queue.Queue = queue.Queue(self.queue_size)
+        batches_queue: queue.Queue = queue.Queue(self.queue_size)
+        embedded_queue: queue.Queue = queue.Queue(self.queue_size)
+        subject_keys: Set[str] = set()
+
+        threads = [
+            threading.Thread(target=self._extract, args=(pages, pages_queue), daemon=True),
+            threading.Thread(
+                target=self._chunk,
+                args=(document_id, metadata, subject_keys, set(known_hashes), pages_queue, batches_queue),
+                daemon=True,
+            ),
+        ]
+        threads += [
+            threading.Thread(target=self._embed, args=(batches_queue, embedded_queue), daemon=True)
+            for _ in range(self.embed_concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+
+        counter = self.counters["write"]
+        pending: Dict[int, Tuple[List, Dict[str, np.ndarray]]] = {}
+        next_sequence = 0
+        chunk_count = 0
+        embedders_done = 0
+        try:
+            while embedders_done < self.embed_concurrency:
+                item = self._get(embedded_queue)
+                if item is _DONE:
+                    embedders_done += 1
+                    self.counters["embed"].finished = embedders_done == self.embed_concurrency
+                    continue
+                started = time.monotonic()
+                sequence, batch, batch_vectors = item
+                pending[sequence] = (batch, batch_vectors)
+                # Embedders finish out of order; keep chunks in page order.
+                written = 0
+                while next_sequence in pending:
+                    batch, batch_vectors = pending.pop(next_sequence)
+                    sink(batch, batch_vectors)
+                    written += len(batch)
+                    next_sequence += 1
+                chunk_count += written
+                counter.record(written, time.monotonic() - started)
+                if on_progress is not None:
+                    on_progress(self.stats())
+            counter.finished = True
+        except PipelineAborted:
+            pass
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            if self._error is not None:
+                self._aborted.set()
+            for thread in threads:
+                thread.join(timeout=5)
+
+        if self._error is not None:
+            raise self._error
+        if not chunk_count:
+            raise ValueError("No valid text chunks found in document")
+        return chunk_count, subject_keys
+
+    def current_stage(self) -> str:
+        """Earliest stage that is still running"""
+        for stage in STAGES:
+            if not self.counters[stage].finished:
+                return stage
+        return STAGES[-1]
+
+    def stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = {stage: counter.to_dict() for stage, counter in self.counters.items()}
+        stats["reused_chunks"] = self.reused_chunks
+        return stats
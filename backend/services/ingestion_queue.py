@@ -0,0 +1,236 @@
+"""
+Durable ingestion job queue backed by the ingestion_jobs table
+"""
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, func, or_, update
+from sqlalchemy.orm import Session
+
+from config import settings
+from models import SessionLocal
+from models.ingestion_job import IngestionJob, IngestionJobStatus, IngestionSource, IngestionStage
+
+
+class LeaseLost(Exception):
+    """Raised when a worker no longer owns the job it is processing"""
+
+
+class IngestionQueue:
+    """
+    Postgres-backed work queue for indexing uploads
+
+    Workers claim the oldest visible job with SELECT ... FOR UPDATE SKIP
+    LOCKED, so any number of worker processes can poll the same table
+    without handing one job to two of them. A claim takes a lease; the
+    worker renews it on every progress report. A running job whose lease
+    has expired (worker crashed or was restarted) becomes visible again and
+    is retried. Failures are retried with exponential backoff by pushing
+    available_at into the future until max_attempts is reached.
+    """
+
+    def __init__(self, lease_seconds: int = None, max_attempts: int = None, retry_backoff_seconds: int = None):
+        self.lease_seconds = lease_seconds or settings.INGESTION_LEASE_SECONDS
+        self.max_attempts = max_attempts or settings.INGESTION_MAX_ATTEMPTS
+        self.retry_backoff_seconds = retry_backoff_seconds or settings.INGESTION_RETRY_BACKOFF_SECONDS
+
+    def enqueue(self, db: Session, source_type: IngestionSource, source_id) -> IngestionJob:
+        """
+        Queue an upload for indexing, reusing a job that is still pending
+
+        Args:
+            db: Session to add the job in (committed here)
+            source_type: Kind of upload
+            source_id: Id of the document or course material
+
+        Returns:
+            The new job, or the one already waiting for this upload
+        """
+        source_id = str(source_id)
+        existing = (
+            db.query(IngestionJob)
+            .filter(
+                IngestionJob.source_type == source_type,
+                IngestionJob.source_id == source_id,
+                IngestionJob.status == IngestionJobStatus.QUEUED,
+            )
+            .first()
+        )
+        if existing is not None:
+            return existing
+
+        job = IngestionJob(
+            source_type=source_type,
+            source_id=source_id,
+            status=IngestionJobStatus.QUEUED,
+            progress={},
+            attempts=0,
+            max_attempts=self.max_attempts,
+            available_at=datetime.utcnow(),
+        )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        return job
+
+    def latest_for_source(self, db: Session, source_type: IngestionSource, source_id) -> Optional[IngestionJob]:
+        """Most recently created job for an upload"""
+        return (
+            db.query(IngestionJob)
+            .filter(IngestionJob.source_type == source_type, IngestionJob.source_id == str(source_id))
+            .order_by(IngestionJob.created_at.desc())
+            .first()
+        )
+
+    def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Lease the next visible job for a worker
+
+        Returns:
+            A snapshot of the claimed job, or None when nothing is ready
+        """
+        db = SessionLocal()
+        try:
+            while True:
+                now = datetime.utcnow()
+                job = (
+                    db.query(IngestionJob)
+                    .filter(
+                        or_(
+                            and_(IngestionJob.status == IngestionJobStatus.QUEUED, IngestionJob.available_at <= now),
+                            and_(IngestionJob.status == IngestionJobStatus.RUNNING, IngestionJob.lease_expires_at < now),
+                        )
+                    )
+                    .order_by(IngestionJob.available_at)
+                    .with_for_update(skip_locked=True)
+                    .first()
+                )
+                if job is None:
+                    db.commit()
+                    return None
+
+                if job.attempts >= job.max_attempts:
+                    # Lease expired on the final attempt: the worker died mid-job.
+                    job.status = IngestionJobStatus.FAILED
+                    job.last_error = job.last_error or "Worker lease expired"
+                    job.finished_at = now
+                    job.lease_owner = None
+                    job.lease_expires_at = None
+                    db.commit()
+                    continue
+
+                job.status = IngestionJobStatus.RUNNING
+                job.attempts += 1
+                job.lease_owner = worker_id
+                job.lease_expires_at = now + timedelta(seconds=self.lease_seconds)
+                job.started_at = job.started_at or now
+                job.stage = IngestionStage.EXTRACT
+                snapshot = {
+                    "id": job.id,
+                    "source_type": job.source_type,
+                    "source_id": job.source_id,
+                    "attempts": job.attempts,
+                    "max_attempts": job.max_attempts,
+                }
+                db.commit()
+                return snapshot
+        finally:
+            db.close()
+
+    def _update_owned(self, job_id, worker_id: str, **values) -> None:
+        db = SessionLocal()
+        try:
+            result = db.execute(
+                update(IngestionJob)
+                .where(IngestionJob.id == job_id, IngestionJob.lease_owner == worker_id)
+                .values(updated_at=datetime.utcnow(), **values)
+            )
+            db.commit()
+        finally:
+            db.close()
+        if result.rowcount == 0:
+            raise LeaseLost(f"Ingestion job {job_id} is no longer leased by {worker_id}")
+
+    def heartbeat(
+        self,
+        job_id,
+        worker_id: str,
+        stage: IngestionStage = None,
+        progress: Dict[str, Any] = None
+    ) -> None:
+        """Extend the lease and optionally record the current stage and progress"""
+        values = {"lease_expires_at": datetime.utcnow() + timedelta(seconds=self.lease_seconds)}
+        if stage is not None:
+            values["stage"] = stage
+        if progress is not None:
+            values["progress"] = progress
+        self._update_owned(job_id, worker_id, **values)
+
+    def complete(self, job_id, worker_id: str, progress: Dict[str, Any]) -> None:
+        """Mark a leased job as done"""
+        self._update_owned(
+            job_id,
+            worker_id,
+            status=IngestionJobStatus.SUCCEEDED,
+            stage=IngestionStage.DONE,
+            progress=progress,
+            last_error=None,
+            finished_at=datetime.utcnow(),
+            lease_owner=None,
+            lease_expires_at=None,
+        )
+
+    def fail(self, job_id, worker_id: str, attempts: int, max_attempts: int, error: str) -> bool:
+        """
+        Record a failed attempt and schedule a retry if any are left
+
+        Returns:
+            True when the job has failed permanently
+        """
+        now = datetime.utcnow()
+        if attempts >= max_attempts:
+            values = {"status": IngestionJobStatus.FAILED, "finished_at": now}
+        else:
+            backoff = self.retry_backoff_seconds * (2 ** (attempts - 1))
+            values = {"status": IngestionJobStatus.QUEUED, "available_at": now + timedelta(seconds=backoff)}
+        self._update_owned(
+            job_id,
+            worker_id,
+            last_error=error[:4000],
+            lease_owner=None,
+            lease_expires_at=None,
+            **values,
+        )
+        return attempts >= max_attempts
+
+    def succeeded_since(self, since: datetime) -> List[Tuple[Any, str, datetime]]:
+        """
+        Jobs that finished successfully at or after a point in time
+
+        Returns:
+            (job id, source id, finished_at) for each job, oldest first
+        """
+        db = SessionLocal()
+        try:
+            rows = (
+                db.query(IngestionJob.id, IngestionJob.source_id, IngestionJob.finished_at)
+                .filter(IngestionJob.status == IngestionJobStatus.SUCCEEDED, IngestionJob.finished_at >= since)
+                .order_by(IngestionJob.finished_at)
+                .all()
+            )
+        finally:
+            db.close()
+        return [tuple(row) for row in rows]
+
+    def stats(self) -> Dict[str, int]:
+        """Job counts per status"""
+        db = SessionLocal()
+        try:
+            rows = db.query(IngestionJob.status, func.count(IngestionJob.id)).group_by(IngestionJob.status).all()
+        finally:
+            db.close()
+        return {status.value: count for status, count in rows}
+
+
+# Shared queue used by upload routes and ingestion workers
+ingestion_queue = IngestionQueue()
@@ -0,0 +1,415 @@
+"""
+Ingestion workers that index uploads claimed from the job queue
+
+Run a dedicated pool, independent of the API processes, with:
+
+    python -m services.ingestion_worker --concurrency 4
+"""
+import argparse
+import os
+import signal
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, NamedTuple, Optional
+from uuid import UUID
+
+from sqlalchemy import text
+
+from config import settings
+from models import SessionLocal, engine
+from models.course_material import Course, CourseMaterial
+from models.document import Document, IndexingStatus
+from models.ingestion_job import IngestionJobStatus, IngestionSource, IngestionStage
+from services.embeddings import EmbeddingService
+from services.extraction_cache import extraction_cache
+from services.extraction_pool import extraction_pool
+from services.ingestion_pipeline import ChunkSpool, IngestionPipeline
+from services.ingestion_queue import IngestionQueue, LeaseLost, ingestion_queue
+
+# Postgres advisory lock key serializing writes to the FAISS files across
+# every worker process sharing FAISS_INDEX_PATH
+VECTOR_STORE_LOCK_KEY = 0x41524147
+
+# Minimum seconds between progress writes while the pipeline runs
+PROGRESS_INTERVAL_SECONDS = 2.0
+
+_persist_lock = threading.Lock()
+
+
+@contextmanager
+def vector_store_lock():
+    """Hold the process-wide and cluster-wide vector store write lock"""
+    with _persist_lock:
+        with engine.connect() as connection:
+            connection.execute(text("SELECT pg_advisory_lock(:key)"), {"key": VECTOR_STORE_LOCK_KEY})
+            try:
+                yield
+            finally:
+                connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": VECTOR_STORE_LOCK_KEY})
+                connection.commit()
+
+
+class _Source(NamedTuple):
+    """What a worker needs to index one upload"""
+
+    file_path: str
+    content_hash: Optional[str]
+    metadata: Dict[str, Any]
+    # Indexed canonical upload to copy chunks from, for duplicates
+    clone_from: Optional[str]
+
+
+def _clone_source(db, source_type: IngestionSource, duplicate_of_id) -> Optional[str]:
+    """Canonical upload whose chunks a duplicate can copy, once it is indexed"""
+    if duplicate_of_id is None:
+        return None
+    job = ingestion_queue.latest_for_source(db, source_type, duplicate_of_id)
+    if job is None or job.status != IngestionJobStatus.SUCCEEDED:
+        return None
+    return str(duplicate_of_id)
+
+
+def _document_source(db, source_id: str) -> Optional[_Source]:
+    document = db.query(Document).filter(Document.id == UUID(source_id), Document.is_deleted == False).first()
+    if document is None:
+        return None
+    clone_from = _clone_source(db, IngestionSource.DOCUMENT, document.duplicate_of_id)
+    return _Source(document.file_path, document.content_hash, {
+        "document_id": source_id,
+        "title": document.title,
+        "subject": document.subject,
+        "document_type": document.document_type.value,
+        "uploader_id": str(document.uploader_id),
+        "source_type": "document",
+    }, clone_from)
+
+
+def _course_material_source(db, source_id: str) -> Optional[_Source]:
+    row = (
+        db.query(CourseMaterial, Course)
+        .join(Course, Course.id == CourseMaterial.course_id)
+        .filter(CourseMaterial.id == UUID(source_id), CourseMaterial.is_deleted == False)
+        .first()
+    )
+    if row is None:
+        return None
+    material, course = row
+    clone_from = _clone_source(db, IngestionSource.COURSE_MATERIAL, material.duplicate_of_id)
+    return _Source(material.file_path, material.content_hash, {
+        "document_id": source_id,
+        "title": material.title,
+        "subject": course.code,
+        "document_type": material.material_type.value,
+        "uploader_id": str(material.uploaded_by) if material.uploaded_by else None,
+        "source_type": "course_material",
+        "course_id": str(course.id),
+        "course_code": course.code,
+        "course_name": course.name,
+    }, clone_from)
+
+
+SOURCE_RESOLVERS = {
+    IngestionSource.DOCUMENT: _document_source,
+    IngestionSource.COURSE_MATERIAL: _course_material_source,
+}
+
+
+def _update_document_status(source_id: str, status: IndexingStatus, **values) -> None:
+    db = SessionLocal()
+    try:
+        document = db.query(Document).filter(Document.id == UUID(source_id)).first()
+        if document is not None:
+            document.indexing_status = status
+            for field, value in values.items():
+                setattr(document, field, value)
+            db.commit()
+    finally:
+        db.close()
+
+
+def _job_stage(pipeline: IngestionPipeline) -> IngestionStage:
+    """Job stage for the earliest pipeline stage still running"""
+    stage = pipeline.current_stage()
+    if stage in ("extract", "chunk", "embed"):
+        return IngestionStage(stage)
+    return IngestionStage.EMBED
+
+
+class _LeaseKeeper(threading.Thread):
+    """Renew a job lease in the background while a long stage runs"""
+
+    def __init__(self, queue: IngestionQueue, job_id, worker_id: str):
+        super().__init__(daemon=True)
+        self.queue = queue
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.interval = max(1.0, queue.lease_seconds / 3)
+        self.stopped = threading.Event()
+        self.lost = False
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.queue.heartbeat(self.job_id, self.worker_id)
+            except LeaseLost:
+                self.lost = True
+                return
+            except Exception as e:
+                print(f"Ingestion lease renewal failed for job {self.job_id}: {e}")
+
+
+class IngestionWorker:
+    """
+    Run one claimed job through extract -> chunk -> embed -> persist
+
+    Extraction, chunking and embedding overlap in an IngestionPipeline;
+    its per-stage throughput counters are written to the job row every
+    few seconds, which also renews the lease. The pipeline's ordered
+    batches are spooled to a temporary file, and only the persist stage
+    touches the shared FAISS files: it streams the spool into the store
+    under vector_store_lock(), after reloading it so that concurrent
+    workers never overwrite each other.
+
+    A duplicate upload whose canonical copy is already indexed skips the
+    pipeline and copies the canonical's chunk vectors instead. Re-indexing
+    is incremental: chunk text that is already indexed for the upload is
+    not embedded again, and chunks whose text is gone are deleted.
+    """
+
+    def __init__(self, worker_id: str, queue: IngestionQueue = None):
+        self.worker_id = worker_id
+        self.queue = queue or ingestion_queue
+        self._embedding_service: Optional[EmbeddingService] = None
+
+    @property
+    def embedding_service(self) -> EmbeddingService:
+        if self._embedding_service is None:
+            self._embedding_service = EmbeddingService()
+        return self._embedding_service
+
+    def _advance(self, job: Dict[str, Any], keeper: _LeaseKeeper, stage: IngestionStage, progress: Dict[str, Any]):
+        if keeper.lost:
+            raise LeaseLost(f"Ingestion job {job['id']} lease was lost")
+        self.queue.heartbeat(job["id"], self.worker_id, stage=stage, progress=progress)
+
+    def _clone(
+        self,
+        job: Dict[str, Any],
+        keeper: _LeaseKeeper,
+        source_id: str,
+        metadata: Dict[str, Any],
+        clone_from: str,
+        progress: Dict[str, Any]
+    ) -> int:
+        """Copy a canonical upload's chunks; 0 when it has none to copy or is already indexed"""
+        self._advance(job, keeper, IngestionStage.PERSIST, progress)
+        started = time.monotonic()
+        with vector_store_lock():
+            self.embedding_service.reload()
+            if self.embedding_service.document_chunk_ids(source_id):
+                # Re-indexing a duplicate: sync its own chunks instead
+                return 0
+            chunk_count = self.embedding_service.clone_document_chunks(clone_from, source_id, metadata)
+        if chunk_count:
+            progress["persist"] = {
+                "chunks": chunk_count,
+                "cloned_from": clone_from,
+                "seconds": round(time.monotonic() - started, 3),
+            }
+        return chunk_count
+
+    def _index(
+        self,
+        job: Dict[str, Any],
+        keeper: _LeaseKeeper,
+        source_id: str,
+        target: _Source,
+        progress: Dict[str, Any]
+    ) -> int:
+        """Run the upload through the pipeline and sync its indexed chunks"""
+        with vector_store_lock():
+            self.embedding_service.reload()
+            known_hashes = set(self.embedding_service.document_chunk_ids(source_id))
+
+        started = time.monotonic()
+        pipeline = IngestionPipeline(self.embedding_service)
+        last_report = 0.0
+
+        def report(stats: Dict[str, Any]) -> None:
+            nonlocal last_report
+            if keeper.lost:
+                raise LeaseLost(f"Ingestion job {job['id']} lease was lost")
+            now = time.monotonic()
+            if now - last_report >= PROGRESS_INTERVAL_SECONDS:
+                last_report = now
+                progress.update(stats)
+                self.queue.heartbeat(job["id"], self.worker_id, stage=_job_stage(pipeline), progress=progress)
+
+        # Batches wait on disk for the store lock rather than in memory
+        with ChunkSpool() as spool:
+            _, subject_keys = pipeline.run(
+                source_id,
+                extraction_cache.iter_document(target.file_path, target.content_hash),
+                target.metadata,
+                sink=spool.append,
+                on_progress=report,
+                known_hashes=known_hashes,
+            )
+            progress.update(pipeline.stats())
+            progress["pipeline_seconds"] = round(time.monotonic() - started, 3)
+            self._advance(job, keeper, IngestionStage.PERSIST, progress)
+
+            started = time.monotonic()
+            with vector_store_lock():
+                self.embedding_service.reload()
+                result = self.embedding_service.sync_document_chunks(source_id, spool.batches(), subject_keys)
+        progress["persist"] = {**result, "seconds": round(time.monotonic() - started, 3)}
+        return result["chunks"]
+
+    def process(self, job: Dict[str, Any]) -> None:
+        """Index the upload behind a claimed job and settle the job"""
+        source_type: IngestionSource = job["source_type"]
+        source_id: str = job["source_id"]
+        is_document = source_type == IngestionSource.DOCUMENT
+        progress: Dict[str, Any] = {"worker": self.worker_id, "attempt": job["attempts"]}
+
+        keeper = _LeaseKeeper(self.queue, job["id"], self.worker_id)
+        keeper.start()
+        try:
+            db = SessionLocal()
+            try:
+                target = SOURCE_RESOLVERS[source_type](db, source_id)
+            finally:
+                db.close()
+
+            if target is None:
+                progress["skipped"] = "source deleted"
+                self.queue.complete(job["id"], self.worker_id, progress)
+                return
+
+            if is_document:
+                _update_document_status(source_id, IndexingStatus.IN_PROGRESS, error_message=None)
+
+            chunk_count = 0
+            if target.clone_from:
+                chunk_count = self._clone(job, keeper, source_id, target.metadata, target.clone_from, progress)
+            if not chunk_count:
+                chunk_count = self._index(job, keeper, source_id, target, progress)
+
+            if keeper.lost:
+                raise LeaseLost(f"Ingestion job {job['id']} lease was lost")
+            if is_document:
+                _update_document_status(
+                    source_id,
+                    IndexingStatus.COMPLETED,
+                    indexed_at=datetime.utcnow(),
+                    chunk_count=chunk_count,
+                    error_message=None,
+                )
+            self.queue.complete(job["id"], self.worker_id, progress)
+        except LeaseLost as e:
+            # Another worker has taken the job over; it owns the outcome now.
+            print(f"Ingestion worker {self.worker_id}: {e}")
+        except Exception as e:
+            error = str(e) or e.__class__.__name__
+            try:
+                final = self.queue.fail(job["id"], self.worker_id, job["attempts"], job["max_attempts"], error)
+            except LeaseLost:
+                return
+            print(f"Ingestion job {job['id']} attempt {job['attempts']} failed: {error}")
+            if is_document:
+                _update_document_status(
+                    source_id,
+                    IndexingStatus.FAILED if final else IndexingStatus.PENDING,
+                    error_message=error,
+                )
+        finally:
+            keeper.stopped.set()
+
+
+class IngestionWorkerPool:
+    """Threads that poll the ingestion queue and process jobs until stopped"""
+
+    def __init__(self, concurrency: int = None, poll_seconds: float = None, name: str = "worker"):
+        self.concurrency = max(1, concurrency or settings.INGESTION_WORKER_CONCURRENCY)
+        self.poll_seconds = poll_seconds or settings.INGESTION_POLL_SECONDS
+        self.name = name
+        self._stopping = threading.Event()
+        self._threads = []
+        self._processed = 0
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        if self._threads:
+            return
+        self._stopping.clear()
+        prefix = f"{socket.gethostname()}:{os.getpid()}:{self.name}"
+        for index in range(self.concurrency):
+            thread = threading.Thread(
+                target=self._run,
+                args=(f"{prefix}:{index}",),
+                name=f"ingestion-{self.name}-{index}",
+                daemon=True,
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 30.0) -> None:
+        """
+        Stop polling and wait for in-flight jobs
+
+        Jobs still running after the timeout are abandoned; their leases
+        expire and another worker retries them.
+        """
+        self._stopping.set()
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        self._threads = []
+
+    def _run(self, worker_id: str) -> None:
+        worker = IngestionWorker(worker_id)
+        while not self._stopping.is_set():
+            try:
+                job = worker.queue.claim(worker_id)
+            except Exception as e:
+                print(f"Ingestion worker {worker_id} could not claim a job: {e}")
+                job = None
+            if job is None:
+                self._stopping.wait(self.poll_seconds)
+                continue
+            worker.process(job)
+            with self._lock:
+                self._processed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": len(self._threads),
+            "processed": self._processed,
+        }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run ingestion workers")
+    parser.add_argument("--concurrency", type=int, default=settings.INGESTION_WORKER_CONCURRENCY)
+    args = parser.parse_args()
+
+    pool = IngestionWorkerPool(concurrency=args.concurrency)
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+
+    pool.start()
+    print(f"Ingestion workers started: {pool.concurrency}")
+    while not stop.wait(1.0):
+        pass
+    print("Stopping ingestion workers...")
+    pool.stop()
+    extraction_pool.close()
+
+
+if __name__ == "__main__":
+    main()
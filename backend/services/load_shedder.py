@@ -0,0 +1,165 @@
+"""
+Adaptive load shedding for generation endpoints
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from config import settings
+
+
+def _parse_thresholds(raw: str) -> List[float]:
+    return [float(value) for value in raw.split(",") if value.strip()]
+
+
+@dataclass(frozen=True)
+class DegradationPolicy:
+    """What a request is allowed to do at the current degradation level."""
+
+    level: int
+    top_k: int
+    use_web_fallback: bool
+    max_completion_tokens: int
+    shed: bool
+
+    @property
+    def retry_after(self) -> int:
+        return settings.LOAD_SHED_RETRY_AFTER_SECONDS
+
+    @property
+    def caps_completion(self) -> bool:
+        """Whether max_completion_tokens is a degradation cap rather than the caller's own limit"""
+        return self.level >= 3
+
+
+class LoadController:
+    """
+    Pick a degradation level from in-flight requests and upstream latency
+
+    Levels escalate one step at a time:
+        0  full service
+        1  smaller retrieval top-k
+        2  no web search fallback
+        3  capped completion length
+        4  shed: reject with 503 and Retry-After
+
+    The in-flight count and the p90 of recent upstream latencies are each
+    compared with their own ascending threshold list; the higher of the two
+    resulting levels wins.
+    """
+
+    MAX_LEVEL = 4
+
+    def __init__(
+        self,
+        inflight_thresholds: List[float] = None,
+        latency_thresholds_ms: List[float] = None,
+        latency_window: int = None
+    ):
+        self.inflight_thresholds = inflight_thresholds or _parse_thresholds(settings.LOAD_SHED_INFLIGHT_THRESHOLDS)
+        self.latency_thresholds_ms = latency_thresholds_ms or _parse_thresholds(settings.LOAD_SHED_LATENCY_THRESHOLDS_MS)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        # (recorded_at, latency_ms) of recent upstream calls
+        self._latencies: Deque[Tuple[float, float]] = deque(maxlen=latency_window or settings.LOAD_SHED_LATENCY_WINDOW)
+        self._shed_count = 0
+        self._level_counts = [0] * (self.MAX_LEVEL + 1)
+
+    @staticmethod
+    def _level_for(value: float, thresholds: List[float]) -> int:
+        level = 0
+        for threshold in thresholds[: LoadController.MAX_LEVEL]:
+            if value >= threshold:
+                level += 1
+        return level
+
+    def _latency_p90(self) -> Optional[float]:
+        horizon = time.monotonic() - settings.LOAD_SHED_LATENCY_HORIZON_SECONDS
+        recent = sorted(latency for recorded_at, latency in self._latencies if recorded_at >= horizon)
+        if not recent:
+            return None
+        return recent[min(len(recent) - 1, int(len(recent) * 0.9))]
+
+    def current_level(self) -> int:
+        """Degradation level for the next request"""
+        with self._lock:
+            return self._current_level_locked()
+
+    def _current_level_locked(self) -> int:
+        level = self._level_for(self._in_flight, self.inflight_thresholds)
+        p90 = self._latency_p90()
+        if p90 is not None:
+            level = max(level, self._level_for(p90, self.latency_thresholds_ms))
+        return level
+
+    def policy_for(self, level: int, top_k: int, max_completion_tokens: int) -> DegradationPolicy:
+        """Translate a level into concrete limits for one request"""
+        return DegradationPolicy(
+            level=level,
+            top_k=max(1, top_k // 2) if level >= 1 else top_k,
+            use_web_fallback=level < 2,
+            max_completion_tokens=(
+                min(max_completion_tokens, settings.LOAD_SHED_DEGRADED_MAX_TOKENS) if level >= 3 else max_completion_tokens
+            ),
+            shed=level >= self.MAX_LEVEL,
+        )
+
+    @contextmanager
+    def admit(self, top_k: int = 6, max_completion_tokens: int = 1500):
+        """
+        Count a request as in flight and yield its degradation policy
+
+        Callers must check policy.shed and reject the request when it is set.
+        """
+        with self._lock:
+            level = self._current_level_locked()
+            self._level_counts[level] += 1
+            if level >= self.MAX_LEVEL:
+                self._shed_count += 1
+            else:
+                self._in_flight += 1
+        policy = self.policy_for(level, top_k, max_completion_tokens)
+        try:
+            yield policy
+        finally:
+            if not policy.shed:
+                with self._lock:
+                    self._in_flight -= 1
+
+    @contextmanager
+    def occupy(self):
+        """
+        Count extra work of an already admitted request as in flight
+
+        For requests that fan out into several generations, so each one
+        weighs on the degradation level like a request of its own.
+        """
+        with self._lock:
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def record_latency(self, latency_ms: float) -> None:
+        """Record the wall time of one upstream generation call"""
+        with self._lock:
+            self._latencies.append((time.monotonic(), float(latency_ms)))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "degradation_level": self._current_level_locked(),
+                "in_flight": self._in_flight,
+                "latency_p90_ms": self._latency_p90(),
+                "shed": self._shed_count,
+                "admitted_by_level": list(self._level_counts),
+            }
+
+
+# Shared controller for RAG generation endpoints
+load_controller = LoadController()
@@ -7,7 +7,8 @@ from langchain_core.prompts import PromptTemplate
 from sqlalchemy.orm import Session
 from models.document import Document
 from models.question_analysis import QuestionAnalysis
-from services.document_loader import DocumentLoader
+from services.extraction_cache import extraction_cache
+from services.generation_scheduler import GenerationQueueTimeout, generation_scheduler
 from config import settings
 import json
 import re
@@ -61,9 +62,8 @@ class QuestionPaperAnalyzer:
         if document.document_type.value != "question_paper":
             raise ValueError("Document is not a question paper")
         
-        # Load document content
-        loader = DocumentLoader()
-        pages = loader.load_document(document.file_path)
+        # Load document content (cached after the first analysis)
+        pages = extraction_cache.load_document(document.file_path, document.content_hash)
         
         # Combine all page text
         full_text = "\n\n".join(page["text"] for page in pages)
@@ -71,7 +71,8 @@ class QuestionPaperAnalyzer:
         # Extract questions using LLM
         try:
             prompt = self.extraction_prompt.format(text=full_text)
-            response = self.llm.predict(prompt)
+            with generation_scheduler.slot():
+                response = self.llm.predict(prompt)
             
             # Parse JSON response
             # Remove markdown code blocks if present
@@ -87,6 +88,9 @@ class QuestionPaperAnalyzer:
             print(f"JSON parse error: {e}. Response: {response[:200]}")
             questions = self._fallback_extraction(full_text)
         
+        except GenerationQueueTimeout:
+            raise
+        
         except Exception as e:
             raise Exception(f"Error analyzing question paper: {str(e)}")
         
@@ -259,12 +263,16 @@ Return only the CO numbers as a JSON array, e.g., ["CO1", "CO2"]""",
                         co_descriptions=co_desc_text,
                         question_text=question["question_text"]
                     )
-                    response = self.llm.predict(prompt)
+                    with generation_scheduler.slot():
+                        response = self.llm.predict(prompt)
                     
                     # Parse response
                     co_mapping = json.loads(response)
                     question["co_mapping"] = co_mapping
                 
+                except GenerationQueueTimeout:
+                    raise
+                
                 except Exception as e:
                     print(f"Error mapping question to CO: {e}")
                     question["co_mapping"] = []
@@ -1,24 +1,40 @@
 """
 RAG pipeline service for retrieval-augmented generation
 """
-from typing import List, Dict, Any, Optional
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Callable, Tuple
+from uuid import UUID
 from langchain_openai import ChatOpenAI
 from langchain_community.chat_message_histories import ChatMessageHistory
 from langchain_core.prompts import PromptTemplate
 from langchain_core.documents import Document as LangchainDocument
 from langchain_core.messages import HumanMessage, AIMessage, BaseMessage
+from models import SessionLocal
+from models.query import Query
+from services.answer_cache import answer_cache
+from services.context_packer import pack_context
 from services.embeddings import EmbeddingService
+from services.generation_scheduler import GenerationQueueTimeout, generation_scheduler
 from config import settings
 
 
 class SimpleConversationMemory:
     """Simple conversation memory that stores messages"""
     
-    def __init__(self, memory_key: str = "chat_history", return_messages: bool = True, output_key: str = "answer"):
+    def __init__(
+        self,
+        memory_key: str = "chat_history",
+        return_messages: bool = True,
+        output_key: str = "answer",
+        max_messages: Optional[int] = None
+    ):
         """Initialize conversation memory"""
         self.memory_key = memory_key
         self.return_messages = return_messages
         self.output_key = output_key
+        self.max_messages = max_messages
         self.messages: List[BaseMessage] = []
         
     def save_context(self, inputs: Dict[str, str], outputs: Dict[str, str]):
@@ -27,6 +43,9 @@ class SimpleConversationMemory:
             self.messages.append(HumanMessage(content=inputs["input"]))
         if self.output_key in outputs:
             self.messages.append(AIMessage(content=outputs[self.output_key]))
+        if self.max_messages and len(self.messages) > self.max_messages:
+            # Keep only the most recent messages
+            del self.messages[:len(self.messages) - self.max_messages]
     
     def load_memory_variables(self) -> Dict[str, Any]:
         """Load memory variables"""
@@ -43,9 +62,149 @@ class SimpleConversationMemory:
                 self.messages = messages
         return ChatMemory(self.messages)
 
+
+class ConversationMemoryStore:
+    """
+    Bounded store of conversation memories keyed by user and session
+
+    Sessions are evicted least-recently-used once max_sessions is reached and
+    after idle_ttl_seconds without access. The queries table is the source of
+    truth: a miss rehydrates the session through the loader, once, scoped to
+    the session's owner. Sessions created in this process start empty without
+    a lookup.
+    """
+    
+    def __init__(
+        self,
+        max_sessions: int = None,
+        idle_ttl_seconds: int = None,
+        max_messages: int = None,
+        loader: Optional[Callable[[str, str, int], List[Tuple[str, str]]]] = None
+    ):
+        """Initialize memory store"""
+        self.max_sessions = max_sessions or settings.RAG_MEMORY_MAX_SESSIONS
+        self.idle_ttl_seconds = idle_ttl_seconds or settings.RAG_MEMORY_IDLE_TTL_SECONDS
+        self.max_messages = max_messages or settings.RAG_MEMORY_MAX_MESSAGES
+        self.loader = loader
+        
+        # (user_id, session_id) -> [memory, last_access]; ordered oldest access first
+        self._entries: "OrderedDict[Tuple[str, str], list]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._evictions = 0
+        self._rehydrations = 0
+    
+    def _new_memory(self) -> SimpleConversationMemory:
+        return SimpleConversationMemory(
+            memory_key="chat_history",
+            return_messages=True,
+            output_key="answer",
+            max_messages=self.max_messages
+        )
+    
+    def _evict(self, now: float):
+        # Caller must hold the lock. Oldest access is first, so stop at the first live entry.
+        while self._entries:
+            key, (_, last_access) = next(iter(self._entries.items()))
+            if now - last_access <= self.idle_ttl_seconds and len(self._entries) <= self.max_sessions:
+                break
+            del self._entries[key]
+            self._evictions += 1
+    
+    def _rehydrate(self, user_id: str, session_id: str) -> SimpleConversationMemory:
+        memory = self._new_memory()
+        if self.loader is None:
+            return memory
+        try:
+            exchanges = self.loader(user_id, session_id, self.max_messages // 2 or 1)
+        except Exception as e:
+            print(f"Error rehydrating memory for session {session_id}: {e}")
+            return memory
+        for user_query, answer in exchanges:
+            memory.save_context({"input": user_query}, {"answer": answer})
+        self._rehydrations += 1
+        return memory
+    
+    def get(
+        self,
+        user_id: Any,
+        session_id: str,
+        create: bool = True,
+        new_session: bool = False
+    ) -> Optional[SimpleConversationMemory]:
+        """
+        Return the memory for a user's session, rehydrating it from storage on a miss
+        
+        Args:
+            user_id: Owner of the session
+            session_id: Session identifier
+            create: Return an empty memory (rather than None) for unknown sessions
+            new_session: The session was just created, so there is nothing to load
+        """
+        key = (str(user_id), session_id)
+        now = time.time()
+        with self._lock:
+            self._evict(now)
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry[1] = now
+                self._entries.move_to_end(key)
+                return entry[0]
+        
+        # Load outside the lock so a slow database read does not block other sessions
+        memory = self._new_memory() if new_session else self._rehydrate(*key)
+        if not memory.messages and not create:
+            return None
+        
+        with self._lock:
+            # Another request may have loaded the session meanwhile; keep the first copy.
+            entry = self._entries.setdefault(key, [memory, now])
+            entry[1] = now
+            self._entries.move_to_end(key)
+            self._evict(now)
+            return entry[0]
+    
+    def discard(self, user_id: Any, session_id: str):
+        """Drop a session's memory"""
+        with self._lock:
+            self._entries.pop((str(user_id), session_id), None)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return session/message counts and approximate memory usage"""
+        with self._lock:
+            messages = [msg for memory, _ in self._entries.values() for msg in memory.messages]
+            return {
+                "sessions": len(self._entries),
+                "messages": len(messages),
+                "approx_bytes": sum(len(str(msg.content)) for msg in messages),
+                "max_sessions": self.max_sessions,
+                "max_messages_per_session": self.max_messages,
+                "evictions": self._evictions,
+                "rehydrations": self._rehydrations
+            }
+
+
+def load_session_exchanges(user_id: str, session_id: str, limit: int) -> List[Tuple[str, str]]:
+    """Load the most recent question/answer pairs of a user's session from the queries table"""
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(Query.query, Query.response)
+            .filter(Query.user_id == UUID(str(user_id)), Query.session_id == session_id)
+            .order_by(Query.timestamp.desc())
+            .limit(limit)
+            .all()
+        )
+        return [(row.query, row.response) for row in reversed(rows)]
+    finally:
+        db.close()
+
+
 class RAGPipeline:
     """RAG pipeline for question answering with document context"""
     
+    # Bump when qa_prompt changes so cached answers from the old prompt are not reused
+    PROMPT_VERSION = "qa-v1"
+    
     def __init__(self):
         """Initialize RAG pipeline"""
         self.embedding_service = EmbeddingService()
@@ -57,8 +216,8 @@ class RAGPipeline:
             temperature=settings.TEMPERATURE
         )
         
-        # Conversation memories by session
-        self.memories: Dict[str, SimpleConversationMemory] = {}
+        # Conversation memories by session (bounded, rehydrated from the queries table)
+        self.memories = ConversationMemoryStore(loader=load_session_exchanges)
         
         # Custom prompt template
         # Instruct the generator (sonar) to prioritize retrieved document context
@@ -75,15 +234,9 @@ class RAGPipeline:
             input_variables=["context", "question"]
         )
     
-    def _get_or_create_memory(self, session_id: str) -> SimpleConversationMemory:
-        """Get or create conversation memory for session"""
-        if session_id not in self.memories:
-            self.memories[session_id] = SimpleConversationMemory(
-                memory_key="chat_history",
-                return_messages=True,
-                output_key="answer"
-            )
-        return self.memories[session_id]
+    def _get_or_create_memory(self, user_id: Any, session_id: str, new_session: bool = False) -> SimpleConversationMemory:
+        """Get or create conversation memory for a user's session"""
+        return self.memories.get(user_id, session_id, new_session=new_session)
     
     def query(
         self,
@@ -92,7 +245,8 @@ class RAGPipeline:
         document_type: Optional[str] = None,
         session_id: Optional[str] = None,
         k: int = None,
-        current_college_id: str = None
+        current_college_id: str = None,
+        user_id: Any = None
     ) -> Dict[str, Any]:
         """
         Process a RAG query
@@ -103,28 +257,22 @@ class RAGPipeline:
             document_type: Optional document type filter
             session_id: Optional session ID for conversational memory
             k: Number of context chunks to retrieve
+            user_id: Owner of the session (memory is only kept with one)
         
         Returns:
             Dict with answer, sources, and metadata
         """
-        import time
         start_time = time.time()
-        
-        # Build filter dict - enforce college isolation
-        filter_dict = {}
-        if subject:
-            filter_dict["subject"] = subject
-        if document_type:
-            filter_dict["document_type"] = document_type
-        if current_college_id:
-            filter_dict["college_id"] = str(current_college_id)
+        filter_dict = self._build_filter(subject, document_type, current_college_id)
         
         # Retrieve relevant chunks
         try:
+            query_embedding = self.embedding_service.embed_query(user_query)
             results = self.embedding_service.similarity_search_with_score(
                 query=user_query,
                 k=k or settings.TOP_K_RESULTS,
-                filter_dict=filter_dict if filter_dict else None
+                filter_dict=filter_dict if filter_dict else None,
+                embedding=query_embedding
             )
         except Exception as e:
             return {
@@ -133,7 +281,93 @@ class RAGPipeline:
                 "error": True
             }
         
-        if not results:
+        return self.answer_from_results(
+            user_query,
+            results,
+            query_embedding=query_embedding,
+            session_id=session_id,
+            start_time=start_time,
+            user_id=user_id
+        )
+    
+    @staticmethod
+    def _build_filter(
+        subject: Optional[str],
+        document_type: Optional[str],
+        current_college_id: Optional[str]
+    ) -> Dict[str, Any]:
+        """Build the metadata filter - enforces college isolation"""
+        filter_dict = {}
+        if subject:
+            filter_dict["subject"] = subject
+        if document_type:
+            filter_dict["document_type"] = document_type
+        if current_college_id:
+            filter_dict["college_id"] = str(current_college_id)
+        return filter_dict
+    
+    def retrieve_batch(
+        self,
+        user_queries: List[str],
+        subject: Optional[str] = None,
+        document_type: Optional[str] = None,
+        k: int = None,
+        current_college_id: str = None
+    ) -> List[Tuple[List[float], List[Dict[str, Any]]]]:
+        """
+        Embed and search many questions at once
+        
+        Args:
+            user_queries: Questions to retrieve context for
+            subject: Optional subject filter
+            document_type: Optional document type filter
+            k: Number of context chunks per question
+        
+        Returns:
+            One (query embedding, search results) pair per question, in order
+        """
+        filter_dict = self._build_filter(subject, document_type, current_college_id)
+        query_embeddings = self.embedding_service.embed_queries(user_queries)
+        results = self.embedding_service.similarity_search_batch(
+            query_embeddings,
+            k=k or settings.TOP_K_RESULTS,
+            filter_dict=filter_dict if filter_dict else None
+        )
+        return list(zip(query_embeddings, results))
+    
+    def answer_from_results(
+        self,
+        user_query: str,
+        results: List[Dict[str, Any]],
+        query_embedding: Optional[List[float]] = None,
+        session_id: Optional[str] = None,
+        start_time: float = None,
+        user_id: Any = None,
+        max_tokens: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Pack retrieved chunks and generate (or reuse) an answer
+        
+        Args:
+            user_query: User's question
+            results: Search results for the question
+            query_embedding: Query embedding, used for semantic cache hits
+            session_id: Optional session ID for conversational memory
+            start_time: When handling started, for response_time
+            user_id: Owner of the session (memory is only kept with one)
+            max_tokens: Optional completion cap; capped answers are not cached
+        
+        Returns:
+            Dict with answer, sources, and metadata
+        """
+        start_time = start_time or time.time()
+        # Sessions are scoped to their owner; without one there is no memory to use.
+        session_key = session_id if user_id is not None else None
+        
+        # Merge overlapping neighbours and fit the best blocks into the context budget
+        blocks = pack_context(results) if results else []
+        if not blocks:
+            # Nothing usable to answer from; don't ask the LLM or cache an empty-context answer
             return {
                 "answer": "I couldn't find any relevant information in the uploaded documents. Please upload relevant documents or try rephrasing your question.",
                 "sources": [],
@@ -145,10 +379,10 @@ class RAGPipeline:
         sources = []
         context_chunks = []
         
-        for i, result in enumerate(results, 1):
-            content = result["content"]
-            metadata = result["metadata"]
-            score = result.get("score", 0)
+        for i, block in enumerate(blocks, 1):
+            content = block["content"]
+            metadata = block["metadata"]
+            score = block.get("score", 0)
             
             context_parts.append(f"[Source {i}]\n{content}\n")
             
@@ -165,22 +399,45 @@ class RAGPipeline:
             context_chunks.append({
                 "content": content,
                 "metadata": metadata,
-                "score": score
+                "score": score,
+                "chunk_ids": block["chunk_ids"]
             })
         
         context = "\n\n".join(context_parts)
         
+        # Reuse a previous answer generated from the same chunks when available
+        cache_key = answer_cache.build_context_key(
+            [chunk_hash for block in blocks for chunk_hash in block["chunk_hashes"]],
+            settings.PERPLEXITY_MODEL,
+            self.PROMPT_VERSION
+        )
+        cached_answer = answer_cache.get(cache_key, user_query, embedding=query_embedding)
+        if cached_answer is not None:
+            if session_key:
+                self.remember_exchange(user_id, session_id, user_query, cached_answer)
+            return {
+                "answer": cached_answer,
+                "sources": sources,
+                "context_chunks": context_chunks,
+                "session_id": session_id,
+                "response_time": int((time.time() - start_time) * 1000),
+                "cached": True
+            }
+        
         # Generate answer with LLM
+        generation_failed = False
+        llm_kwargs = {"max_tokens": max_tokens} if max_tokens else {}
         try:
             # If session_id provided, use conversational chain
-            if session_id:
-                memory = self._get_or_create_memory(session_id)
+            if session_key:
+                memory = self._get_or_create_memory(user_id, session_id)
                 
                 # Create conversational retrieval chain
                 # For simplicity, we'll use direct LLM call with memory
                 prompt = self.qa_prompt.format(context=context, question=user_query)
                 
-                response = self.llm.predict(prompt)
+                with generation_scheduler.slot():
+                    response = self.llm.predict(prompt, **llm_kwargs)
                 
                 # Update memory
                 memory.save_context(
@@ -190,12 +447,27 @@ class RAGPipeline:
             else:
                 # Direct query without memory
                 prompt = self.qa_prompt.format(context=context, question=user_query)
-                response = self.llm.predict(prompt)
+                with generation_scheduler.slot():
+                    response = self.llm.predict(prompt, **llm_kwargs)
             
             answer = response
         
+        except GenerationQueueTimeout:
+            # Overload is the caller's to report (503), not an answer to cache or share
+            raise
         except Exception as e:
             answer = f"Error generating answer: {str(e)}"
+            generation_failed = True
+        
+        # A capped answer may be cut short; don't serve it to uncapped requests later
+        if not generation_failed and not max_tokens:
+            answer_cache.set(
+                cache_key,
+                user_query,
+                answer,
+                document_ids=[chunk["metadata"].get("document_id") for chunk in context_chunks],
+                embedding=query_embedding
+            )
         
         # Calculate response time
         response_time = int((time.time() - start_time) * 1000)  # milliseconds
@@ -205,20 +477,28 @@ class RAGPipeline:
             "sources": sources,
             "context_chunks": context_chunks,
             "session_id": session_id,
-            "response_time": response_time
+            "response_time": response_time,
+            "cached": False,
+            "error": generation_failed
         }
     
-    def clear_memory(self, session_id: str):
-        """Clear conversation memory for a session"""
-        if session_id in self.memories:
-            del self.memories[session_id]
+    def remember_exchange(self, user_id: Any, session_id: str, user_query: str, answer: str, new_session: bool = False):
+        """Record a question/answer pair in a user's session memory"""
+        self._get_or_create_memory(user_id, session_id, new_session=new_session).save_context(
+            {"input": user_query},
+            {"answer": answer}
+        )
     
-    def get_chat_history(self, session_id: str) -> List[Dict[str, str]]:
-        """Get chat history for a session"""
-        if session_id not in self.memories:
+    def clear_memory(self, user_id: Any, session_id: str):
+        """Clear conversation memory for a user's session"""
+        self.memories.discard(user_id, session_id)
+    
+    def get_chat_history(self, user_id: Any, session_id: str) -> List[Dict[str, str]]:
+        """Get chat history for a user's session"""
+        memory = self.memories.get(user_id, session_id, create=False)
+        if memory is None:
             return []
         
-        memory = self.memories[session_id]
         messages = memory.chat_memory.messages
         
         history = []
@@ -229,3 +509,7 @@ class RAGPipeline:
             })
         
         return history
+    
+    def memory_stats(self) -> Dict[str, Any]:
+        """Get conversation memory usage statistics"""
+        return self.memories.stats()
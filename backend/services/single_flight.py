@@ -0,0 +1,72 @@
+"""
+Single-flight de-duplication of identical in-flight async work
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class SingleFlight:
+    """
+    Share one computation between concurrent callers using the same key.
+
+    The first caller for a key starts the work as its own task; callers that
+    arrive while it is still running await that task instead of starting
+    another. The task is shielded, so a caller that disconnects does not
+    cancel the work for the others; once every caller has been cancelled
+    the task itself is cancelled. De-duplication is per process only.
+    """
+
+    def __init__(self):
+        """Initialize single-flight group"""
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._waiters: Dict[asyncio.Future, int] = {}
+        self._leaders = 0
+        self._followers = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Run fn once per key among concurrent callers
+
+        Returns:
+            Tuple of (result, shared) where shared is True for followers
+        """
+        task = self._inflight.get(key)
+        shared = task is not None
+
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done, k=key: self._forget(k, done))
+            self._leaders += 1
+        else:
+            self._followers += 1
+
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task), shared
+        except asyncio.CancelledError:
+            if self._waiters.get(task) == 1 and not task.done():
+                # Nobody is left to receive the result.
+                task.cancel()
+            raise
+        finally:
+            remaining = self._waiters.get(task, 1) - 1
+            if remaining > 0:
+                self._waiters[task] = remaining
+            else:
+                self._waiters.pop(task, None)
+
+    def _forget(self, key: Hashable, task: asyncio.Future) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Mark the exception as retrieved; each awaiting caller re-raises it.
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, int]:
+        """Return in-flight count and leader/follower counters."""
+        return {
+            "in_flight": len(self._inflight),
+            "leaders": self._leaders,
+            "followers": self._followers,
+        }
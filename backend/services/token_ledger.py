@@ -0,0 +1,231 @@
+"""
+Daily token budget ledger with atomic reservations
+"""
+import threading
+import time
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import func, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from config import settings
+from models import SessionLocal
+from models.token_limit import UserDailyTokenUsage, UserTokenLimit
+
+
+@dataclass
+class TokenReservation:
+    """Tokens held against a user's daily budget until reconciled or released."""
+
+    user_id: Any
+    usage_date: date
+    tokens: int
+    tokens_used: int
+    daily_limit: int
+    settled: bool = False
+
+    @property
+    def remaining(self) -> int:
+        return max(0, self.daily_limit - self.tokens_used)
+
+
+class TokenLedger:
+    """
+    Per-user daily token accounting backed by user_daily_token_usage
+
+    Budget is reserved up front with a single conditional UPSERT that only
+    increments tokens_used while the result stays within the daily limit,
+    so concurrent requests from one user can never overspend. After the
+    provider reports real usage the reservation is reconciled with one
+    atomic increment of the difference. Limits and the last known usage
+    are cached in memory for a short TTL so that the pre-check and the
+    limit lookup need no database round-trip on the hot path.
+    """
+
+    def __init__(self, cache_ttl_seconds: int = None):
+        self.cache_ttl = cache_ttl_seconds or settings.TOKEN_LEDGER_CACHE_TTL_SECONDS
+        self._lock = threading.Lock()
+        # user_id -> (expires_at, daily_limit)
+        self._limits: Dict[str, Tuple[float, int]] = {}
+        # (user_id, usage_date) -> (expires_at, tokens_used)
+        self._usage: Dict[Tuple[str, date], Tuple[float, int]] = {}
+
+    def daily_limit(self, user_id) -> int:
+        """Return the user's daily limit, cached for the ledger TTL"""
+        key = str(user_id)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._limits.get(key)
+            if cached and cached[0] > now:
+                return cached[1]
+
+        db = SessionLocal()
+        try:
+            limit_row = db.query(UserTokenLimit.daily_token_limit).filter(UserTokenLimit.user_id == user_id).first()
+        finally:
+            db.close()
+        limit = max(1, int(limit_row.daily_token_limit if limit_row else settings.DEFAULT_DAILY_TOKEN_LIMIT))
+
+        with self._lock:
+            self._limits[key] = (now + self.cache_ttl, limit)
+        return limit
+
+    def snapshot(self, user_id, usage_date: date = None) -> Tuple[int, int]:
+        """
+        Return (daily_limit, tokens_used) for a fast pre-check
+
+        The usage figure may be up to one TTL stale; reserve() is what
+        actually enforces the limit.
+        """
+        usage_date = usage_date or date.today()
+        limit = self.daily_limit(user_id)
+        key = (str(user_id), usage_date)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._usage.get(key)
+            if cached and cached[0] > now:
+                return limit, cached[1]
+
+        db = SessionLocal()
+        try:
+            usage = (
+                db.query(UserDailyTokenUsage.tokens_used)
+                .filter(UserDailyTokenUsage.user_id == user_id, UserDailyTokenUsage.usage_date == usage_date)
+                .first()
+            )
+        finally:
+            db.close()
+        used = int(usage.tokens_used) if usage else 0
+        self._remember_usage(user_id, usage_date, used)
+        return limit, used
+
+    def reserve(self, user_id, tokens: int, usage_date: date = None) -> Optional[TokenReservation]:
+        """
+        Atomically hold tokens against today's budget and count the request
+
+        Args:
+            user_id: User to charge
+            tokens: Tokens to hold (0 just counts the request)
+            usage_date: Accounting day, defaults to today
+
+        Returns:
+            The reservation, or None when it would exceed the daily limit
+        """
+        usage_date = usage_date or date.today()
+        tokens = max(0, int(tokens))
+        limit = self.daily_limit(user_id)
+        if tokens > limit:
+            return None
+
+        table = UserDailyTokenUsage.__table__
+        now = datetime.utcnow()
+        statement = pg_insert(table).values(
+            user_id=user_id,
+            usage_date=usage_date,
+            tokens_used=tokens,
+            request_count=1,
+            created_at=now,
+            updated_at=now,
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.user_id, table.c.usage_date],
+            set_={
+                "tokens_used": table.c.tokens_used + tokens,
+                "request_count": table.c.request_count + 1,
+                "updated_at": now,
+            },
+            where=table.c.tokens_used + tokens <= limit,
+        ).returning(table.c.tokens_used)
+
+        db = SessionLocal()
+        try:
+            used = db.execute(statement).scalar()
+            db.commit()
+        finally:
+            db.close()
+
+        if used is None:
+            # Conflict row exists but the guard rejected the increment.
+            with self._lock:
+                self._usage.pop((str(user_id), usage_date), None)
+            return None
+
+        self._remember_usage(user_id, usage_date, int(used))
+        return TokenReservation(
+            user_id=user_id,
+            usage_date=usage_date,
+            tokens=tokens,
+            tokens_used=int(used),
+            daily_limit=limit,
+        )
+
+    def reconcile(self, reservation: TokenReservation, actual_tokens: int) -> TokenReservation:
+        """Replace the reserved amount with the provider-reported usage"""
+        if reservation.settled:
+            return reservation
+        delta = int(actual_tokens) - reservation.tokens
+        reservation.tokens_used = self._adjust(reservation, delta, request_delta=0)
+        reservation.tokens = int(actual_tokens)
+        reservation.settled = True
+        return reservation
+
+    def release(self, reservation: TokenReservation) -> None:
+        """Return a reservation whose request failed before spending tokens"""
+        if reservation.settled:
+            return
+        reservation.tokens_used = self._adjust(reservation, -reservation.tokens, request_delta=-1)
+        reservation.tokens = 0
+        reservation.settled = True
+
+    def invalidate(self, user_id=None) -> None:
+        """Drop cached limits and usage (all users when user_id is None)"""
+        with self._lock:
+            if user_id is None:
+                self._limits.clear()
+                self._usage.clear()
+                return
+            key = str(user_id)
+            self._limits.pop(key, None)
+            for usage_key in [usage_key for usage_key in self._usage if usage_key[0] == key]:
+                self._usage.pop(usage_key, None)
+
+    def _adjust(self, reservation: TokenReservation, delta: int, request_delta: int) -> int:
+        if delta == 0 and request_delta == 0:
+            return reservation.tokens_used
+
+        table = UserDailyTokenUsage.__table__
+        statement = (
+            update(table)
+            .where(table.c.user_id == reservation.user_id, table.c.usage_date == reservation.usage_date)
+            .values(
+                tokens_used=func.greatest(0, table.c.tokens_used + delta),
+                request_count=func.greatest(0, table.c.request_count + request_delta),
+                updated_at=datetime.utcnow(),
+            )
+            .returning(table.c.tokens_used)
+        )
+        db = SessionLocal()
+        try:
+            used = db.execute(statement).scalar()
+            db.commit()
+        finally:
+            db.close()
+
+        used = int(used) if used is not None else max(0, reservation.tokens_used + delta)
+        self._remember_usage(reservation.user_id, reservation.usage_date, used)
+        return used
+
+    def _remember_usage(self, user_id, usage_date: date, tokens_used: int) -> None:
+        with self._lock:
+            self._usage[(str(user_id), usage_date)] = (time.monotonic() + self.cache_ttl, tokens_used)
+            if len(self._usage) > settings.TOKEN_LEDGER_CACHE_MAX_USERS:
+                now = time.monotonic()
+                for cache in (self._usage, self._limits):
+                    for key in [key for key, (expires_at, _) in cache.items() if expires_at <= now]:
+                        cache.pop(key, None)
+
+
+# Shared ledger for chat token budgets
+token_ledger = TokenLedger()
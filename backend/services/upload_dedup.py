@@ -0,0 +1,285 @@
+"""
+Content-hash deduplication of uploaded files
+"""
+import hashlib
+import os
+import uuid
+from dataclasses import dataclass
+from typing import Any, BinaryIO, Optional, Tuple
+
+import aiofiles
+from fastapi import UploadFile
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from config import settings
+from utils.helpers import generate_file_hash
+
+
+class UploadTooLarge(Exception):
+    """Raised when an upload grows past the configured size limit"""
+
+
+@dataclass
+class StoredUpload:
+    """Where an upload's bytes ended up and which earlier upload it duplicates."""
+
+    file_path: str
+    file_size: int
+    content_hash: str
+    duplicate_of_id: Any = None
+
+
+async def write_upload(upload: UploadFile, destination_path: str, max_size: int = None) -> Tuple[int, str]:
+    """
+    Stream an upload to disk in one pass, hashing it and enforcing the size limit
+
+    Blocks are read from the upload and written with aiofiles, so neither
+    side of the copy blocks the event loop. The limit is checked as blocks
+    arrive; an upload that exceeds it is abandoned and the partial file removed.
+
+    Args:
+        upload: Incoming file
+        destination_path: Path to write
+        max_size: Byte limit (defaults to MAX_UPLOAD_SIZE)
+
+    Returns:
+        Tuple of (bytes written, SHA256 hex digest)
+    """
+    max_size = settings.MAX_UPLOAD_SIZE if max_size is None else max_size
+    sha256_hash = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(destination_path, "wb") as f:
+            while True:
+                block = await upload.read(settings.UPLOAD_CHUNK_SIZE)
+                if not block:
+                    break
+                size += len(block)
+                if size > max_size:
+                    raise UploadTooLarge(f"Upload exceeds {max_size} bytes")
+                sha256_hash.update(block)
+                await f.write(block)
+    except BaseException:
+        if os.path.exists(destination_path):
+            os.remove(destination_path)
+        raise
+    return size, sha256_hash.hexdigest()
+
+
+def write_stream(source: BinaryIO, destination_path: str, max_size: int = None) -> Tuple[int, str]:
+    """
+    Blocking counterpart of write_upload for file objects (e.g. archive members)
+
+    Returns:
+        Tuple of (bytes written, SHA256 hex digest)
+    """
+    max_size = settings.MAX_UPLOAD_SIZE if max_size is None else max_size
+    sha256_hash = hashlib.sha256()
+    size = 0
+    try:
+        with open(destination_path, "wb") as f:
+            for block in iter(lambda: source.read(settings.UPLOAD_CHUNK_SIZE), b""):
+                size += len(block)
+                if size > max_size:
+                    raise UploadTooLarge(f"Upload exceeds {max_size} bytes")
+                sha256_hash.update(block)
+                f.write(block)
+    except BaseException:
+        if os.path.exists(destination_path):
+            os.remove(destination_path)
+        raise
+    return size, sha256_hash.hexdigest()
+
+
+def find_canonical(db: Session, model, content_hash: str, exclude_id=None) -> Optional[Any]:
+    """
+    Live, non-duplicate row of a model (Document / CourseMaterial) holding this content
+
+    Args:
+        db: Database session
+        model: Mapped class with content_hash, duplicate_of_id and is_deleted
+        content_hash: SHA256 hex digest
+        exclude_id: Row to ignore (the one being checked)
+    """
+    query = db.query(model).filter(
+        model.content_hash == content_hash,
+        model.duplicate_of_id.is_(None),
+        model.is_deleted == False,
+    )
+    if exclude_id is not None:
+        query = query.filter(model.id != exclude_id)
+    return query.first()
+
+
+async def store_upload(db: Session, model, upload: UploadFile, file_path: str, max_size: int = None) -> StoredUpload:
+    """
+    Write an upload to disk unless identical content is already stored
+
+    The file is streamed to a temporary path next to file_path (see
+    write_upload) and renamed into place only once complete, so a
+    partially written file is never visible at file_path. If a canonical
+    row with the same hash exists, the copy is discarded and the existing
+    stored file is reused.
+
+    Args:
+        db: Database session
+        model: Mapped class the upload will become a row of
+        upload: Incoming file
+        file_path: Destination for new content
+        max_size: Byte limit (defaults to MAX_UPLOAD_SIZE)
+
+    Returns:
+        The stored location, size, hash and canonical row id (if a duplicate)
+
+    Raises:
+        UploadTooLarge: The upload exceeded the limit; nothing is stored
+    """
+    temp_path = f"{file_path}.{uuid.uuid4().hex}.part"
+    file_size, content_hash = await write_upload(upload, temp_path, max_size)
+    return _settle_upload(db, model, temp_path, file_path, file_size, content_hash)
+
+
+def store_stream(db: Session, model, source: BinaryIO, file_path: str, max_size: int = None) -> StoredUpload:
+    """Blocking counterpart of store_upload for file objects (e.g. archive members)"""
+    temp_path = f"{file_path}.{uuid.uuid4().hex}.part"
+    file_size, content_hash = write_stream(source, temp_path, max_size)
+    return _settle_upload(db, model, temp_path, file_path, file_size, content_hash)
+
+
+def _settle_upload(db: Session, model, temp_path: str, file_path: str, file_size: int, content_hash: str) -> StoredUpload:
+    canonical = find_canonical(db, model, content_hash)
+    if canonical is not None:
+        os.remove(temp_path)
+        return StoredUpload(canonical.file_path, file_size, content_hash, canonical.id)
+
+    os.replace(temp_path, file_path)
+    return StoredUpload(file_path, file_size, content_hash)
+
+
+def commit_upload(db: Session, model, row) -> None:
+    """
+    Insert an upload row, linking it to a canonical row that won a race
+
+    Two identical uploads can both find no canonical row; the partial
+    unique index on content_hash rejects the second, which is then stored
+    as a duplicate of the first and its own copy of the file removed.
+    """
+    db.add(row)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        canonical = find_canonical(db, model, row.content_hash) if row.content_hash else None
+        if canonical is None:
+            raise
+        own_file = row.file_path
+        row.file_path = canonical.file_path
+        row.duplicate_of_id = canonical.id
+        db.add(row)
+        db.commit()
+        if own_file != canonical.file_path and os.path.exists(own_file):
+            os.remove(own_file)
+    db.refresh(row)
+
+
+def _promote_heir(db: Session, model, row_id) -> Optional[Any]:
+    """
+    Hand a canonical row's role to its oldest live duplicate
+
+    The other live duplicates are re-pointed at the heir, which keeps the
+    stored file they all share. Call only after the row has released its
+    hash (flushed as deleted or with new content), so the heir can claim
+    it under the unique index.
+
+    Returns:
+        The heir, or None when the row had no live duplicates
+    """
+    duplicates = (
+        db.query(model)
+        .filter(model.duplicate_of_id == row_id, model.is_deleted == False)
+        .order_by(model.uploaded_at)
+        .all()
+    )
+    if not duplicates:
+        return None
+    heir = duplicates[0]
+    heir.duplicate_of_id = None
+    for duplicate in duplicates[1:]:
+        duplicate.duplicate_of_id = heir.id
+    return heir
+
+
+def replace_upload(db: Session, model, row, stored: StoredUpload) -> None:
+    """
+    Point an existing row at newly stored content (a re-upload)
+
+    If the row was the canonical holder of its old content, the oldest
+    duplicate of it takes over that role and the old file, which the
+    duplicates already point at; with no duplicates the old file is removed.
+
+    Args:
+        db: Database session (committed here)
+        model: Mapped class of the row
+        row: Row being re-uploaded
+        stored: Result of store_upload for the new content
+    """
+    if stored.content_hash == row.content_hash:
+        # Same bytes as before: store_upload already reused the stored file
+        return
+
+    old_file = row.file_path
+    was_canonical = row.duplicate_of_id is None
+
+    row.file_path = stored.file_path
+    row.file_size = stored.file_size
+    row.content_hash = stored.content_hash
+    row.duplicate_of_id = stored.duplicate_of_id
+    # Release the old hash before an heir claims it under the unique index
+    db.flush()
+
+    heir = _promote_heir(db, model, row.id) if was_canonical else None
+    db.commit()
+    db.refresh(row)
+
+    if was_canonical and heir is None and old_file and old_file != row.file_path and os.path.exists(old_file):
+        os.remove(old_file)
+
+
+def delete_upload(db: Session, model, row) -> None:
+    """
+    Soft delete an upload row without orphaning its duplicates
+
+    If the row was canonical, its oldest live duplicate takes over the
+    role (see replace_upload), so later uploads of the same content are
+    still recognised and the duplicates keep a live canonical to clone
+    chunks from. The stored file stays where it is.
+
+    Args:
+        db: Database session (committed here)
+        model: Mapped class of the row
+        row: Row being deleted
+    """
+    was_canonical = row.duplicate_of_id is None
+    row.is_deleted = True
+    # Release the hash before an heir claims it under the unique index
+    db.flush()
+    if was_canonical:
+        _promote_heir(db, model, row.id)
+    db.commit()
+
+
+def backfill_content_hash(db: Session, model, row) -> None:
+    """
+    Hash a row uploaded before deduplication existed
+
+    The row becomes canonical for its content, or a duplicate of the row
+    that already is. Does nothing when the hash is known or the file is gone.
+    """
+    if row.content_hash or not row.file_path or not os.path.exists(row.file_path):
+        return
+    row.content_hash = generate_file_hash(row.file_path)
+    canonical = find_canonical(db, model, row.content_hash, exclude_id=row.id)
+    if canonical is not None:
+        row.duplicate_of_id = canonical.id
+    db.commit()
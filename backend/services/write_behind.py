@@ -0,0 +1,215 @@
+"""
+Write-behind queue that batches append-only inserts off the request path
+"""
+import asyncio
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from config import settings
+from models import SessionLocal
+
+
+class WriteBehindError(Exception):
+    """Raised by barrier() when buffered rows for its key could not be written"""
+
+
+class WriteBehindQueue:
+    """
+    Buffer ORM rows in process and insert them in multi-row batches
+
+    Rows are grouped by table and written with one executemany INSERT per
+    table, which SQLAlchemy renders as multi-row VALUES statements. Only
+    append-only rows belong here: nothing may depend on their generated
+    ids in the same request. Content-addressed rows can be queued with
+    ignore_conflicts so rows that already exist are skipped. Each enqueue may carry a barrier key so that
+    a later reader of the same data (e.g. the next turn of a chat session)
+    can force its pending rows to disk first, and an on_written callback
+    that runs once the row is committed.
+    """
+
+    def __init__(
+        self,
+        flush_interval_ms: int = None,
+        max_batch_rows: int = None,
+        max_attempts: int = 3
+    ):
+        self.flush_interval = (flush_interval_ms or settings.WRITE_BEHIND_FLUSH_MS) / 1000
+        self.max_batch_rows = max_batch_rows or settings.WRITE_BEHIND_MAX_BATCH_ROWS
+        self.max_attempts = max_attempts
+        # (target, values, key, attempts, on_written)
+        self._pending: List[Tuple[Any, Dict[str, Any], Optional[Hashable], int, Optional[Callable[[], None]]]] = []
+        self._pending_keys: Dict[Hashable, int] = {}
+        # Rows dropped per barrier key since its last barrier, so the barrier can report them
+        self._dropped_keys: Dict[Hashable, int] = {}
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {"enqueued": 0, "written": 0, "batches": 0, "failed_batches": 0, "dropped": 0}
+
+    def start(self):
+        """Start the periodic flusher on the running event loop"""
+        if self._task is not None and not self._task.done():
+            return
+        self._flush_lock = asyncio.Lock()
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flusher and durably write everything still buffered"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Retry until the buffer is empty or every row has used its attempts.
+        while self._pending:
+            await self.flush()
+
+    def enqueue(
+        self,
+        model,
+        values: Dict[str, Any],
+        key: Optional[Hashable] = None,
+        ignore_conflicts: bool = False,
+        on_written: Optional[Callable[[], None]] = None
+    ):
+        """
+        Queue one row for insertion
+
+        Args:
+            model: Mapped ORM class the row belongs to
+            values: Column values; include any default you need to read back
+            key: Optional barrier key readers can wait on
+            ignore_conflicts: Skip the row if its primary key already exists
+            on_written: Called on the event loop after the row is committed
+        """
+        self._pending.append(((model, ignore_conflicts), values, key, 0, on_written))
+        if key is not None:
+            self._pending_keys[key] = self._pending_keys.get(key, 0) + 1
+        self._stats["enqueued"] += 1
+        if self._wake is not None and len(self._pending) >= self.max_batch_rows:
+            self._wake.set()
+
+    def has_pending(self, key: Hashable) -> bool:
+        return self._pending_keys.get(key, 0) > 0
+
+    async def barrier(self, key: Hashable):
+        """
+        Flush until no rows for key are buffered
+
+        Rows whose batch failed are retried immediately, up to max_attempts.
+        Rows for key dropped since the previous barrier, including by
+        background flushes, are reported once and then forgotten.
+
+        Raises:
+            WriteBehindError: Rows for key were dropped or are still unwritten
+        """
+        for _ in range(self.max_attempts):
+            if not self.has_pending(key):
+                break
+            await self.flush()
+        dropped = self._dropped_keys.pop(key, 0)
+        if dropped:
+            raise WriteBehindError(f"{dropped} buffered rows could not be written")
+        if self.has_pending(key):
+            raise WriteBehindError("Buffered rows are still waiting to be written")
+
+    async def flush(self):
+        """Write every buffered row"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, []
+            error = await asyncio.to_thread(self._write_batch, batch)
+            if error is None:
+                self._written(batch)
+                self._stats["batches"] += 1
+                return
+
+            self._stats["failed_batches"] += 1
+            retry, dropped = [], []
+            for target, values, key, attempts, on_written in batch:
+                item = (target, values, key, attempts + 1, on_written)
+                (dropped if attempts + 1 >= self.max_attempts else retry).append(item)
+            if len(dropped) > 1:
+                # Isolate the offending rows instead of losing the whole batch.
+                rescued = []
+                for item in dropped:
+                    if await asyncio.to_thread(self._write_batch, [item]) is None:
+                        rescued.append(item)
+                self._written(rescued)
+                dropped = [item for item in dropped if item not in rescued]
+            if dropped:
+                self._release_keys(dropped)
+                for _, _, key, _, _ in dropped:
+                    if key is not None:
+                        self._dropped_keys[key] = self._dropped_keys.get(key, 0) + 1
+                self._stats["dropped"] += len(dropped)
+                print(f"Write-behind dropped {len(dropped)} rows after error: {error}")
+            # Keep the surviving rows ahead of anything queued meanwhile.
+            self._pending = retry + self._pending
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Write-behind flush error: {e}")
+
+    def _written(self, batch):
+        self._release_keys(batch)
+        self._stats["written"] += len(batch)
+        for _, _, _, _, on_written in batch:
+            if on_written is not None:
+                on_written()
+
+    def _release_keys(self, batch):
+        for _, _, key, _, _ in batch:
+            if key is None:
+                continue
+            remaining = self._pending_keys.get(key, 0) - 1
+            if remaining > 0:
+                self._pending_keys[key] = remaining
+            else:
+                self._pending_keys.pop(key, None)
+
+    @staticmethod
+    def _write_batch(batch) -> Optional[Exception]:
+        """Insert a batch in one transaction (runs on a worker thread)"""
+        by_model: "OrderedDict[Any, List[Dict[str, Any]]]" = OrderedDict()
+        for target, values, _, _, _ in batch:
+            by_model.setdefault(target, []).append(values)
+
+        db = SessionLocal()
+        try:
+            for (model, ignore_conflicts), rows in by_model.items():
+                if ignore_conflicts:
+                    statement = pg_insert(model.__table__).on_conflict_do_nothing()
+                else:
+                    statement = model.__table__.insert()
+                db.execute(statement, rows)
+            db.commit()
+            return None
+        except Exception as e:
+            db.rollback()
+            return e
+        finally:
+            db.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._stats, "pending": len(self._pending)}
+
+
+# Shared queue for query and chat history rows
+write_behind = WriteBehindQueue()
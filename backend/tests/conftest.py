@@ -0,0 +1,101 @@
+"""
+Shared fixtures for the backend test suite
+
+Tests run against an in-memory SQLite database and a temporary FAISS
+directory, with local deterministic embeddings. Run from backend/:
+
+    python -m pytest -q
+"""
+import os
+import sys
+import tempfile
+import uuid
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# Settings are read at import time; keep the suite off real services.
+_scratch = tempfile.mkdtemp(prefix="backend-tests-")
+os.environ["OPENAI_API_KEY"] = ""
+os.environ.setdefault("PERPLEXITY_API_KEY", "test")
+os.environ["FAISS_INDEX_PATH"] = os.path.join(_scratch, "vectorstore")
+os.environ["UPLOAD_FOLDER"] = os.path.join(_scratch, "uploads")
+os.environ["EXTRACTION_CACHE_PATH"] = os.path.join(_scratch, "extraction_cache")
+os.makedirs(os.environ["UPLOAD_FOLDER"], exist_ok=True)
+
+import pytest  # noqa: E402
+from sqlalchemy import create_engine, event  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+from sqlalchemy.pool import StaticPool  # noqa: E402
+from sqlalchemy.schema import ColumnDefault  # noqa: E402
+
+import models  # noqa: E402
+from models import Base  # noqa: E402
+
+
+def _adapt_schema_for_sqlite() -> None:
+    """Swap Postgres-only defaults and partial index predicates for SQLite equivalents"""
+    for table in Base.metadata.sorted_tables:
+        for column in table.columns:
+            default = getattr(column.server_default, "arg", None)
+            if default is not None and "gen_random_uuid" in str(default):
+                column.server_default = None
+                column.default = ColumnDefault(uuid.uuid4)
+        for index in table.indexes:
+            where = index.dialect_options["postgresql"].get("where")
+            if where is not None:
+                index.dialect_options["sqlite"]["where"] = where
+
+
+_adapt_schema_for_sqlite()
+
+
+@pytest.fixture
+def session_factory(monkeypatch):
+    """Fresh in-memory database; every module's SessionLocal points at it"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    # SQLite's multi-argument max() is Postgres' greatest()
+    event.listen(engine, "connect", lambda connection, _: connection.create_function("greatest", -1, max))
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    original = models.SessionLocal
+    for module in list(sys.modules.values()):
+        if getattr(module, "SessionLocal", None) is original:
+            monkeypatch.setattr(module, "SessionLocal", factory)
+    yield factory
+    engine.dispose()
+
+
+@pytest.fixture
+def db(session_factory):
+    session = session_factory()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def user(db):
+    from models.user import User
+
+    row = User(id=uuid.uuid4(), email=f"{uuid.uuid4().hex[:8]}@example.edu", password_hash="x")
+    db.add(row)
+    db.commit()
+    return row
+
+
+@pytest.fixture
+def embedding_service(monkeypatch, tmp_path):
+    """Empty vector store in its own directory (local deterministic embeddings)"""
+    from config import settings
+    from services.embeddings import EmbeddingService
+
+    monkeypatch.setattr(settings, "FAISS_INDEX_PATH", str(tmp_path / "vectorstore"))
+    return EmbeddingService()
+
+
+def index_pages(service, document_id, pages, metadata):
+    """Chunk, embed and add pages to a vector store; returns the chunks"""
+    subject_keys = set()
+    chunks = list(service.iter_chunks(document_id, pages, metadata, subject_keys=subject_keys))
+    service.add_embedded_chunks(document_id, chunks, service.embed_chunks(chunks), subject_keys)
+    return chunks
@@ -0,0 +1,51 @@
+from datetime import datetime
+
+from models.ingestion_job import IngestionJob, IngestionJobStatus, IngestionSource
+from services.answer_cache import AnswerCache
+from services.context_packer import pack_context
+
+
+def _result(content, chunk_id="doc-1_p1_c0", **metadata):
+    return {"content": content, "score": 0.9, "metadata": {"chunk_id": chunk_id, "document_id": "doc-1", **metadata}}
+
+
+def _key(results):
+    blocks = pack_context(results)
+    return AnswerCache.build_context_key(
+        [chunk_hash for block in blocks for chunk_hash in block["chunk_hashes"]], "model", "v1"
+    )
+
+
+def test_context_key_changes_when_chunk_text_changes_under_same_id():
+    assert _key([_result("Kirchhoff's current law")]) != _key([_result("Kirchhoff's voltage law")])
+
+
+def test_context_key_uses_recorded_chunk_hash():
+    assert _key([_result("old text", chunk_hash="abc")]) == _key([_result("new text", chunk_hash="abc")])
+
+
+def test_cached_answer_survives_until_its_document_is_reindexed(session_factory, db):
+    cache = AnswerCache(ttl_seconds=60, similarity_threshold=1.0, max_entries=10, enabled=True)
+    key = _key([_result("Kirchhoff's current law")])
+    cache.set(key, "What is KCL?", "answer", document_ids=["doc-1"])
+    cache.set(_key([_result("Ohm", chunk_id="doc-2_p1_c0")]), "What is Ohm?", "other", document_ids=["doc-2"])
+
+    assert cache.sync_invalidations() == 0
+    assert cache.get(key, "what is kcl") == "answer"
+
+    db.add(IngestionJob(
+        source_type=IngestionSource.DOCUMENT,
+        source_id="doc-1",
+        status=IngestionJobStatus.SUCCEEDED,
+        progress={},
+        finished_at=datetime.utcnow(),
+    ))
+    db.commit()
+
+    assert cache.sync_invalidations() == 1
+    assert cache.get(key, "what is kcl") is None
+    assert cache.stats()["entries"] == 1
+    # The same job is not applied twice
+    cache.set(key, "What is KCL?", "fresh", document_ids=["doc-1"])
+    assert cache.sync_invalidations() == 0
+    assert cache.get(key, "what is kcl") == "fresh"
@@ -0,0 +1,248 @@
+import io
+import os
+import time
+import zipfile
+from datetime import datetime, timedelta
+
+import py7zr
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from config import settings
+from models import get_db
+from models.course_material import Course, CourseMaterial, MaterialType
+from models.material_import import MaterialImport, MaterialImportStatus
+from models.role import Role, UserRole
+from models.user import User
+from routes import course_materials
+from services.archive_import import (
+    ArchiveImporter,
+    expire_stale_imports,
+    iter_archive_members,
+    lease_deadline,
+    material_type_for_folders,
+)
+from utils.auth import get_current_faculty_or_admin_user
+
+
+def _zip(tmp_path, members):
+    path = tmp_path / "materials.zip"
+    with zipfile.ZipFile(path, "w") as archive:
+        for name, content in members.items():
+            archive.writestr(name, content)
+    return str(path)
+
+
+def _7z(tmp_path, members):
+    path = tmp_path / "materials.7z"
+    with py7zr.SevenZipFile(path, "w") as archive:
+        for name, content in members.items():
+            archive.writef(io.BytesIO(content), name)
+    return str(path)
+
+
+def _by_path(results):
+    return {result["path"]: result for result in results}
+
+
+@pytest.fixture
+def courses(db, user):
+    rows = [Course(code="CS101", name="Programming", created_by=user.id), Course(code="EE201", name="Circuits")]
+    db.add_all(rows)
+    db.commit()
+    return {row.code: row for row in rows}
+
+
+@pytest.mark.parametrize("folders, expected", [
+    (["QP"], MaterialType.question_paper),
+    (["Previous Papers"], MaterialType.question_paper),
+    (["lecture-notes"], MaterialType.notes),
+    (["notes", "pdfs"], MaterialType.pdf),
+    (["unit 1"], None),
+    # No syllabus material type exists; such folders take the default type
+    (["syllabus"], None),
+])
+def test_material_type_folders(folders, expected):
+    assert material_type_for_folders(folders) is expected
+
+
+def test_folders_map_members_to_courses_and_types(db, user, courses, tmp_path):
+    archive = _zip(tmp_path, {
+        "Semester 3/CS101 - Programming/qp/2024.pdf": b"cs question paper",
+        "Semester 3/CS101 - Programming/unit1.txt": b"cs unit one",
+        "ee201/Slides/kirchhoff.pdf": b"ee slides",
+        "MA301/notes/calculus.pdf": b"unknown course",
+        "CS101/notes/nested.zip": b"PK",
+        "CS101/notes/run.exe": b"binary",
+        "__MACOSX/CS101/._unit1.txt": b"clutter",
+    })
+
+    results = _by_path(ArchiveImporter(db, uploaded_by=user.id, default_material_type=MaterialType.pdf).run(archive))
+
+    assert results["Semester 3/CS101 - Programming/qp/2024.pdf"]["material_type"] == "question_paper"
+    assert results["Semester 3/CS101 - Programming/unit1.txt"]["material_type"] == "pdf"
+    assert results["ee201/Slides/kirchhoff.pdf"]["course_code"] == "EE201"
+    assert results["ee201/Slides/kirchhoff.pdf"]["material_type"] == "notes"
+    assert results["MA301/notes/calculus.pdf"]["status"] == "skipped"
+    assert results["CS101/notes/nested.zip"]["reason"] == "Nested archive"
+    assert results["CS101/notes/run.exe"]["status"] == "skipped"
+    assert not any(path.startswith("__MACOSX") for path in results)
+    queued = [result for result in results.values() if result["status"] == "queued"]
+    assert len(queued) == 3 and all(result["ingestion_job_id"] for result in queued)
+    assert db.query(CourseMaterial).count() == 3
+
+
+def test_create_courses_and_duplicates(db, user, courses, tmp_path):
+    archive = _zip(tmp_path, {
+        "PH102 - Physics/notes/optics.pdf": b"optics",
+        "PH102 - Physics/copy/optics-again.pdf": b"optics",
+    })
+
+    results = _by_path(ArchiveImporter(db, uploaded_by=user.id, create_courses=True).run(archive))
+
+    created = db.query(Course).filter(Course.code == "PH102").one()
+    assert created.name == "Physics"
+    assert results["PH102 - Physics/notes/optics.pdf"]["status"] == "queued"
+    duplicate = results["PH102 - Physics/copy/optics-again.pdf"]
+    assert duplicate["status"] == "duplicate"
+    assert duplicate["duplicate_of_id"] == results["PH102 - Physics/notes/optics.pdf"]["material_id"]
+
+
+def test_fixed_course_takes_every_member(db, user, courses, tmp_path):
+    archive = _zip(tmp_path, {"anything/qp/a.pdf": b"a", "b.txt": b"b"})
+
+    results = ArchiveImporter(db, uploaded_by=user.id, course=courses["EE201"]).run(archive)
+
+    assert {result["course_code"] for result in results} == {"EE201"}
+    assert sorted(result["material_type"] for result in results) == ["notes", "question_paper"]
+
+
+def test_7z_members_are_extracted_with_a_running_cap(monkeypatch, tmp_path):
+    archive = _7z(tmp_path, {"CS101/a.txt": b"a" * 400, "CS101/b.txt": b"b" * 400, "CS101/c.txt": b"c" * 400})
+    monkeypatch.setattr(settings, "ARCHIVE_MAX_EXTRACTED_SIZE", 1000)
+
+    # Members are only on disk while the iteration is at them
+    members = []
+    for member in iter_archive_members(archive):
+        with member.open() as source:
+            members.append((member.path, source.read(), member.error))
+
+    assert members[:2] == [("CS101/a.txt", b"a" * 400, None), ("CS101/b.txt", b"b" * 400, None)]
+    assert members[2][0] == "CS101/c.txt" and "expands past 1000 bytes" in members[2][2]
+
+
+def test_7z_cap_rejects_members_past_it(db, user, courses, monkeypatch, tmp_path):
+    archive = _7z(tmp_path, {"CS101/a.txt": b"a" * 400, "CS101/b.txt": b"b" * 700})
+    monkeypatch.setattr(settings, "ARCHIVE_MAX_EXTRACTED_SIZE", 1000)
+
+    results = _by_path(ArchiveImporter(db, uploaded_by=user.id).run(archive))
+
+    assert results["CS101/a.txt"]["status"] == "queued"
+    assert results["CS101/b.txt"]["status"] == "rejected"
+
+
+def test_oversized_7z_member_is_rejected_without_keeping_it(db, user, courses, monkeypatch, tmp_path):
+    archive = _7z(tmp_path, {"CS101/big.txt": b"x" * 5000, "CS101/small.txt": b"ok"})
+    monkeypatch.setattr(settings, "MAX_UPLOAD_SIZE", 1000)
+
+    results = _by_path(ArchiveImporter(db, uploaded_by=user.id).run(archive))
+
+    assert results["CS101/big.txt"]["status"] == "rejected"
+    assert results["CS101/small.txt"]["status"] == "queued"
+
+
+def _client(session_factory, current):
+    def db_override():
+        session = session_factory()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    app = FastAPI()
+    app.include_router(course_materials.router)
+    app.dependency_overrides[get_db] = db_override
+    app.dependency_overrides[get_current_faculty_or_admin_user] = lambda: current["user"]
+    return TestClient(app)
+
+
+def _other_user(db, role=None):
+    other = User(email=f"{role or 'faculty'}-{id(db)}@example.edu", password_hash="x")
+    db.add(other)
+    db.commit()
+    if role:
+        row = Role(name=role)
+        db.add(row)
+        db.commit()
+        db.add(UserRole(user_id=other.id, role_id=row.id))
+        db.commit()
+    db.refresh(other)
+    return other
+
+
+def test_import_runs_in_the_background_and_is_visible_to_its_uploader(session_factory, db, user, courses, tmp_path):
+    current = {"user": user}
+    client = _client(session_factory, current)
+    with open(_zip(tmp_path, {"CS101/qp/2024.pdf": b"paper"}), "rb") as archive:
+        response = client.post("/api/course-materials/import", files={"file": ("materials.zip", archive)})
+
+    assert response.status_code == 202
+    accepted = response.json()
+    assert accepted["status"] == "running" and accepted["files"] == []
+    assert not any(name.endswith(".zip") for name in os.listdir(f"{settings.UPLOAD_FOLDER}/imports"))
+
+    finished = client.get(f"/api/course-materials/imports/{accepted['id']}")
+    assert finished.status_code == 200
+    assert finished.json()["status"] == "completed"
+    assert finished.json()["files"][0]["indexing_status"] == "queued"
+
+    current["user"] = _other_user(db)
+    assert client.get(f"/api/course-materials/imports/{accepted['id']}").status_code == 403
+    current["user"] = _other_user(db, role="admin")
+    assert client.get(f"/api/course-materials/imports/{accepted['id']}").status_code == 200
+
+
+def test_unreadable_archive_marks_the_import_failed(session_factory, user, tmp_path):
+    client = _client(session_factory, {"user": user})
+    response = client.post("/api/course-materials/import", files={"file": ("broken.zip", b"not a zip")})
+
+    assert response.status_code == 202
+    finished = client.get(f"/api/course-materials/imports/{response.json()['id']}").json()
+    assert finished["status"] == "failed" and finished["error"]
+
+
+def _leftover(name, age=0):
+    import_dir = os.path.join(settings.UPLOAD_FOLDER, "imports")
+    os.makedirs(import_dir, exist_ok=True)
+    path = os.path.join(import_dir, name)
+    with open(path, "wb") as handle:
+        handle.write(b"archive")
+    stamp = time.time() - age
+    os.utime(path, (stamp, stamp))
+    return path
+
+
+def test_interrupted_imports_are_failed_and_their_archives_removed(db, user):
+    abandoned_path = _leftover("abandoned.zip")
+    live_path = _leftover("live.zip", age=3600)
+    orphan_path = _leftover("orphan.zip", age=3600)
+    uploading_path = _leftover("uploading.zip")
+    abandoned = MaterialImport(archive_name="a.zip", uploaded_by=user.id, archive_path=abandoned_path,
+                               lease_expires_at=datetime.utcnow() - timedelta(seconds=1))
+    live = MaterialImport(archive_name="b.zip", uploaded_by=user.id, archive_path=live_path,
+                          lease_expires_at=lease_deadline())
+    db.add_all([abandoned, live])
+    db.commit()
+
+    assert expire_stale_imports(db) == 1
+
+    db.refresh(abandoned)
+    db.refresh(live)
+    assert abandoned.status == MaterialImportStatus.FAILED and abandoned.error
+    assert live.status == MaterialImportStatus.RUNNING
+    assert not os.path.exists(abandoned_path) and not os.path.exists(orphan_path)
+    # Another process may still be unpacking or receiving these
+    assert os.path.exists(live_path) and os.path.exists(uploading_path)
+    os.remove(live_path)
+    os.remove(uploading_path)
@@ -0,0 +1,116 @@
+from datetime import datetime, timedelta
+
+import services.chat_window as chat_window
+from models.chat import ChatHistory, ChatSessionSummary, MessageRole
+from services.chat_window import fit_history_window, load_session_history
+
+
+def _count(text):
+    return len(str(text).split())
+
+
+def _add_turns(db, user, start, count, session_id="s1"):
+    base = datetime(2026, 1, 1)
+    rows = []
+    for turn in range(start, start + count):
+        for offset, role in enumerate((MessageRole.USER, MessageRole.ASSISTANT)):
+            row = ChatHistory(
+                user_id=user.id,
+                session_id=session_id,
+                message_role=role,
+                message_content=f"{role.value} {turn}",
+                timestamp=base + timedelta(seconds=turn * 2 + offset),
+            )
+            db.add(row)
+            rows.append(row)
+    db.commit()
+    return rows
+
+
+def _load(db, user, session_id="s1"):
+    history = load_session_history(db, user.id, session_id, count_tokens=_count, keep_turns=1)
+    db.commit()
+    return history
+
+
+def test_folds_overflow_and_replays_last_turns(db, user):
+    _add_turns(db, user, 0, 3)
+
+    summary, messages, has_history = _load(db, user)
+
+    assert [message["content"] for message in messages] == ["user 2", "assistant 2"]
+    assert "User asked: user 0" in summary and "user 1" in summary
+    assert has_history
+
+
+def test_fold_position_survives_deleted_messages(db, user):
+    rows = _add_turns(db, user, 0, 3)
+    _load(db, user)
+
+    # Deleting an already folded message must not shift the replay window.
+    db.delete(rows[0])
+    db.commit()
+    _add_turns(db, user, 3, 1)
+
+    summary, messages, _ = _load(db, user)
+
+    assert [message["content"] for message in messages] == ["user 3", "assistant 3"]
+    assert summary.count("user 2") == 1
+    row = db.query(ChatSessionSummary).one()
+    assert row.folded_messages == 6
+
+
+def test_first_fold_tolerates_a_concurrently_created_summary(db, session_factory, user, monkeypatch):
+    _add_turns(db, user, 0, 3)
+    original = chat_window._summary_row
+    raced = []
+
+    def racing_summary_row(session, user_id, session_id, lock=False):
+        if lock and not raced:
+            # Another request creates and folds the summary between our read and insert.
+            raced.append(True)
+            other = session_factory()
+            load_session_history(other, user_id, session_id, count_tokens=_count, keep_turns=1)
+            other.commit()
+            other.close()
+            return None
+        return original(session, user_id, session_id, lock=lock)
+
+    monkeypatch.setattr(chat_window, "_summary_row", racing_summary_row)
+    summary, messages, _ = _load(db, user)
+
+    assert raced
+    assert [message["content"] for message in messages] == ["user 2", "assistant 2"]
+    assert summary.count("user 0") == 1
+    assert db.query(ChatSessionSummary).count() == 1
+
+
+def _turn(question, answer):
+    return [{"role": "user", "content": question}, {"role": "assistant", "content": answer}]
+
+
+def test_fit_history_window_prefers_recent_turns():
+    messages = _turn("one", "two") + _turn("three four", "five")
+
+    summary, window = fit_history_window("- old line", messages, reserved_tokens=0, count_tokens=_count, budget_tokens=12)
+
+    # The older turn does not fit whole, so neither of its messages is replayed
+    assert window == messages[2:]
+    assert summary is None
+
+
+def test_fit_history_window_skips_an_oversized_turn_and_keeps_older_ones():
+    oversized = " ".join(["word"] * 50)
+    messages = _turn("first", "answer") + _turn(oversized, "long answer") + _turn("last", "reply")
+
+    _, window = fit_history_window("", messages, reserved_tokens=0, count_tokens=_count, budget_tokens=20)
+
+    assert window == messages[:2] + messages[4:]
+
+
+def test_fit_history_window_drops_a_leading_orphaned_reply():
+    messages = [{"role": "assistant", "content": "reply to a folded question"}] + _turn("next", "answer")
+
+    _, window = fit_history_window("", messages, reserved_tokens=0, count_tokens=_count, budget_tokens=100)
+
+    assert window == messages[1:]
@@ -0,0 +1,109 @@
+import hashlib
+
+from services import context_packer
+from services.context_packer import merge_adjacent_chunks, pack_context
+
+
+def _result(doc, page, index, content, score=0.5, **metadata):
+    return {
+        "content": content,
+        "score": score,
+        "metadata": {"chunk_id": f"{doc}_p{page}_c{index}", **metadata},
+    }
+
+
+def _word_tokens(monkeypatch):
+    monkeypatch.setattr(context_packer, "count_tokens", lambda text: len(text.split()))
+
+
+def test_adjacent_chunks_merge_and_trim_splitter_overlap():
+    first = _result("doc", 1, 0, "Kirchhoff's current law says the sum of currents")
+    second = _result("doc", 1, 1, "sum of currents entering a node is zero.", score=0.9)
+
+    blocks = merge_adjacent_chunks([second, first])
+
+    assert len(blocks) == 1
+    block = blocks[0]
+    assert block["content"] == "Kirchhoff's current law says the sum of currents entering a node is zero."
+    assert block["chunk_ids"] == ["doc_p1_c0", "doc_p1_c1"]
+    # The block keeps the score of its best-ranked member
+    assert block["rank"] == 0 and block["score"] == 0.9
+
+
+def test_chunks_on_other_pages_or_with_gaps_stay_separate():
+    blocks = merge_adjacent_chunks([
+        _result("doc", 1, 0, "page one start"),
+        _result("doc", 1, 2, "page one later"),
+        _result("doc", 2, 1, "page two"),
+    ])
+
+    assert [block["chunk_ids"] for block in blocks] == [["doc_p1_c0"], ["doc_p1_c2"], ["doc_p2_c1"]]
+
+
+def test_short_coincidental_overlap_is_not_trimmed():
+    blocks = merge_adjacent_chunks([
+        _result("doc", 1, 0, "the end"),
+        _result("doc", 1, 1, "end of story"),
+    ])
+
+    assert blocks[0]["content"] == "the endend of story"
+
+
+def test_chunk_hashes_prefer_recorded_hash_and_fall_back_to_content():
+    blocks = merge_adjacent_chunks([
+        _result("doc", 1, 0, "alpha beta", chunk_hash="recorded"),
+        _result("doc", 1, 1, "gamma delta"),
+        {"content": "web snippet", "score": 0.1, "metadata": {"url": "https://example.com"}},
+    ])
+
+    assert blocks[0]["chunk_hashes"] == ["recorded", hashlib.sha256(b"gamma delta").hexdigest()]
+    assert blocks[1]["chunk_hashes"] == [hashlib.sha256(b"web snippet").hexdigest()]
+
+
+def test_pack_skips_blocks_over_budget_and_fills_with_smaller_ones(monkeypatch):
+    _word_tokens(monkeypatch)
+    results = [
+        _result("a", 1, 0, "one two three four five six"),
+        _result("b", 1, 0, "seven eight nine ten eleven twelve thirteen fourteen"),
+        _result("c", 1, 0, "fifteen sixteen"),
+    ]
+
+    packed = pack_context(results, budget_tokens=12, overhead_tokens=2)
+
+    assert [block["chunk_ids"] for block in packed] == [["a_p1_c0"], ["c_p1_c0"]]
+    assert [block["token_count"] for block in packed] == [8, 4]
+
+
+def test_pack_drops_blank_blocks(monkeypatch):
+    _word_tokens(monkeypatch)
+
+    packed = pack_context([_result("a", 1, 0, "   "), _result("b", 1, 0, " text ")], budget_tokens=10)
+
+    assert [block["content"] for block in packed] == ["text"]
+
+
+def test_pack_truncates_the_top_block_instead_of_dropping_it(monkeypatch):
+    _word_tokens(monkeypatch)
+    results = [
+        _result("a", 1, 0, "one two three four five six seven eight nine ten", score=0.9),
+        _result("b", 1, 0, "eleven twelve"),
+    ]
+
+    packed = pack_context(results, budget_tokens=8, overhead_tokens=2)
+
+    assert [block["chunk_ids"] for block in packed] == [["a_p1_c0"]]
+    assert packed[0]["content"] == "one two three four five six"
+    assert packed[0]["truncated"] and packed[0]["token_count"] == 8
+
+
+def test_unpackable_results_answer_without_the_llm_or_cache(monkeypatch):
+    from services import rag_pipeline as pipeline_module
+
+    cached = []
+    monkeypatch.setattr(pipeline_module.answer_cache, "set", lambda *args, **kwargs: cached.append(args))
+    pipeline = pipeline_module.RAGPipeline.__new__(pipeline_module.RAGPipeline)
+
+    result = pipeline.answer_from_results("What is Ohm's law?", [_result("a", 1, 0, "   ")])
+
+    assert result["answer"].startswith("I couldn't find any relevant information")
+    assert result["sources"] == [] and cached == []
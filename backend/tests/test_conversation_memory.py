@@ -0,0 +1,53 @@
+import uuid
+
+from models.query import Query
+from models.user import User
+from services.rag_pipeline import ConversationMemoryStore, load_session_exchanges
+
+
+class CountingLoader:
+    def __init__(self, exchanges):
+        self.exchanges = exchanges
+        self.calls = []
+
+    def __call__(self, user_id, session_id, limit):
+        self.calls.append((user_id, session_id))
+        return self.exchanges.get((user_id, session_id), [])[-limit:]
+
+
+def test_session_is_rehydrated_once_per_miss():
+    loader = CountingLoader({("u1", "s1"): [("q1", "a1")]})
+    store = ConversationMemoryStore(max_sessions=10, idle_ttl_seconds=60, max_messages=10, loader=loader)
+
+    for _ in range(3):
+        memory = store.get("u1", "s1")
+    assert [msg.content for msg in memory.messages] == ["q1", "a1"]
+    assert loader.calls == [("u1", "s1")]
+
+
+def test_new_session_skips_the_loader():
+    loader = CountingLoader({})
+    store = ConversationMemoryStore(max_sessions=10, idle_ttl_seconds=60, max_messages=10, loader=loader)
+
+    store.get("u1", "fresh", new_session=True).save_context({"input": "q"}, {"answer": "a"})
+    assert len(store.get("u1", "fresh").messages) == 2
+    assert loader.calls == []
+
+
+def test_sessions_are_scoped_to_their_owner():
+    loader = CountingLoader({("u1", "shared"): [("secret question", "secret answer")]})
+    store = ConversationMemoryStore(max_sessions=10, idle_ttl_seconds=60, max_messages=10, loader=loader)
+
+    assert store.get("u2", "shared", create=False) is None
+    assert len(store.get("u1", "shared").messages) == 2
+
+
+def test_load_session_exchanges_filters_by_user(db, user):
+    other = User(id=uuid.uuid4(), email="other@example.edu", password_hash="x")
+    db.add(other)
+    db.add(Query(user_id=user.id, query="mine", response="a", session_id="s"))
+    db.add(Query(user_id=other.id, query="theirs", response="b", session_id="s"))
+    db.commit()
+
+    assert load_session_exchanges(str(user.id), "s", 10) == [("mine", "a")]
+    assert load_session_exchanges(str(other.id), "s", 10) == [("theirs", "b")]
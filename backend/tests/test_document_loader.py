@@ -0,0 +1,28 @@
+import numpy as np
+import pandas as pd
+
+from services.document_loader import CELL_SEPARATOR, DocumentLoader
+
+
+def test_render_rows_formats_integral_floats_without_overflowing():
+    frame = pd.DataFrame({
+        "marks": [17.0, 2.5, 1e20, -3.0, np.inf, np.nan, np.nan],
+        "name": ["a", "b", "c", "d", "e", "f", None],
+    })
+
+    rows = DocumentLoader._render_rows(frame)
+
+    assert rows == [
+        f"17{CELL_SEPARATOR}a",
+        f"2.5{CELL_SEPARATOR}b",
+        f"1e+20{CELL_SEPARATOR}c",
+        f"-3{CELL_SEPARATOR}d",
+        f"inf{CELL_SEPARATOR}e",
+        f"{CELL_SEPARATOR}f",
+    ]
+
+
+def test_render_rows_keeps_large_exact_integers():
+    frame = pd.DataFrame({"id": [float(2 ** 53 - 1), 9.007199254740993e15]})
+
+    assert DocumentLoader._render_rows(frame) == [str(2 ** 53 - 1), "9007199254740992.0"]
@@ -0,0 +1,63 @@
+import os
+
+from services import extraction_cache as extraction_cache_module
+from services.extraction_cache import ExtractionCache
+
+
+def _fake_extraction(monkeypatch, page_bytes):
+    def iter_document(file_path):
+        # Random text keeps gzip from shrinking the entry below page_bytes
+        yield {"text": os.urandom(page_bytes).hex(), "page_no": 1, "metadata": {}}
+
+    monkeypatch.setattr(extraction_cache_module.extraction_pool, "iter_document", iter_document)
+
+
+def _count_walks(monkeypatch):
+    walks = []
+    original = os.walk
+
+    def walk(*args, **kwargs):
+        walks.append(args)
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(extraction_cache_module.os, "walk", walk)
+    return walks
+
+
+def _entries(directory):
+    return [name for _, _, files in os.walk(directory) for name in files if name.endswith(".jsonl.gz")]
+
+
+def test_misses_under_budget_do_not_walk_the_directory(monkeypatch, tmp_path):
+    _fake_extraction(monkeypatch, 1024)
+    cache = ExtractionCache(directory=str(tmp_path), max_mb=1, enabled=True)
+    walks = _count_walks(monkeypatch)
+
+    for number in range(5):
+        cache.load_document("notes.pdf", content_hash=f"{number:064x}")
+
+    # Only the first miss walks, to learn the starting size
+    assert len(walks) == 1
+    assert cache.stats()["size_bytes"] > 4 * 1024
+
+
+def test_running_total_over_budget_evicts_least_recently_used(monkeypatch, tmp_path):
+    # Entries of roughly 290 KB against a 1 MB budget
+    _fake_extraction(monkeypatch, 250 * 1024)
+    cache = ExtractionCache(directory=str(tmp_path), max_mb=1, enabled=True)
+    hashes = [f"{number:064x}" for number in range(4)]
+    for content_hash in hashes[:3]:
+        cache.load_document("notes.pdf", content_hash=content_hash)
+    for content_hash in hashes[:2]:
+        os.utime(cache._entry_path(content_hash), (1, 1))
+    # A hit marks the first entry as recently used again
+    cache.load_document("notes.pdf", content_hash=hashes[0])
+    walks = _count_walks(monkeypatch)
+
+    cache.load_document("notes.pdf", content_hash=hashes[3])
+
+    assert len(walks) == 1
+    assert sorted(_entries(tmp_path)) == sorted(
+        os.path.basename(cache._entry_path(content_hash)) for content_hash in (hashes[0], hashes[2], hashes[3])
+    )
+    assert cache.stats()["size_bytes"] <= 1024 * 1024
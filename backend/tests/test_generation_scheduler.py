@@ -0,0 +1,81 @@
+import asyncio
+import threading
+
+import pytest
+
+from services.generation_scheduler import (
+    PRIORITY_STAFF,
+    GenerationQueueTimeout,
+    GenerationScheduler,
+    current_priority,
+)
+
+
+def test_blocking_slot_waits_run_on_the_generation_pool():
+    scheduler = GenerationScheduler(max_concurrency=1, executor_threads=4, queue_timeout_seconds=5)
+    held = threading.Event()
+    finish = threading.Event()
+
+    def generate():
+        with scheduler.slot():
+            held.set()
+            finish.wait(5)
+            return threading.current_thread().name
+
+    async def main():
+        current_priority.set(PRIORITY_STAFF)
+        first = asyncio.ensure_future(scheduler.to_thread(generate))
+        await asyncio.to_thread(held.wait, 5)
+        queued = asyncio.ensure_future(scheduler.to_thread(generate))
+        await asyncio.sleep(0.05)
+        # Default-executor work is not stuck behind the queued generation
+        assert await asyncio.wait_for(asyncio.to_thread(lambda: "free"), 1) == "free"
+        assert scheduler.stats()["queued"][PRIORITY_STAFF] == 1
+        finish.set()
+        return await first, await queued
+
+    try:
+        names = asyncio.run(main())
+    finally:
+        scheduler.shutdown()
+
+    assert all(name.startswith("generation") for name in names)
+    assert scheduler.stats()["granted"][PRIORITY_STAFF] == 2
+
+
+def test_queue_timeouts_are_counted():
+    scheduler = GenerationScheduler(max_concurrency=1, queue_timeout_seconds=5)
+    scheduler.acquire()
+
+    with pytest.raises(GenerationQueueTimeout):
+        scheduler.acquire(timeout=0.01)
+
+    async def wait_async():
+        await scheduler.acquire_async(timeout=0.01)
+
+    with pytest.raises(GenerationQueueTimeout):
+        asyncio.run(wait_async())
+
+    scheduler.release()
+    assert scheduler.stats()["timeouts"] == 2
+    assert scheduler.stats()["active"] == 0
+
+
+def test_pipeline_reraises_queue_timeout_without_caching(monkeypatch):
+    from services import rag_pipeline as pipeline_module
+
+    class _Saturated:
+        def slot(self, priority=None):
+            raise GenerationQueueTimeout("Timed out waiting for a generation slot")
+
+    cached = []
+    monkeypatch.setattr(pipeline_module, "generation_scheduler", _Saturated())
+    monkeypatch.setattr(pipeline_module.answer_cache, "get", lambda *args, **kwargs: None)
+    monkeypatch.setattr(pipeline_module.answer_cache, "set", lambda *args, **kwargs: cached.append(args))
+    pipeline = pipeline_module.RAGPipeline.__new__(pipeline_module.RAGPipeline)
+    pipeline.qa_prompt = pipeline_module.PromptTemplate(template="{context}\n{question}", input_variables=["context", "question"])
+    results = [{"content": "Ohm's law relates voltage and current.", "score": 0.9, "metadata": {"chunk_id": "doc_p1_c0"}}]
+
+    with pytest.raises(GenerationQueueTimeout):
+        pipeline.answer_from_results("What is Ohm's law?", results)
+    assert cached == []
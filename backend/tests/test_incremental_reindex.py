@@ -0,0 +1,127 @@
+import uuid
+
+import numpy as np
+
+from services.ingestion_pipeline import ChunkSpool, IngestionPipeline
+
+
+def _page(number, text):
+    return {"text": text, "page_no": number, "metadata": {}}
+
+
+def _count_embeddings(monkeypatch, service):
+    embedded = []
+    original = service.embed_chunks
+
+    def embed_chunks(chunks):
+        embedded.extend(chunk.page_content for chunk in chunks)
+        return original(chunks)
+
+    monkeypatch.setattr(service, "embed_chunks", embed_chunks)
+    return embedded
+
+
+def _reindex(service, document_id, pages):
+    """What the ingestion worker does for one job"""
+    known = set(service.document_chunk_ids(document_id))
+    with ChunkSpool() as spool:
+        _, subject_keys = IngestionPipeline(service, batch_size=2).run(
+            document_id, pages, {"title": "Notes"}, sink=spool.append, known_hashes=known
+        )
+        return service.sync_document_chunks(document_id, spool.batches(), subject_keys)
+
+
+def _indexed_texts(service, document_id):
+    store = service.vector_store
+    return sorted(
+        store.docstore.search(docstore_id).page_content
+        for docstore_ids in service.document_chunk_ids(document_id).values()
+        for docstore_id in docstore_ids
+    )
+
+
+def test_reindex_embeds_only_changed_text(monkeypatch, embedding_service):
+    document_id = str(uuid.uuid4())
+    _reindex(embedding_service, document_id, [_page(1, "Unchanged intro."), _page(2, "Old body."), _page(3, "Dropped.")])
+    embedded = _count_embeddings(monkeypatch, embedding_service)
+
+    result = _reindex(embedding_service, document_id, [_page(1, "Unchanged intro."), _page(2, "New body.")])
+
+    assert embedded == ["New body."]
+    assert result == {"chunks": 2, "kept": 1, "added": 1, "removed": 2}
+    assert _indexed_texts(embedding_service, document_id) == ["New body.", "Unchanged intro."]
+
+
+def test_unchanged_reindex_only_refreshes_metadata(monkeypatch, embedding_service):
+    document_id = str(uuid.uuid4())
+    _reindex(embedding_service, document_id, [_page(1, "First."), _page(2, "Second.")])
+    total = embedding_service.vector_store.index.ntotal
+    embedded = _count_embeddings(monkeypatch, embedding_service)
+
+    # Pages moved: same text, new page numbers
+    result = _reindex(embedding_service, document_id, [_page(5, "Second."), _page(6, "First.")])
+
+    assert embedded == []
+    assert result == {"chunks": 2, "kept": 2, "added": 0, "removed": 0}
+    assert embedding_service.vector_store.index.ntotal == total
+    pages = {
+        embedding_service.vector_store.docstore.search(ids[0]).page_content:
+        embedding_service.vector_store.docstore.search(ids[0]).metadata["page_no"]
+        for ids in embedding_service.document_chunk_ids(document_id).values()
+    }
+    assert pages == {"First.": 6, "Second.": 5}
+
+
+def test_repeated_text_reuses_the_indexed_vector(monkeypatch, embedding_service):
+    document_id = str(uuid.uuid4())
+    _reindex(embedding_service, document_id, [_page(1, "Repeated.")])
+    embedded = _count_embeddings(monkeypatch, embedding_service)
+
+    # The second and third copies span later batches and have no vector of their own
+    result = _reindex(
+        embedding_service,
+        document_id,
+        [_page(1, "Repeated."), _page(2, "Other."), _page(3, "Repeated."), _page(4, "Repeated.")],
+    )
+
+    assert embedded == ["Other."]
+    assert result["added"] == 3 and result["kept"] == 1
+    store = embedding_service.vector_store
+    positions = {docstore_id: position for position, docstore_id in store.index_to_docstore_id.items()}
+    copies = [
+        store.index.reconstruct(positions[docstore_id])
+        for docstore_ids in embedding_service.document_chunk_ids(document_id).values()
+        for docstore_id in docstore_ids
+        if store.docstore.search(docstore_id).page_content == "Repeated."
+    ]
+    assert len(copies) == 3 and all(np.allclose(copy, copies[0]) for copy in copies)
+
+
+def test_text_removed_since_the_pipeline_checked_is_embedded_at_sync(monkeypatch, embedding_service):
+    document_id = str(uuid.uuid4())
+    _reindex(embedding_service, document_id, [_page(1, "Kept."), _page(2, "Vanishing.")])
+    known = set(embedding_service.document_chunk_ids(document_id))
+    with ChunkSpool() as spool:
+        _, subject_keys = IngestionPipeline(embedding_service).run(
+            document_id, [_page(1, "Kept."), _page(2, "Vanishing.")], {}, sink=spool.append, known_hashes=known
+        )
+        # Another writer drops the document's chunks before this sync takes the lock
+        store = embedding_service.vector_store
+        store.delete([docstore_id for ids in embedding_service.document_chunk_ids(document_id).values() for docstore_id in ids])
+        embedded = _count_embeddings(monkeypatch, embedding_service)
+
+        result = embedding_service.sync_document_chunks(document_id, spool.batches(), subject_keys)
+
+    assert sorted(embedded) == ["Kept.", "Vanishing."]
+    assert result == {"chunks": 2, "kept": 0, "added": 2, "removed": 0}
+
+
+def test_index_document_is_incremental(monkeypatch, embedding_service):
+    document_id = str(uuid.uuid4())
+    assert embedding_service.index_document(document_id, [_page(1, "Alpha."), _page(2, "Beta.")], {}) == 2
+    embedded = _count_embeddings(monkeypatch, embedding_service)
+
+    assert embedding_service.index_document(document_id, iter([_page(1, "Alpha."), _page(2, "Gamma.")]), {}) == 2
+
+    assert embedded == ["Gamma."]
+    assert _indexed_texts(embedding_service, document_id) == ["Alpha.", "Gamma."]
@@ -0,0 +1,75 @@
+import uuid
+
+import pytest
+
+from services.ingestion_pipeline import ChunkSpool, IngestionPipeline
+
+
+def _pages(count):
+    return [
+        {"text": f"Page {number} covers topic {number} in detail. " * 3, "page_no": number, "metadata": {}}
+        for number in range(1, count + 1)
+    ]
+
+
+def test_batches_reach_the_sink_in_page_order_without_accumulating(embedding_service):
+    document_id = str(uuid.uuid4())
+    seen = []
+    pipeline = IngestionPipeline(embedding_service, embed_concurrency=3, queue_size=2, batch_size=2)
+
+    chunk_count, subject_keys = pipeline.run(
+        document_id,
+        iter(_pages(9)),
+        {"subject": "Signals"},
+        sink=lambda chunks, vectors: seen.append((chunks, vectors)),
+    )
+
+    page_numbers = [chunk.metadata["page_no"] for chunks, _ in seen for chunk in chunks]
+    assert page_numbers == sorted(page_numbers) and chunk_count == len(page_numbers)
+    assert all(len(chunks) <= 2 for chunks, _ in seen)
+    # Each batch carries only the vectors of its own new text
+    assert all(set(vectors) <= {chunk.metadata["chunk_hash"] for chunk in chunks} for chunks, vectors in seen)
+    assert "signals" in subject_keys
+
+
+def test_known_and_repeated_text_is_not_embedded_again(embedding_service):
+    pages = [
+        {"text": "Same paragraph.", "page_no": 1, "metadata": {}},
+        {"text": "Same paragraph.", "page_no": 2, "metadata": {}},
+        {"text": "Known paragraph.", "page_no": 3, "metadata": {}},
+    ]
+    known = IngestionPipeline(embedding_service, batch_size=8)
+    spool = []
+    known.run("doc", pages[2:], {}, sink=lambda chunks, vectors: spool.append(vectors))
+    known_hash = next(iter(spool[0]))
+
+    embedded = []
+    pipeline = IngestionPipeline(embedding_service, batch_size=1)
+    pipeline.run(
+        "doc",
+        pages,
+        {},
+        sink=lambda chunks, vectors: embedded.extend(vectors),
+        known_hashes={known_hash},
+    )
+
+    assert len(embedded) == 1 and known_hash not in embedded
+    assert pipeline.stats()["reused_chunks"] == 2
+
+
+def test_spool_streams_into_sync(embedding_service):
+    document_id = str(uuid.uuid4())
+    pipeline = IngestionPipeline(embedding_service, embed_concurrency=2, batch_size=3)
+
+    with ChunkSpool() as spool:
+        chunk_count, subject_keys = pipeline.run(document_id, _pages(5), {}, sink=spool.append)
+        assert spool.chunks == chunk_count
+        result = embedding_service.sync_document_chunks(document_id, spool.batches(), subject_keys)
+
+    assert result == {"chunks": chunk_count, "kept": 0, "added": chunk_count, "removed": 0}
+    assert sum(len(ids) for ids in embedding_service.document_chunk_ids(document_id).values()) == chunk_count
+
+
+def test_empty_document_is_rejected(embedding_service):
+    with pytest.raises(ValueError):
+        IngestionPipeline(embedding_service).run("doc", [{"text": "  ", "page_no": 1}], {}, sink=lambda *_: None)
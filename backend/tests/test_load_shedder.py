@@ -0,0 +1,71 @@
+import json
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from routes import rag
+from services.load_shedder import LoadController
+from utils.auth import get_current_faculty_or_admin_user
+
+
+def _client(user):
+    app = FastAPI()
+    app.include_router(rag.router)
+    app.dependency_overrides[get_current_faculty_or_admin_user] = lambda: user
+    return TestClient(app)
+
+
+def _must_not_retrieve(*args, **kwargs):
+    raise AssertionError("a shed batch must not retrieve")
+
+
+def test_occupied_work_counts_toward_the_level():
+    controller = LoadController(inflight_thresholds=[2, 3, 4, 5], latency_thresholds_ms=[1e9])
+
+    with controller.admit(top_k=6) as policy:
+        assert policy.level == 0
+        with controller.occupy(), controller.occupy():
+            assert controller.stats()["in_flight"] == 3
+            assert controller.current_level() == 2
+    assert controller.stats()["in_flight"] == 0
+
+
+def test_batch_is_shed_when_overloaded(monkeypatch, user):
+    controller = LoadController(inflight_thresholds=[0, 0, 0, 0], latency_thresholds_ms=[1e9])
+    monkeypatch.setattr(rag, "load_controller", controller)
+    monkeypatch.setattr(rag.rag_pipeline, "retrieve_batch", _must_not_retrieve)
+
+    response = _client(user).post("/rag/query/batch", json={"questions": ["What is Ohm's law?"]})
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"]
+
+
+def test_batch_uses_the_degraded_policy(monkeypatch, user):
+    # Level 3: halved top-k and capped completions
+    controller = LoadController(inflight_thresholds=[0, 0, 0, 99], latency_thresholds_ms=[1e9])
+    monkeypatch.setattr(rag, "load_controller", controller)
+    calls = {}
+
+    def retrieve_batch(questions, **kwargs):
+        calls["k"] = kwargs["k"]
+        return [([0.0], [{"content": "text", "metadata": {}}]) for _ in questions]
+
+    def answer_from_results(question, results, query_embedding=None, max_tokens=None):
+        calls["max_tokens"] = max_tokens
+        calls["in_flight"] = controller.stats()["in_flight"]
+        return {"answer": "ok", "sources": [], "cached": True}
+
+    monkeypatch.setattr(rag.rag_pipeline, "retrieve_batch", retrieve_batch)
+    monkeypatch.setattr(rag.rag_pipeline, "answer_from_results", answer_from_results)
+    monkeypatch.setattr(rag, "_enqueue_query_log", lambda *args: None)
+
+    response = _client(user).post("/rag/query/batch", json={"questions": ["What is Ohm's law?"]})
+
+    assert response.status_code == 200
+    assert json.loads(response.text.splitlines()[0])["answer"] == "ok"
+    assert calls["k"] == max(1, rag.settings.TOP_K_RESULTS // 2)
+    assert calls["max_tokens"] == rag.settings.LOAD_SHED_DEGRADED_MAX_TOKENS
+    # The running generation is counted while it runs
+    assert calls["in_flight"] == 1
+    assert controller.stats()["in_flight"] == 0
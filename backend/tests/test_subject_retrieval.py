@@ -0,0 +1,41 @@
+import uuid
+
+from routes.rag import ChatCompletionRequest, _retrieve_material_context
+from tests.conftest import index_pages
+
+
+def _index(service, subject, text, uploader_id):
+    document_id = str(uuid.uuid4())
+    index_pages(service, document_id, [{"text": text, "page_no": 1, "metadata": {}}], {
+        "title": f"{subject} notes",
+        "subject": subject,
+        "document_type": "lecture_notes",
+        "uploader_id": uploader_id,
+    })
+    return document_id
+
+
+def test_subject_filtered_retrieval_returns_only_matching_course(embedding_service):
+    uploader = str(uuid.uuid4())
+    circuits = _index(embedding_service, "Electric Circuits", "Kirchhoff's laws relate node currents.", uploader)
+    _index(embedding_service, "Organic Chemistry", "Benzene rings are aromatic.", uploader)
+
+    payload = ChatCompletionRequest(message="Explain Kirchhoff's laws", subject="electric circuits")
+    context, sources, _ = _retrieve_material_context(payload, uploader)
+
+    assert "Kirchhoff" in context
+    assert sources and {source["document_id"] for source in sources} == {circuits}
+
+
+def test_subject_filter_matches_legacy_chunks_without_subject_keys(embedding_service):
+    uploader = str(uuid.uuid4())
+    circuits = _index(embedding_service, "Electric Circuits", "Ohm's law relates voltage and current.", uploader)
+    store = embedding_service.vector_store
+    for docstore_id in store.index_to_docstore_id.values():
+        store.docstore.search(docstore_id).metadata.pop("subject_keys", None)
+    embedding_service._save_vector_store()
+
+    payload = ChatCompletionRequest(message="What is Ohm's law?", subject="Electric Circuits")
+    _, sources, _ = _retrieve_material_context(payload, uploader)
+
+    assert {source["document_id"] for source in sources} == {circuits}
@@ -0,0 +1,70 @@
+from datetime import date
+
+import pytest
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models.token_limit import UserDailyTokenUsage, UserTokenLimit
+from services import token_ledger as token_ledger_module
+from services.token_ledger import TokenLedger
+
+TODAY = date(2026, 1, 5)
+
+
+@pytest.fixture
+def ledger(monkeypatch, db, user):
+    # The conditional upsert is Postgres syntax; SQLite accepts the same statement shape.
+    monkeypatch.setattr(token_ledger_module, "pg_insert", sqlite_insert)
+    db.add(UserTokenLimit(user_id=user.id, daily_token_limit=1000))
+    db.commit()
+    return TokenLedger(cache_ttl_seconds=60)
+
+
+def _usage(db, user):
+    db.expire_all()
+    return (
+        db.query(UserDailyTokenUsage)
+        .filter(UserDailyTokenUsage.user_id == user.id, UserDailyTokenUsage.usage_date == TODAY)
+        .one()
+    )
+
+
+def test_reserve_holds_tokens_and_counts_requests(ledger, db, user):
+    first = ledger.reserve(user.id, 300, usage_date=TODAY)
+    second = ledger.reserve(user.id, 200, usage_date=TODAY)
+
+    assert first.tokens_used == 300 and second.tokens_used == 500
+    assert second.remaining == 500
+    row = _usage(db, user)
+    assert (row.tokens_used, row.request_count) == (500, 2)
+
+
+def test_reserve_refuses_to_overspend_the_daily_limit(ledger, db, user):
+    assert ledger.reserve(user.id, 900, usage_date=TODAY) is not None
+
+    assert ledger.reserve(user.id, 200, usage_date=TODAY) is None
+    assert ledger.reserve(user.id, 1001, usage_date=TODAY) is None
+    row = _usage(db, user)
+    assert (row.tokens_used, row.request_count) == (900, 1)
+    assert ledger.reserve(user.id, 100, usage_date=TODAY).tokens_used == 1000
+
+
+def test_reconcile_replaces_the_reserved_amount_once(ledger, db, user):
+    reservation = ledger.reserve(user.id, 400, usage_date=TODAY)
+
+    ledger.reconcile(reservation, 150)
+    ledger.reconcile(reservation, 999)
+
+    assert reservation.settled and reservation.tokens == 150
+    assert _usage(db, user).tokens_used == 150
+    assert ledger.snapshot(user.id, usage_date=TODAY) == (1000, 150)
+
+
+def test_release_returns_tokens_and_the_request(ledger, db, user):
+    kept = ledger.reserve(user.id, 100, usage_date=TODAY)
+    failed = ledger.reserve(user.id, 300, usage_date=TODAY)
+
+    ledger.release(failed)
+
+    row = _usage(db, user)
+    assert (row.tokens_used, row.request_count) == (100, 1)
+    assert failed.tokens == 0 and kept.tokens_used == 100
@@ -0,0 +1,126 @@
+import io
+import os
+import uuid
+from datetime import datetime, timedelta
+
+from config import settings
+from models.document import Document, DocumentType
+from services.upload_dedup import (
+    commit_upload,
+    delete_upload,
+    find_canonical,
+    replace_upload,
+    store_stream,
+)
+
+
+def _path(name):
+    return os.path.join(settings.UPLOAD_FOLDER, f"{uuid.uuid4().hex}_{name}")
+
+
+def _document(user, stored, minutes=0):
+    return Document(
+        title="Notes",
+        document_type=DocumentType.LECTURE_NOTES,
+        file_path=stored.file_path,
+        file_size=stored.file_size,
+        content_hash=stored.content_hash,
+        duplicate_of_id=stored.duplicate_of_id,
+        uploader_id=user.id,
+        uploaded_at=datetime(2026, 1, 1) + timedelta(minutes=minutes),
+    )
+
+
+def _upload(db, user, content, minutes=0):
+    stored = store_stream(db, Document, io.BytesIO(content), _path("notes.pdf"))
+    row = _document(user, stored, minutes)
+    commit_upload(db, Document, row)
+    return row
+
+
+def test_identical_upload_reuses_the_stored_file(db, user):
+    first = _upload(db, user, b"same bytes")
+    second_path = _path("copy.pdf")
+
+    stored = store_stream(db, Document, io.BytesIO(b"same bytes"), second_path)
+
+    assert stored.duplicate_of_id == first.id
+    assert stored.file_path == first.file_path
+    assert not os.path.exists(second_path)
+    assert not [name for name in os.listdir(settings.UPLOAD_FOLDER) if name.endswith(".part")]
+
+
+def test_commit_race_loser_becomes_a_duplicate(db, user):
+    # Both uploads hashed before either row existed, so both look canonical.
+    first_stored = store_stream(db, Document, io.BytesIO(b"raced"), _path("a.pdf"))
+    second_stored = store_stream(db, Document, io.BytesIO(b"raced"), _path("b.pdf"))
+    assert first_stored.duplicate_of_id is None and second_stored.duplicate_of_id is None
+
+    winner = _document(user, first_stored)
+    loser = _document(user, second_stored)
+    commit_upload(db, Document, winner)
+    commit_upload(db, Document, loser)
+
+    assert loser.duplicate_of_id == winner.id
+    assert loser.file_path == winner.file_path
+    assert not os.path.exists(second_stored.file_path)
+    assert find_canonical(db, Document, winner.content_hash).id == winner.id
+
+
+def test_deleting_the_canonical_promotes_the_oldest_duplicate(db, user):
+    canonical = _upload(db, user, b"shared", minutes=0)
+    older = _upload(db, user, b"shared", minutes=1)
+    newer = _upload(db, user, b"shared", minutes=2)
+
+    delete_upload(db, Document, canonical)
+
+    db.refresh(older)
+    db.refresh(newer)
+    assert canonical.is_deleted
+    assert older.duplicate_of_id is None
+    assert newer.duplicate_of_id == older.id
+    assert os.path.exists(older.file_path)
+    assert find_canonical(db, Document, older.content_hash).id == older.id
+
+
+def test_deleting_a_duplicate_leaves_the_canonical_alone(db, user):
+    canonical = _upload(db, user, b"shared")
+    duplicate = _upload(db, user, b"shared", minutes=1)
+
+    delete_upload(db, Document, duplicate)
+
+    db.refresh(canonical)
+    assert duplicate.is_deleted and canonical.duplicate_of_id is None
+    assert os.path.exists(canonical.file_path)
+
+
+def test_reupload_hands_old_content_to_an_heir(db, user):
+    canonical = _upload(db, user, b"version one")
+    duplicate = _upload(db, user, b"version one", minutes=1)
+    old_file = canonical.file_path
+
+    replace_upload(db, Document, canonical, store_stream(db, Document, io.BytesIO(b"version two"), _path("v2.pdf")))
+
+    db.refresh(duplicate)
+    assert duplicate.duplicate_of_id is None and duplicate.file_path == old_file
+    assert os.path.exists(old_file)
+    assert canonical.file_path != old_file and os.path.exists(canonical.file_path)
+
+
+def test_reupload_of_a_duplicate_keeps_the_shared_file(db, user):
+    canonical = _upload(db, user, b"original")
+    duplicate = _upload(db, user, b"original", minutes=1)
+
+    replace_upload(db, Document, duplicate, store_stream(db, Document, io.BytesIO(b"edited"), _path("edit.pdf")))
+
+    assert duplicate.duplicate_of_id is None
+    assert os.path.exists(canonical.file_path)
+
+
+def test_reupload_without_duplicates_removes_the_old_file(db, user):
+    row = _upload(db, user, b"only copy")
+    old_file = row.file_path
+
+    replace_upload(db, Document, row, store_stream(db, Document, io.BytesIO(b"new copy"), _path("new.pdf")))
+
+    assert not os.path.exists(old_file)
@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+
+import routes.rag as rag
+
+
+@pytest.fixture
+def fetches(monkeypatch):
+    """Replace the DuckDuckGo fetch with a scripted page; records each fetch"""
+    calls = []
+    page = {"hits": [], "stall": False}
+
+    async def fake_fetch(query, max_results, results):
+        calls.append(max_results)
+        for hit in page["hits"]:
+            results.append(hit)
+            if len(results) >= max_results:
+                return False
+        if page["stall"]:
+            await asyncio.sleep(10)
+        return True
+
+    monkeypatch.setattr(rag, "_fetch_web_results", fake_fetch)
+    monkeypatch.setattr(rag.settings, "WEB_SEARCH_DEADLINE_SECONDS", 0.05)
+    rag._web_search_cache.clear()
+    yield calls, page
+    rag._web_search_cache.clear()
+
+
+def _hits(count):
+    return [{"title": f"t{i}", "url": f"https://example.edu/{i}"} for i in range(count)]
+
+
+def test_short_complete_result_is_served_from_cache(fetches):
+    calls, page = fetches
+    page["hits"] = _hits(2)
+
+    assert len(asyncio.run(rag._search_web_fallback("ohm's law", 5))) == 2
+    assert len(asyncio.run(rag._search_web_fallback("Ohm's law", 5))) == 2
+    assert calls == [5]
+
+
+def test_entry_capped_below_request_is_refetched(fetches):
+    calls, page = fetches
+    page["hits"] = _hits(8)
+
+    assert len(asyncio.run(rag._search_web_fallback("kcl", 3))) == 3
+    assert len(asyncio.run(rag._search_web_fallback("kcl", 2))) == 2
+    assert len(asyncio.run(rag._search_web_fallback("kcl", 5))) == 5
+    assert calls == [3, 5]
+
+
+def test_results_cut_by_deadline_are_not_cached(fetches):
+    calls, page = fetches
+    page["hits"], page["stall"] = _hits(1), True
+
+    assert len(asyncio.run(rag._search_web_fallback("slow query", 5))) == 1
+    assert "slow query" not in rag._web_search_cache
+    asyncio.run(rag._search_web_fallback("slow query", 5))
+    assert calls == [5, 5]
@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+
+import services.chunk_store as chunk_store
+from models.query import ContextChunk, Query
+from services.write_behind import WriteBehindError, WriteBehindQueue
+
+
+class FlakyWriter:
+    """Stands in for the batch INSERT; fails the first `failures` calls"""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.written = []
+
+    def __call__(self, batch):
+        if self.failures:
+            self.failures -= 1
+            return RuntimeError("database unavailable")
+        self.written.extend(values for _, values, _, _, _ in batch)
+        return None
+
+
+def _queue(writer):
+    queue = WriteBehindQueue(flush_interval_ms=1000, max_batch_rows=100, max_attempts=3)
+    queue._write_batch = writer
+    return queue
+
+
+def test_barrier_retries_until_rows_are_written():
+    writer = FlakyWriter(failures=1)
+    queue = _queue(writer)
+    queue.enqueue(Query, {"query": "q"}, key="user-1")
+
+    asyncio.run(queue.barrier("user-1"))
+
+    assert writer.written == [{"query": "q"}]
+    assert not queue.has_pending("user-1")
+
+
+def test_barrier_raises_when_rows_are_dropped():
+    queue = _queue(FlakyWriter(failures=10))
+    queue.enqueue(Query, {"query": "q"}, key="user-1")
+
+    with pytest.raises(WriteBehindError):
+        asyncio.run(queue.barrier("user-1"))
+    assert queue.stats()["dropped"] == 1
+
+
+def test_barrier_reports_background_drops_once():
+    queue = _queue(FlakyWriter(failures=3))
+    queue.enqueue(Query, {"query": "q"}, key="user-1")
+    for _ in range(3):
+        asyncio.run(queue.flush())
+    assert not queue.has_pending("user-1")
+
+    with pytest.raises(WriteBehindError, match="1 buffered rows"):
+        asyncio.run(queue.barrier("user-1"))
+    # Reported losses are cleared rather than kept per key forever
+    asyncio.run(queue.barrier("user-1"))
+    assert "user-1" not in queue._dropped_keys
+
+
+@pytest.fixture
+def chunk_queue(monkeypatch):
+    def install(writer):
+        queue = _queue(writer)
+        monkeypatch.setattr(chunk_store, "write_behind", queue)
+        return queue
+
+    monkeypatch.setattr(chunk_store, "_known_hashes", type(chunk_store._known_hashes)())
+    return install
+
+
+def _sent_chunks(queue):
+    return [values for (target, _), values, _, _, _ in queue._pending if target is ContextChunk]
+
+
+def test_chunk_hash_is_known_only_after_commit(chunk_queue):
+    queue = chunk_queue(FlakyWriter())
+    chunk = {"content": "Ohm's law", "metadata": {"chunk_id": "d_p1_c0"}, "score": 0.5}
+
+    chunk_store.store_context_chunks([chunk])
+    chunk_store.store_context_chunks([chunk])
+    assert len(_sent_chunks(queue)) == 2
+
+    asyncio.run(queue.flush())
+    chunk_store.store_context_chunks([chunk])
+    assert _sent_chunks(queue) == []
+
+
+def test_dropped_chunk_is_sent_again(chunk_queue):
+    queue = chunk_queue(FlakyWriter(failures=10))
+    chunk = {"content": "Kirchhoff", "metadata": {}, "score": 0.5}
+
+    chunk_store.store_context_chunks([chunk], key="user-1")
+    with pytest.raises(WriteBehindError):
+        asyncio.run(queue.barrier("user-1"))
+
+    chunk_store.store_context_chunks([chunk], key="user-1")
+    assert len(_sent_chunks(queue)) == 1
@@ -0,0 +1,50 @@
+"""
+Cancel request work when the HTTP client disconnects
+"""
+import asyncio
+from typing import Any, Awaitable
+
+from fastapi import Request
+
+from config import settings
+
+# Non-standard status used by nginx for "client closed request"
+CLIENT_CLOSED_REQUEST = 499
+
+
+class ClientDisconnected(Exception):
+    """Raised when the client went away before the response was ready"""
+
+
+async def cancel_on_disconnect(request: Request, awaitable: Awaitable[Any], poll_interval: float = None) -> Any:
+    """
+    Await work while polling the client connection
+
+    If the client disconnects first, the work is cancelled and
+    ClientDisconnected is raised. Blocking work already running on a worker
+    thread cannot be interrupted; its result is simply discarded.
+
+    Args:
+        request: Incoming request to watch
+        awaitable: Work to run
+        poll_interval: Seconds between connection checks
+
+    Returns:
+        The work's result
+    """
+    poll_interval = poll_interval or settings.DISCONNECT_POLL_SECONDS
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                raise ClientDisconnected()
+    finally:
+        if not task.done():
+            task.cancel()
+            try:
+                await task
+            except BaseException:
+                pass
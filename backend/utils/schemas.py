@@ -66,6 +66,8 @@ class DocumentResponse(BaseModel):
     indexing_status: str
     indexed_at: Optional[datetime]
     chunk_count: int
+    duplicate_of_id: Optional[str] = None
+    ingestion_job_id: Optional[str] = None
     
     class Config:
         from_attributes = True
@@ -84,6 +86,20 @@ class RAGQuery(BaseModel):
     document_type: Optional[str] = None
     session_id: Optional[str] = None
 
+class RAGBatchQuery(BaseModel):
+    """Batch RAG query request (question bank)"""
+    questions: List[str] = Field(..., min_length=1, max_length=500)
+    subject: Optional[str] = None
+    document_type: Optional[str] = None
+    session_id: Optional[str] = None
+
+    @validator("questions")
+    def validate_questions(cls, questions):
+        cleaned = [question.strip() for question in questions]
+        if any(not question or len(question) > 2000 for question in cleaned):
+            raise ValueError("Each question must be 1-2000 characters")
+        return cleaned
+
 class SourceInfo(BaseModel):
     """Source information"""
     document_name: str
@@ -96,6 +112,7 @@ class RAGResponse(BaseModel):
     answer: str
     sources: List[SourceInfo]
     session_id: Optional[str] = None
+    cached: bool = False
 
 # ========== Mark Schemas ==========
 
@@ -0,0 +1,43 @@
+"""
+Token counting utility using a cached tiktoken encoder
+"""
+from functools import lru_cache
+
+from config import settings
+
+
+@lru_cache(maxsize=1)
+def get_encoder():
+    """
+    Load the tiktoken encoder once per process
+
+    Returns None when tiktoken or its encoding file is unavailable
+    (e.g. offline hosts); callers then fall back to a character estimate.
+    """
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding(settings.TOKENIZER_ENCODING)
+    except Exception as e:
+        print(f"tiktoken encoder unavailable ({e}); using character-based token estimate.")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Count tokens in text
+
+    Args:
+        text: Text to count
+
+    Returns:
+        Number of tokens (0 for empty text)
+    """
+    if not text:
+        return 0
+
+    encoder = get_encoder()
+    if encoder is None:
+        return max(1, len(text) // 4)
+
+    return len(encoder.encode(text, disallowed_special=()))